@@ -52,6 +52,10 @@ def course_processor_menu(course_service, menu):
             course_service.forget_course()
         elif choice == "13": # Clear All Data
             course_service.clear_all_data()
+        elif choice == "14": # Batch AI Summaries
+            course_service.generate_batch_summaries()
+        elif choice == "15": # Search Transcripts & Summaries
+            course_service.search_course_content()
         elif choice == "0":  # Back to Main Menu
             break
         else:
@@ -76,6 +80,8 @@ def settings_menu(menu, ai_service, github_service, settings_service):
             settings_service.cleanup_tools()
         elif choice == "6":  # Processing Preferences
             settings_service.processing_preferences()
+        elif choice == "7":  # API Rate Limits
+            settings_service.api_limits()
         elif choice == "0":  # Back to Main Menu
             break
         else:
@@ -1,6 +1,11 @@
 import os
 import json
 import logging
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import openai
@@ -8,8 +13,63 @@ import anthropic
 import google.generativeai as genai
 from ollama import Client as OllamaClient
 
+from services.artifact_cache import ArtifactCache
+from services.audio_service import VAD_PADDING, AudioService
+from services.response_cache import ResponseCache
+from utils.provider_router import ProviderRouter
+from utils.rate_limiter import ProviderRateLimiter, call_with_backoff, estimate_tokens
+from utils.text_utils import MarkerStripper, split_by_tokens
+
 # logger = logging.getLogger(__name__)
 
+# Limites padrão por provedor: requisições simultâneas, requisições por minuto (RPM)
+# e tokens por minuto (TPM). Zero significa sem limite.
+DEFAULT_RATE_LIMITS = {
+    'whisper': {'max_concurrent': 4, 'rpm': 50, 'tpm': 0},
+    'claude': {'max_concurrent': 4, 'rpm': 50, 'tpm': 40000},
+    'chatgpt': {'max_concurrent': 4, 'rpm': 500, 'tpm': 30000},
+    'gemini': {'max_concurrent': 2, 'rpm': 60, 'tpm': 32000},
+    'ollama': {'max_concurrent': 1, 'rpm': 0, 'tpm': 0},
+}
+
+MAX_OUTPUT_TOKENS = 4000
+# Respostas longas terminam com [CONTINUA] e seguem em novos turnos da conversa até o [FIM]
+CONTINUATION_MARKERS = ("[CONTINUA]", "[FIM]")
+MAX_CONTINUATION_TURNS = 10
+
+# Janela de contexto de cada provedor (tokens). Transcrições que não cabem são resumidas
+# em map-reduce: trechos resumidos em paralelo e depois combinados.
+CONTEXT_TOKENS = {'claude': 200000, 'chatgpt': 128000, 'gemini': 30720, 'ollama': 8192}
+MAP_OVERLAP_TOKENS = 200
+REDUCE_INSTRUCTIONS = (
+    "Os textos abaixo são resumos parciais, em ordem, de trechos consecutivos da mesma transcrição "
+    "(trechos vizinhos se sobrepõem levemente). Combine-os em um único resumo seguindo as instruções "
+    "acima, sem repetir o conteúdo das sobreposições."
+)
+
+WHISPER_MODEL = "whisper-1"
+WHISPER_MAX_BYTES = 25 * 1024 * 1024 # Limite de upload da API
+# Aulas longas são divididas em silêncios em trechos de até N minutos, transcritos em paralelo
+DEFAULT_CHUNK_MINUTES = 10
+CHUNK_ATTEMPTS = 3 # Tentativas por trecho (só os que falharam são reenviados)
+# VAD: pausas mais longas que isso (em segundos) são removidas antes do envio; 0 desativa.
+# Desligado por padrão: custa uma decodificação completa e uma recodificação por arquivo
+DEFAULT_VAD_MIN_SILENCE = 0
+WHISPER_PRICE_PER_MINUTE = 0.006 # USD, para o relatório de economia do VAD
+# Credenciais de cada provedor: o cliente só é recriado quando elas mudam. As URLs base
+# opcionais permitem apontar para proxies ou para um servidor local que emula a API.
+PROVIDER_CREDENTIALS = {
+    'claude': ("anthropic_api_key", "anthropic_base_url"),
+    'chatgpt': ("openai_api_key", "openai_base_url"),
+    'gemini': ("google_ai_key",),
+    'ollama': ("ollama_base_url",),
+}
+MODELS = {
+    'claude': "claude-3-opus-20240229", # Or another suitable Claude model
+    'chatgpt': "gpt-4o", # Or another suitable GPT model
+    'gemini': "gemini-pro",
+}
+
 class AIService:
     def __init__(self, db_service):
         self.db = db_service
@@ -21,6 +81,23 @@ class AIService:
         }
         self.current_ai = 'claude' # IA padrão
         self.api_keys = self._load_api_keys()
+        # Clientes dos provedores criados uma vez e reaproveitados (conexões keep-alive)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self.client_stats = {'built': 0, 'reused': 0, 'setup_seconds': 0.0}
+        self._setup_errors = {} # Último erro de inicialização por provedor (avisado uma vez)
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+        self.artifact_cache = ArtifactCache(db_service)
+        self.audio_service = AudioService()
+        self.response_cache = ResponseCache(db_service)
+        self.router = ProviderRouter()
+        self._usage_lock = threading.Lock()
+        self._prompts = {}
+        self._prompts_lock = threading.Lock()
+        self.prompt_cache_stats = {'requests': 0, 'input_tokens': 0, 'cached_tokens': 0}
+        self.vad_stats = {'files': 0, 'original_seconds': 0.0, 'removed_seconds': 0.0}
+        self._vad_lock = threading.Lock()
 
     def _load_api_keys(self):
         config_path = Path("config/api_keys.json")
@@ -39,26 +116,54 @@ class AIService:
         config_path.parent.mkdir(parents=True, exist_ok=True)
         with open(config_path, 'w') as f:
             json.dump(api_keys, f, indent=2)
-        self.api_keys = api_keys
+        with self._clients_lock:
+            for provider, credentials in PROVIDER_CREDENTIALS.items():
+                if any(self.api_keys.get(credential) != api_keys.get(credential) for credential in credentials):
+                    self._clients.pop(provider, None)
+            self.api_keys = api_keys
+
+    def get_client(self, provider):
+        # Retorna o cliente do provedor, criando-o só na primeira vez. Os SDKs são
+        # thread-safe e mantêm um pool de conexões, então os workers compartilham a instância.
+        with self._clients_lock:
+            if provider in self._clients:
+                self.client_stats['reused'] += 1
+                return self._clients[provider]
+            start_time = time.perf_counter()
+            client = self.apis[provider]()
+            self.client_stats['setup_seconds'] += time.perf_counter() - start_time
+            self.client_stats['built'] += 1
+            if client is not None:
+                self._clients[provider] = client
+            return client
+
+    def report_clients(self):
+        with self._clients_lock:
+            stats = dict(self.client_stats)
+        if not stats['built'] and not stats['reused']:
+            return
+        average_ms = stats['setup_seconds'] / stats['built'] * 1000 if stats['built'] else 0
+        print(f"  🔌 Clientes de IA: {stats['built']} criado(s) ({average_ms:.0f} ms cada), "
+              f"{stats['reused']} reaproveitamento(s) sem nova conexão")
 
     def _setup_claude(self):
         api_key = self.api_keys.get("anthropic_api_key")
         if not api_key:
             return None
-        return anthropic.Anthropic(api_key=api_key)
+        return anthropic.Anthropic(api_key=api_key, base_url=self.api_keys.get("anthropic_base_url") or None)
 
     def _setup_chatgpt(self):
         api_key = self.api_keys.get("openai_api_key")
         if not api_key:
             return None
-        return openai.OpenAI(api_key=api_key)
+        return openai.OpenAI(api_key=api_key, base_url=self.api_keys.get("openai_base_url") or None)
 
     def _setup_gemini(self):
         api_key = self.api_keys.get("google_ai_key")
         if not api_key:
             return None
         genai.configure(api_key=api_key)
-        return genai.GenerativeModel('gemini-pro')
+        return genai.GenerativeModel(MODELS['gemini'])
 
     def _setup_ollama(self):
         base_url = self.api_keys.get("ollama_base_url")
@@ -66,12 +171,42 @@ class AIService:
             return None
         return OllamaClient(host=base_url)
 
+    def get_rate_limits(self, provider):
+        defaults = DEFAULT_RATE_LIMITS.get(provider, {'max_concurrent': 1, 'rpm': 0, 'tpm': 0})
+        limits = {}
+        for key, default_value in defaults.items():
+            setting_key = f'{key}_{provider}' if key != 'max_concurrent' else f'max_concurrent_{provider}'
+            try:
+                limits[key] = int(self.db.get_setting(setting_key, default_value))
+            except (TypeError, ValueError):
+                limits[key] = default_value
+        limits['max_concurrent'] = max(1, limits['max_concurrent'])
+        return limits
+
+    def get_concurrency_limit(self, provider):
+        return self.get_rate_limits(provider)['max_concurrent']
+
+    def _get_limiter(self, provider):
+        limits = self.get_rate_limits(provider)
+        config = (limits['max_concurrent'], limits['rpm'], limits['tpm'])
+        with self._limiters_lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None or limiter.config != config:
+                limiter = ProviderRateLimiter(*config)
+                self._limiters[provider] = limiter
+            return limiter
+
+    def _log_retry(self, provider):
+        def on_retry(error, attempt, delay):
+            print(f"    ⏳ Rate limit em {provider} (tentativa {attempt}), aguardando {delay:.1f}s...")
+        return on_retry
+
     def validate_apis(self):
         # logger.info("Validando conectividade das APIs de IA...")
         status = {}
-        for ai_name, setup_func in self.apis.items():
+        for ai_name in self.apis:
             try:
-                client = setup_func()
+                client = self.get_client(ai_name)
                 # Lógica de teste de conexão real para cada API
                 status[ai_name] = {'status': 'ok', 'message': 'Conectado'}
             except Exception as e:
@@ -79,58 +214,163 @@ class AIService:
         # logger.info(f"Status das APIs: {status}")
         return status
 
+    def get_model_name(self, ai_service_name):
+        if ai_service_name == 'ollama':
+            return self.db.get_setting('ollama_model', 'llama3') # User configured Ollama model
+        return MODELS.get(ai_service_name)
+
+    def get_default_ai(self):
+        return self.db.get_setting('default_ai', 'claude')
+
+    def set_default_ai(self, ai_service_name):
+        self.db.save_setting('default_ai', ai_service_name)
+
     def _load_prompt(self, prompt_name):
+        # Templates ficam em memória; o arquivo só é relido quando o mtime muda
         prompt_path = Path(f"prompts/course_processor/{prompt_name}.md")
-        if not prompt_path.exists():
+        try:
+            mtime = prompt_path.stat().st_mtime_ns
+        except FileNotFoundError:
             # logger.error(f"Prompt não encontrado: {prompt_path}")
             raise FileNotFoundError(f"Prompt {prompt_name}.md não encontrado.")
+        with self._prompts_lock:
+            cached = self._prompts.get(prompt_name)
+            if cached and cached[0] == mtime:
+                return cached[1]
         with open(prompt_path, 'r', encoding='utf-8') as f:
-            return f.read()
+            content = f.read()
+        with self._prompts_lock:
+            self._prompts[prompt_name] = (mtime, content)
+        return content
 
-    def generate_summary(self, transcription, prompt_name='resumo_detalhado'):
+    def generate_summary(self, transcription, prompt_name='resumo_detalhado', bypass_cache=False, output_path=None, course_id=None):
+        # Com output_path, o resumo é gravado em <arquivo>.partial enquanto é gerado e
+        # renomeado para o destino ao final (um resumo interrompido não conta como pronto).
+        # course_id identifica o curso no registro de uso de prompts (prompt_usage).
         # logger.info(f"Gerando resumo com prompt: {prompt_name}")
         prompt_content = self._load_prompt(prompt_name)
-        full_prompt = f"{prompt_content}\n\nTranscrição:\n{transcription}"
+        # Instruções fixas como prefixo (cacheável pelo provedor), transcrição como sufixo variável
+        user_prompt = f"Transcrição:\n{transcription}"
         
         # Determine which AI to use (default to Claude)
-        client = None
-        ai_service_name = self.db.get_setting('default_ai', 'claude')
-
-        if ai_service_name == 'claude':
-            client = self._setup_claude()
-        elif ai_service_name == 'chatgpt':
-            client = self._setup_chatgpt()
-        elif ai_service_name == 'gemini':
-            client = self._setup_gemini()
-        elif ai_service_name == 'ollama':
-            client = self._setup_ollama()
-        
-        if not client:
+        ai_service_name = self.get_default_ai()
+
+        # Mesmo provedor + modelo + prompt + transcrição = mesma resposta, sem nova chamada paga
+        cache_key = self._summary_cache_key(ai_service_name, prompt_name, prompt_content, transcription)
+        partial_path = Path(f"{output_path}.partial") if output_path else None
+        if partial_path and partial_path.exists():
+            partial_path.unlink()
+        use_cache = not bypass_cache and not self.response_cache.is_bypassed()
+        if use_cache:
+            cached_summary = self.response_cache.get(cache_key)
+            if cached_summary is not None:
+                if output_path:
+                    self._write_summary(output_path, cached_summary)
+                return cached_summary
+
+        try:
+            route = self.get_route(ai_service_name)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return None
+        if not route:
             print(f"❌ {ai_service_name} API not configured or available.")
             return None
 
         try:
-            response = self.process_with_continuation(full_prompt, client, ai_service_name)
-            # self.db.log_prompt_usage(None, prompt_name, prompt_content, ai_service_name, response) # course_id will be added later
+            usage = {'input_tokens': 0, 'output_tokens': 0, 'providers': set()}
+            start_time = time.monotonic()
+            budget = self.get_input_token_budget(ai_service_name, prompt_content)
+            if estimate_tokens(transcription) <= budget:
+                response = self.process_with_continuation(user_prompt, ai_service_name, usage, partial_path, system=prompt_content)
+            else:
+                response = self._map_reduce_summary(transcription, prompt_name, prompt_content, ai_service_name, budget, usage, partial_path)
+            # Com failover a resposta pode vir de outro provedor: fica no cache com a chave dele.
+            # Resumos montados com respostas de provedores diferentes não são guardados.
+            if response and len(usage['providers']) == 1:
+                answered_by = next(iter(usage['providers']))
+                if answered_by != ai_service_name:
+                    cache_key = self._summary_cache_key(answered_by, prompt_name, prompt_content, transcription)
+                self.response_cache.put(cache_key, response, prompt_name=prompt_name,
+                                        input_tokens=usage['input_tokens'] or None, output_tokens=usage['output_tokens'] or None,
+                                        latency=time.monotonic() - start_time)
+            if response and output_path:
+                if partial_path.exists():
+                    os.replace(partial_path, output_path)
+                else:
+                    self._write_summary(output_path, response)
+            if response:
+                self.db.log_prompt_usage(course_id, prompt_name, prompt_content, ", ".join(sorted(usage['providers'])), response)
             return response
         except Exception as e:
             print(f"❌ Erro ao gerar resumo com {ai_service_name}: {e}")
             return None
 
-    def transcribe_audio(self, audio_path, service='whisper'):
+    def _write_summary(self, output_path, text):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def _summary_cache_key(self, ai_service_name, prompt_name, prompt_content, transcription):
+        return self.response_cache.make_key(
+            ai_service_name, self.get_model_name(ai_service_name), prompt_content, transcription,
+            prompt_name=prompt_name, max_tokens=MAX_OUTPUT_TOKENS
+        )
+
+    def get_route(self, ai_service_name, prompt=None):
+        # Provedores na ordem de tentativa: o preferido e, com failover ativo, os demais
+        # configurados cujo contexto comporta a requisição
+        if self.db.get_setting('ai_failover', 'true') == 'true':
+            candidates = list(self.apis)
+        else:
+            candidates = [ai_service_name]
+        route = []
+        errors = []
+        for provider in self.router.order(ai_service_name, candidates):
+            if prompt is not None and provider != ai_service_name and \
+                    estimate_tokens(prompt) + MAX_OUTPUT_TOKENS > self.get_context_tokens(provider):
+                continue
+            # Um provedor que não inicializa (SDK incompatível, credencial inválida) fica fora da
+            # rota sem derrubar os demais
+            try:
+                client = self.get_client(provider)
+            except Exception as e:
+                if self._setup_errors.get(provider) != str(e):
+                    self._setup_errors[provider] = str(e)
+                    print(f"    ⚠️ {provider} indisponível ({e}); fora da rota de failover.")
+                errors.append(f"{provider}: {e}")
+                continue
+            if client:
+                route.append(provider)
+        if not route and errors:
+            raise RuntimeError(f"Nenhum provedor de IA disponível ({'; '.join(errors)})")
+        return route
+
+    def report_providers(self):
+        self.router.report()
+
+    def transcribe_audio(self, audio_path, service='whisper', with_segments=False, duration=None):
         # logger.info(f"Transcrevendo áudio: {audio_path} usando {service}")
+        # with_segments=True retorna (texto, segmentos) com os tempos relativos ao áudio original.
+        # duration (em segundos), quando já conhecida da conversão, dispensa uma nova leitura do arquivo.
         if service == 'whisper':
-            client = self._setup_chatgpt() # OpenAI client for Whisper
+            cache_key = self.artifact_cache.make_file_key('transcription', audio_path, service=service, model=WHISPER_MODEL,
+                                                          vad_min_silence=self.get_vad_min_silence())
+            cached_transcription = self.artifact_cache.get_text(cache_key)
+            if cached_transcription is not None:
+                segments = self.artifact_cache.get_metadata(cache_key) or []
+                return (cached_transcription, segments) if with_segments else cached_transcription
+
+            client = self.get_client('chatgpt') # OpenAI client for Whisper
             if not client:
                 print("❌ OpenAI API key not configured for Whisper.")
                 return None
+
             try:
-                with open(audio_path, "rb") as audio_file:
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file
-                    )
-                return transcript.text
+                text, segments = self._transcribe_whisper(client, audio_path, duration)
+                if text:
+                    self.artifact_cache.put_text(cache_key, text)
+                    self.artifact_cache.put_metadata(cache_key, segments)
+                return (text, segments) if with_segments else text
             except Exception as e:
                 print(f"❌ Erro ao transcrever áudio com Whisper: {e}")
                 return None
@@ -138,58 +378,425 @@ class AIService:
             print(f"❌ Serviço de transcrição '{service}' não suportado.")
             return None
 
-    def process_with_continuation(self, prompt, client, ai_service_name):
-        # logger.info(f"Processando com continuação usando {ai_service_name}")
-        full_response = ""
-        current_prompt = prompt
-        
+    def get_chunk_seconds(self):
+        try:
+            minutes = float(self.db.get_setting('transcription_chunk_minutes', DEFAULT_CHUNK_MINUTES))
+        except (TypeError, ValueError):
+            minutes = DEFAULT_CHUNK_MINUTES
+        return max(1.0, minutes * 60)
+
+    def get_vad_min_silence(self):
+        try:
+            return max(0.0, float(self.db.get_setting('vad_min_silence_seconds', DEFAULT_VAD_MIN_SILENCE)))
+        except (TypeError, ValueError):
+            return DEFAULT_VAD_MIN_SILENCE
+
+    def _transcribe_whisper(self, client, audio_path, duration=None):
+        min_silence = self.get_vad_min_silence()
+        if not min_silence:
+            return self._transcribe_chunked(client, audio_path, duration)
+
+        vad_dir = Path(tempfile.mkdtemp(prefix="neuro_vad_"))
+        try:
+            vad = self.audio_service.remove_silences(audio_path, vad_dir / "speech.ogg", min_silence)
+            with self._vad_lock:
+                self.vad_stats['files'] += 1
+                self.vad_stats['original_seconds'] += vad['duration']
+                if vad['output_path']:
+                    self.vad_stats['removed_seconds'] += vad['removed']
+            # Os silêncios já detectados pelo VAD planejam os trechos, sem novo silencedetect
+            if not vad['output_path']:
+                return self._transcribe_chunked(client, audio_path, vad['duration'], vad['silences'])
+            # No áudio sem pausas, cada emenda ficou com 2 * VAD_PADDING de silêncio: bons pontos de corte
+            splices = [(output_start - VAD_PADDING, output_start + VAD_PADDING) for output_start, _, _ in vad['offset_map'][1:]]
+            speech_duration = sum(length for _, _, length in vad['offset_map'])
+            text, segments = self._transcribe_chunked(client, vad['output_path'], speech_duration, splices)
+            # Tempos dos segmentos voltam para a linha do tempo do áudio original
+            return text, self.audio_service.remap_segments(segments, vad['offset_map'])
+        finally:
+            shutil.rmtree(vad_dir, ignore_errors=True)
+
+    def reset_vad_stats(self):
+        with self._vad_lock:
+            self.vad_stats = {'files': 0, 'original_seconds': 0.0, 'removed_seconds': 0.0}
+
+    def report_vad_savings(self):
+        with self._vad_lock:
+            stats = dict(self.vad_stats)
+        if not stats['files']:
+            return
+        original_minutes = stats['original_seconds'] / 60
+        removed_minutes = stats['removed_seconds'] / 60
+        share = removed_minutes / original_minutes * 100 if original_minutes else 0
+        print(f"  🔇 VAD: {removed_minutes:.1f} de {original_minutes:.1f} min de áudio eram silêncio ({share:.0f}%), "
+              f"economia estimada de US$ {removed_minutes * WHISPER_PRICE_PER_MINUTE:.2f} no Whisper")
+
+    def _transcribe_chunked(self, client, audio_path, duration=None, silences=None):
+        # duration e silences, quando já conhecidos, evitam novas passadas do ffprobe/silencedetect
+        file_size = os.path.getsize(audio_path)
+        if not duration:
+            duration = self.audio_service.probe_media([audio_path]).get(str(audio_path), {}).get('duration') or 0
+        chunk_seconds = self.get_chunk_seconds()
+        if duration <= chunk_seconds and file_size <= WHISPER_MAX_BYTES:
+            return self._transcribe_file(client, audio_path)
+
+        # Trechos limitados por tempo e por tamanho (com margem para o cabeçalho do arquivo)
+        if silences is None:
+            duration, silences = self.audio_service.detect_silences(audio_path)
+        if duration <= 0:
+            return self._transcribe_file(client, audio_path)
+        bytes_per_second = file_size / duration
+        max_seconds = min(chunk_seconds, WHISPER_MAX_BYTES * 0.9 / bytes_per_second)
+        chunks = self.audio_service.plan_chunks(duration, silences, max_seconds)
+
+        chunk_dir = Path(tempfile.mkdtemp(prefix="neuro_chunks_"))
+        try:
+            suffix = Path(audio_path).suffix
+            chunk_paths = [
+                self.audio_service.extract_segment(audio_path, start, end, chunk_dir / f"chunk_{index:03d}{suffix}")
+                for index, (start, end) in enumerate(chunks)
+            ]
+            results = self._transcribe_chunks(client, chunk_paths)
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+        # Costura dos trechos: texto em ordem e segmentos deslocados para o tempo do original
+        texts = []
+        segments = []
+        for (start, _), (text, chunk_segments) in zip(chunks, results):
+            if text:
+                texts.append(text.strip())
+            for segment in chunk_segments:
+                segments.append(dict(segment, start=segment['start'] + start, end=segment['end'] + start))
+        return " ".join(texts), segments
+
+    def _transcribe_chunks(self, client, chunk_paths):
+        results = [None] * len(chunk_paths)
+        pending = list(range(len(chunk_paths)))
+        workers = min(self.get_concurrency_limit('whisper'), len(chunk_paths))
+        last_error = None
+        for attempt in range(CHUNK_ATTEMPTS):
+            failed = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self._transcribe_file, client, chunk_paths[index]): index for index in pending}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        failed.append(index)
+                        last_error = e
+            pending = sorted(failed)
+            if not pending:
+                return results
+            if attempt + 1 < CHUNK_ATTEMPTS:
+                print(f"    🔁 Repetindo {len(pending)} de {len(chunk_paths)} trecho(s) com falha: {last_error}")
+        raise RuntimeError(f"{len(pending)} de {len(chunk_paths)} trecho(s) falharam: {last_error}")
+
+    def _transcribe_file(self, client, audio_path):
+        def request():
+            with open(audio_path, "rb") as audio_file:
+                return client.audio.transcriptions.create(
+                    model=WHISPER_MODEL,
+                    file=audio_file,
+                    response_format="verbose_json"
+                )
+
+        transcript = call_with_backoff(request, limiter=self._get_limiter('whisper'), on_retry=self._log_retry('whisper'))
+        segments = [
+            {'start': float(self._field(segment, 'start')), 'end': float(self._field(segment, 'end')),
+             'text': self._field(segment, 'text')}
+            for segment in (getattr(transcript, 'segments', None) or [])
+        ]
+        return transcript.text, segments
+
+    def _field(self, item, name):
+        return item[name] if isinstance(item, dict) else getattr(item, name)
+
+    def _add_usage(self, usage, input_tokens, output_tokens, cached_tokens=0):
+        with self._usage_lock:
+            self.prompt_cache_stats['requests'] += 1
+            self.prompt_cache_stats['input_tokens'] += input_tokens or 0
+            self.prompt_cache_stats['cached_tokens'] += cached_tokens or 0
+            if usage is None:
+                return
+            usage['input_tokens'] += input_tokens or 0
+            usage['output_tokens'] += output_tokens or 0
+
+    def reset_prompt_cache_stats(self):
+        with self._usage_lock:
+            self.prompt_cache_stats = {'requests': 0, 'input_tokens': 0, 'cached_tokens': 0}
+
+    def report_prompt_cache(self):
+        with self._usage_lock:
+            stats = dict(self.prompt_cache_stats)
+        if not stats['input_tokens']:
+            return
+        ratio = stats['cached_tokens'] / stats['input_tokens'] * 100
+        print(f"  🧠 Cache de prompt: {stats['cached_tokens']} de {stats['input_tokens']} tokens de entrada lidos do cache "
+              f"({ratio:.0f}%) em {stats['requests']} requisição(ões)")
+
+    def _request_completion(self, client, ai_service_name, messages, usage=None, max_retries=5, on_text=None, on_restart=None):
+        # Resposta em streaming: on_text recebe cada trecho assim que chega. messages é a
+        # conversa ({'role', 'content'}) ou um prompt simples; uma mensagem 'system' inicial
+        # é o prefixo fixo que os provedores podem manter em cache entre as aulas.
+        # Se um rate limit interromper o streaming e a requisição for repetida, on_restart é
+        # chamado antes da nova tentativa para descartar o texto já entregue a on_text.
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        system = messages[0]['content'] if messages[0]['role'] == 'system' else None
+        conversation = messages[1:] if system else messages
+        limiter = self._get_limiter(ai_service_name)
+        estimated_tokens = sum(estimate_tokens(message['content']) for message in messages) + MAX_OUTPUT_TOKENS
+
+        emitted = [False]
+
+        def request():
+            parts = []
+            if emitted[0] and on_restart:
+                on_restart()
+            emitted[0] = False
+
+            def emit(text):
+                if text:
+                    parts.append(text)
+                    emitted[0] = True
+                    if on_text:
+                        on_text(text)
+
+            if ai_service_name == 'claude':
+                cache_args = {}
+                if system:
+                    cache_args['system'] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+                with client.messages.stream(
+                    model=MODELS['claude'],
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    messages=conversation,
+                    **cache_args
+                ) as stream:
+                    limiter.update_from_headers(getattr(getattr(stream, 'response', None), 'headers', None))
+                    for text in stream.text_stream:
+                        emit(text)
+                    response = stream.get_final_message()
+                # input_tokens da Anthropic não inclui os tokens lidos/gravados no cache de prompt
+                cache_read = getattr(response.usage, 'cache_read_input_tokens', None) or 0
+                cache_write = getattr(response.usage, 'cache_creation_input_tokens', None) or 0
+                input_tokens = response.usage.input_tokens + cache_read + cache_write
+                limiter.record_usage(input_tokens + response.usage.output_tokens, estimated_tokens)
+                self._add_usage(usage, input_tokens, response.usage.output_tokens, cache_read)
+            elif ai_service_name == 'chatgpt':
+                raw_response = client.chat.completions.with_raw_response.create(
+                    model=MODELS['chatgpt'],
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                limiter.update_from_headers(raw_response.headers)
+                for chunk in raw_response.parse():
+                    if chunk.choices:
+                        emit(chunk.choices[0].delta.content)
+                    if chunk.usage:
+                        # Prefixos repetidos (>= 1024 tokens) entram no cache automático da OpenAI
+                        details = getattr(chunk.usage, 'prompt_tokens_details', None)
+                        limiter.record_usage(chunk.usage.total_tokens, estimated_tokens)
+                        self._add_usage(usage, chunk.usage.prompt_tokens, chunk.usage.completion_tokens,
+                                        getattr(details, 'cached_tokens', 0) if details else 0)
+            elif ai_service_name == 'gemini':
+                contents = [
+                    {'role': 'model' if message['role'] == 'assistant' else 'user', 'parts': [message['content']]}
+                    for message in conversation
+                ]
+                if system:
+                    # Sem papel de sistema neste cliente: o prefixo fixo vai como primeira parte
+                    contents[0]['parts'].insert(0, system)
+                response = client.generate_content(contents, stream=True)
+                for chunk in response:
+                    emit(chunk.text)
+                usage_metadata = getattr(response, 'usage_metadata', None)
+                if usage_metadata:
+                    self._add_usage(usage, getattr(usage_metadata, 'prompt_token_count', 0), getattr(usage_metadata, 'candidates_token_count', 0),
+                                    getattr(usage_metadata, 'cached_content_token_count', 0))
+            elif ai_service_name == 'ollama':
+                for chunk in client.chat(
+                    model=self.get_model_name('ollama'),
+                    messages=messages,
+                    stream=True
+                ):
+                    emit(chunk['message']['content'])
+                    if chunk.get('done'):
+                        self._add_usage(usage, chunk.get('prompt_eval_count'), chunk.get('eval_count'))
+            return "".join(parts)
+
+        return call_with_backoff(request, limiter=limiter, tokens=estimated_tokens, max_retries=max_retries,
+                                 on_retry=self._log_retry(ai_service_name))
+
+    def get_context_tokens(self, ai_service_name):
+        try:
+            return int(self.db.get_setting(f'context_tokens_{ai_service_name}', CONTEXT_TOKENS.get(ai_service_name, 8192)))
+        except (TypeError, ValueError):
+            return CONTEXT_TOKENS.get(ai_service_name, 8192)
+
+    def get_input_token_budget(self, ai_service_name, prompt_content):
+        # Tokens de transcrição que cabem numa requisição: contexto menos prompt e resposta,
+        # limitado também pelo TPM (uma requisição maior que o TPM nunca seria aceita)
+        context = self.get_context_tokens(ai_service_name)
+        budget = context - MAX_OUTPUT_TOKENS - estimate_tokens(prompt_content) - MAP_OVERLAP_TOKENS
+        tpm = self.get_rate_limits(ai_service_name)['tpm']
+        if tpm:
+            budget = min(budget, tpm - MAX_OUTPUT_TOKENS - estimate_tokens(prompt_content))
+        return max(1000, budget)
+
+    def _map_reduce_summary(self, transcription, prompt_name, prompt_content, ai_service_name, budget, usage=None, output_path=None):
+        # Só a combinação final é gravada em output_path durante o streaming
+        chunks = split_by_tokens(transcription, budget, MAP_OVERLAP_TOKENS)
+        print(f"    🧩 Transcrição maior que o contexto: resumindo {len(chunks)} trecho(s) em paralelo...")
+        map_prompts = [
+            f"Trecho {index} de {len(chunks)} da transcrição:\n{chunk}"
+            for index, chunk in enumerate(chunks, start=1)
+        ]
+        partials = self._complete_many(map_prompts, ai_service_name, usage, system=prompt_content)
+        if partials is None:
+            return None
+
+        try:
+            reduce_content = self._load_prompt(f"{prompt_name}_reduce")
+        except FileNotFoundError:
+            reduce_content = f"{prompt_content}\n\n{REDUCE_INSTRUCTIONS}"
+        # Resumos parciais que ainda não cabem numa requisição são combinados em níveis
         while True:
-            response_part = ""
-            try:
-                if ai_service_name == 'claude':
-                    response = client.messages.create(
-                        model="claude-3-opus-20240229", # Or another suitable Claude model
-                        max_tokens=4000,
-                        messages=[
-                            {"role": "user", "content": current_prompt}
-                        ]
-                    )
-                    response_part = response.content[0].text if response.content else ""
-                elif ai_service_name == 'chatgpt':
-                    response = client.chat.completions.create(
-                        model="gpt-4o", # Or another suitable GPT model
-                        messages=[
-                            {"role": "user", "content": current_prompt}
-                        ]
-                    )
-                    response_part = response.choices[0].message.content
-                elif ai_service_name == 'gemini':
-                    response = client.generate_content(current_prompt)
-                    response_part = response.text
-                elif ai_service_name == 'ollama':
-                    response = client.chat(
-                        model=self.db.get_setting('ollama_model', 'llama3'), # User configured Ollama model
-                        messages=[
-                            {'role': 'user', 'content': current_prompt}
-                        ]
-                    )
-                    response_part = response['message']['content']
-                else:
-                    print(f"❌ Serviço de IA '{ai_service_name}' não suportado para continuação.")
-                    break
+            reduce_budget = self.get_input_token_budget(ai_service_name, reduce_content)
+            groups = self._group_by_tokens(partials, reduce_budget)
+            reduce_prompts = [
+                "Resumos parciais:\n" + "\n\n".join(
+                    f"### Parte {index}\n{partial}" for index, partial in enumerate(group, start=1))
+                for group in groups
+            ]
+            if len(reduce_prompts) == 1:
+                return self.process_with_continuation(reduce_prompts[0], ai_service_name, usage, output_path, system=reduce_content)
+            if len(groups) >= len(partials):
+                # Nenhum par de resumos parciais cabe numa requisição: entregar as partes em ordem
+                print("    ⚠️ Resumos parciais grandes demais para combinar; mantendo as partes em sequência.")
+                return "\n\n".join(partials)
+            partials = self._complete_many(reduce_prompts, ai_service_name, usage, system=reduce_content)
+            if partials is None:
+                return None
 
-            except Exception as e:
-                print(f"❌ Erro na chamada da API {ai_service_name}: {e}")
-                break
-
-            full_response += response_part.replace("[CONTINUA]", "").replace("[FIM]", "")
-            
-            if "[FIM]" in response_part:
-                break
-            elif "[CONTINUA]" in response_part:
-                current_prompt = "[CONTINUAR]"
-            else:
-                # If no markers, assume it's finished
-                break
+    def _group_by_tokens(self, texts, budget):
+        groups = []
+        current = []
+        current_tokens = 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if current and current_tokens + tokens > budget:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _complete_many(self, prompts, ai_service_name, usage=None, system=None):
+        # Requisições independentes em paralelo; o limiter do provedor controla a concorrência
+        workers = min(self.get_concurrency_limit(ai_service_name), len(prompts))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda prompt: self.process_with_continuation(prompt, ai_service_name, usage, system=system), prompts))
+        if not all(results):
+            print(f"❌ {sum(1 for result in results if not result)} de {len(prompts)} trecho(s) sem resposta de {ai_service_name}.")
+            return None
+        return results
+
+    def process_with_continuation(self, prompt, ai_service_name, usage=None, output_path=None, system=None):
+        # logger.info(f"Processando com continuação usando {ai_service_name}")
+        # A sequência inteira (pedido + continuações) roda no provedor escolhido pelo roteador.
+        # Com output_path, o texto é gravado no arquivo à medida que chega.
+        if ai_service_name not in self.apis:
+            print(f"❌ Serviço de IA '{ai_service_name}' não suportado para continuação.")
+            return ""
+
+        def on_failover(provider, next_provider, error):
+            print(f"    🔀 {provider} falhou ({error}); tentando {next_provider}...")
+
+        # Com hedge, duas respostas correm ao mesmo tempo: cada uma fica em memória e só a
+        # vencedora é gravada em output_path (sem gravação incremental nesse modo)
+        hedge = self.db.get_setting('ai_hedging', 'false') == 'true'
+        stream_path = None if hedge else output_path
+        # Tokens contados por tentativa; só os da resposta usada entram em usage
+        attempts = {}
+        try:
+            provider, full_response = self.router.call(
+                self.get_route(ai_service_name, f"{system}\n\n{prompt}" if system else prompt),
+                lambda provider, is_last: self._continue_with(
+                    provider, prompt, attempts.setdefault(provider, {'input_tokens': 0, 'output_tokens': 0}),
+                    is_last, stream_path, system),
+                hedge=hedge, on_failover=on_failover
+            )
+        except Exception as e:
+            print(f"❌ Erro na chamada da API {ai_service_name}: {e}")
+            return ""
+        if hedge and output_path:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(full_response)
+        if usage is not None:
+            with self._usage_lock:
+                usage['input_tokens'] += attempts[provider]['input_tokens']
+                usage['output_tokens'] += attempts[provider]['output_tokens']
+                usage.setdefault('providers', set()).add(provider)
         # logger.info("Processamento com continuação concluído.")
         return full_response
+
+    def _continue_with(self, ai_service_name, prompt, usage, is_last, output_path=None, system=None):
+        # Erro no primeiro pedido sobe para o roteador (failover); em rate limit, só o último
+        # provedor da rota espera com backoff, os anteriores passam a vez imediatamente.
+        # Cada continuação leva o histórico da conversa, para o modelo seguir de onde parou.
+        client = self.get_client(ai_service_name)
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        parts = []
+        output_file = open(output_path, 'w', encoding='utf-8') if output_path else None
+        try:
+            for turn in range(MAX_CONTINUATION_TURNS):
+                turn_start = len(parts)
+                turn_offset = output_file.tell() if output_file else 0
+                markers = MarkerStripper(CONTINUATION_MARKERS)
+
+                def on_text(text):
+                    clean_text = markers.feed(text)
+                    if clean_text:
+                        parts.append(clean_text)
+                        if output_file:
+                            output_file.write(clean_text)
+                            output_file.flush()
+
+                def on_restart():
+                    # Nova tentativa do mesmo turno: o texto parcial da anterior não pode se repetir
+                    nonlocal markers
+                    markers = MarkerStripper(CONTINUATION_MARKERS)
+                    del parts[turn_start:]
+                    if output_file:
+                        output_file.seek(turn_offset)
+                        output_file.truncate()
+
+                try:
+                    response_text = self._request_completion(client, ai_service_name, messages, usage,
+                                                             max_retries=5 if is_last or turn else 0,
+                                                             on_text=on_text, on_restart=on_restart)
+                except Exception as e:
+                    if not turn:
+                        raise
+                    print(f"❌ Erro na chamada da API {ai_service_name}: {e}")
+                    break
+                tail = markers.flush()
+                if tail:
+                    parts.append(tail)
+                    if output_file:
+                        output_file.write(tail)
+
+                if "[FIM]" in markers.found or "[CONTINUA]" not in markers.found:
+                    break
+                messages += [{"role": "assistant", "content": response_text}, {"role": "user", "content": "[CONTINUAR]"}]
+        finally:
+            if output_file:
+                output_file.close()
+        return "".join(parts)
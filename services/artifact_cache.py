@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from utils.file_utils import file_sha256, text_sha256
+
+DEFAULT_MAX_SIZE_MB = 20480
+
+
+# Armazena áudios e transcrições pelo hash do conteúdo de origem e dos
+# parâmetros da etapa, para que cursos renomeados, reimportados ou com aulas em
+# comum reaproveitem artefatos já gerados. A evicção é LRU por tamanho total,
+# usando o mtime do arquivo como último acesso.
+class ArtifactCache:
+    def __init__(self, db_service, root="data/cache"):
+        self.db = db_service
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._total_size = None
+        self.stats = {}
+
+    def make_file_key(self, stage, source_path, **params):
+        return self._make_key(stage, file_sha256(source_path), params)
+
+    def make_text_key(self, stage, text, **params):
+        return self._make_key(stage, text_sha256(text), params)
+
+    def _make_key(self, stage, content_hash, params):
+        payload = json.dumps({'stage': stage, 'source': content_hash, 'params': params}, sort_keys=True)
+        return f"{stage}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def _blob_path(self, key, suffix=""):
+        stage, digest = key.split("-", 1)
+        return self.root / stage / digest[:2] / f"{digest}{suffix}"
+
+    def get_file(self, key, dest_path, suffix=""):
+        blob_path = self._blob_path(key, suffix)
+        if not blob_path.exists():
+            self._record(key, hit=False)
+            return False
+
+        dest_path = Path(dest_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        if dest_path.exists():
+            dest_path.unlink()
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            shutil.copy2(blob_path, dest_path)
+        self._touch(blob_path)
+        self._record(key, hit=True)
+        return True
+
+    def put_file(self, key, source_path, suffix=""):
+        blob_path = self._blob_path(key, suffix)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = blob_path.with_name(f"{blob_path.name}.{threading.get_ident()}.tmp")
+        if temp_path.exists():
+            temp_path.unlink()
+        # Hard link: o artefato não ocupa espaço nem custa I/O extra. Quem regrava o arquivo de
+        # origem remove o destino antes (ver CourseService._run_conversion), sem alterar o cache.
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copy2(source_path, temp_path) # Outro sistema de arquivos ou sem suporte a links
+        self._store(temp_path, blob_path)
+
+    def get_text(self, key):
+        blob_path = self._blob_path(key, ".txt")
+        try:
+            with open(blob_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            self._record(key, hit=False)
+            return None
+        self._touch(blob_path)
+        self._record(key, hit=True)
+        return text
+
+    def put_text(self, key, text):
+        blob_path = self._blob_path(key, ".txt")
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = blob_path.with_name(f"{blob_path.name}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self._store(temp_path, blob_path)
+
+    def get_metadata(self, key):
+        # Metadados guardados junto do artefato (ex.: duração do áudio), sem contar como hit/miss
+        try:
+            with open(self._blob_path(key, ".meta.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_metadata(self, key, metadata):
+        blob_path = self._blob_path(key, ".meta.json")
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = blob_path.with_name(f"{blob_path.name}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        self._store(temp_path, blob_path)
+
+    def _store(self, temp_path, blob_path):
+        size = temp_path.stat().st_size
+        previous_size = blob_path.stat().st_size if blob_path.exists() else 0
+        os.replace(temp_path, blob_path)
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size += size - previous_size
+        self.evict()
+
+    def _touch(self, blob_path):
+        try:
+            os.utime(blob_path)
+        except OSError:
+            pass
+
+    def _record(self, key, hit):
+        stage = key.split("-", 1)[0]
+        with self._lock:
+            stage_stats = self.stats.setdefault(stage, {'hits': 0, 'misses': 0})
+            stage_stats['hits' if hit else 'misses'] += 1
+
+    def _blobs(self):
+        if not self.root.exists():
+            return []
+        return [path for path in self.root.rglob("*") if path.is_file() and not path.name.endswith(".tmp")]
+
+    def get_max_size(self):
+        try:
+            max_size_mb = int(self.db.get_setting('artifact_cache_max_mb', DEFAULT_MAX_SIZE_MB))
+        except (TypeError, ValueError):
+            max_size_mb = DEFAULT_MAX_SIZE_MB
+        return max_size_mb * 1024 * 1024
+
+    def evict(self):
+        max_size = self.get_max_size()
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(path.stat().st_size for path in self._blobs())
+            if self._total_size <= max_size:
+                return
+
+            # Remove os artefatos acessados há mais tempo até voltar ao limite
+            blobs = sorted(self._blobs(), key=lambda path: path.stat().st_mtime)
+            for blob_path in blobs:
+                if self._total_size <= max_size:
+                    break
+                size = blob_path.stat().st_size
+                blob_path.unlink()
+                self._total_size -= size
+                evicted = self.stats.setdefault('evicted', {'files': 0, 'bytes': 0})
+                evicted['files'] += 1
+                evicted['bytes'] += size
+
+    def clear(self):
+        with self._lock:
+            if self.root.exists():
+                shutil.rmtree(self.root)
+            self._total_size = 0
+
+    def report(self):
+        with self._lock:
+            stats = {stage: dict(values) for stage, values in self.stats.items()}
+        labels = {'audio': "Áudio", 'speech': "Fala", 'transcription': "Transcrição"}
+        lines = []
+        for stage, values in stats.items():
+            if stage == 'evicted':
+                continue
+            total = values['hits'] + values['misses']
+            hit_rate = values['hits'] / total * 100 if total else 0
+            lines.append(f"    {labels.get(stage, stage)}: {values['hits']} hit(s), {values['misses']} miss(es) ({hit_rate:.0f}% reaproveitado)")
+        if not lines:
+            return
+        print("  📦 Cache de artefatos:")
+        for line in lines:
+            print(line)
+        if 'evicted' in stats:
+            print(f"    Evictados: {stats['evicted']['files']} arquivo(s), {stats['evicted']['bytes'] / (1024 * 1024):.1f} MB")
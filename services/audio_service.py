@@ -0,0 +1,419 @@
+import bisect
+import json
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.mp3_utils import build_chapter_tag, scan_mp3
+
+# Faz o ffmpeg escrever o progresso em key=value no stdout, de onde tiramos a duração
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+# ffprobe simultâneos ao ler os cabeçalhos das origens (cada processo só lê o início do arquivo)
+PROBE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Derivado para reconhecimento de fala: 16 kHz mono em Opus de baixo bitrate
+SPEECH_SETTINGS = {'sample_rate': "16000", 'channels': "1", 'bitrate': "24k", 'codec': "libopus", 'format': "ogg"}
+
+# Codecs de origem que já servem para podcast e podem ser extraídos sem recodificar
+STREAM_COPY_FORMATS = {'aac': ".m4a", 'mp3': ".mp3"}
+STREAM_COPY_BITRATE_RANGE = (64, 192) # kb/s
+STREAM_COPY_SAMPLE_RATES = (44100, 48000)
+
+_CHANNEL_LAYOUTS = {'mono': 1, 'stereo': 2, '2.1': 3, 'quad': 4, '4.0': 4, '5.0': 5, '5.1': 6, '6.1': 7, '7.1': 8}
+_AUDIO_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+)[^,\n]*, (\d+) Hz, ([^,\n]+)(?:, [^,\n]+)?(?:, (\d+) kb/s)?")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)(?:, start: [^,]+)?(?:, bitrate: (\d+) kb/s)?")
+_TIME_RE = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+_COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Parâmetros do silencedetect usados para escolher os pontos de corte
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_DURATION = 0.5
+# Margem de silêncio mantida em cada borda de um trecho removido pelo VAD
+VAD_PADDING = 0.25
+# Fração mínima de silêncio removido para o VAD gerar o derivado de fala (abaixo, usa o original)
+VAD_MIN_REMOVED_SHARE = 0.05
+_SILENCE_START_RE = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END_RE = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+class AudioService:
+    def speech_args(self):
+        return [
+            "-map", "0:a:0",
+            "-vn",
+            "-ar", SPEECH_SETTINGS['sample_rate'],
+            "-ac", SPEECH_SETTINGS['channels'],
+            "-c:a", SPEECH_SETTINGS['codec'],
+            "-b:a", SPEECH_SETTINGS['bitrate'],
+            "-application", "voip", # Opus ajustado para voz
+        ]
+
+    def parse_media_info(self, stderr_text, progress_text=""):
+        # Metadados do arquivo gerado, extraídos da própria execução do ffmpeg
+        info = {'duration': 0.0, 'bitrate': None, 'codec': None, 'channels': None, 'sample_rate': None}
+
+        out_times = re.findall(r"^out_time_us=(\d+)$", progress_text, re.MULTILINE)
+        if out_times:
+            info['duration'] = int(out_times[-1]) / 1_000_000
+        else:
+            times = _TIME_RE.findall(stderr_text)
+            if times:
+                info['duration'] = self._to_seconds(*times[-1])
+
+        output_section = stderr_text.split("Output #0", 1)[1] if "Output #0" in stderr_text else stderr_text
+        stream = _AUDIO_STREAM_RE.search(output_section)
+        if stream:
+            info.update(self._stream_info(stream))
+
+        if info['bitrate'] is None:
+            bitrates = re.findall(r"^bitrate=\s*([\d.]+)kbits/s$", progress_text, re.MULTILINE)
+            if bitrates:
+                info['bitrate'] = int(float(bitrates[-1]))
+        return info
+
+    def probe_media(self, paths):
+        # Cabeçalhos lidos pelo ffprobe em JSON, um processo por arquivo em paralelo: um arquivo
+        # corrompido ou sem suporte fica fora do resultado sem afetar os demais
+        paths = [str(path) for path in paths]
+        if not paths:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(paths))) as executor:
+            infos = list(executor.map(self._probe_file, paths))
+        return {path: info for path, info in zip(paths, infos) if info is not None}
+
+    def _probe_file(self, path):
+        command = ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+        if process.returncode != 0:
+            return None
+        try:
+            probe = json.loads(process.stdout.decode(errors='replace'))
+        except ValueError:
+            return None
+
+        media_format = probe.get('format') or {}
+        streams = probe.get('streams') or []
+        info = {'duration': self._to_number(media_format.get('duration'), float) or 0.0, 'bitrate': None,
+                'codec': None, 'channels': None, 'sample_rate': None}
+        audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+        if audio:
+            bitrate = self._to_number(audio.get('bit_rate'), int)
+            # Em vídeos o bitrate do container inclui a imagem: só vale para arquivos de áudio
+            if bitrate is None and not any(stream.get('codec_type') == 'video' for stream in streams):
+                bitrate = self._to_number(media_format.get('bit_rate'), int)
+            info.update({
+                'codec': audio.get('codec_name'),
+                'sample_rate': self._to_number(audio.get('sample_rate'), int),
+                'channels': audio.get('channels'),
+                'bitrate': round(bitrate / 1000) if bitrate else None, # kb/s, como no restante do código
+            })
+        if os.path.exists(path):
+            info['file_size'] = os.path.getsize(path)
+        return info
+
+    def _to_number(self, value, kind):
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            return None
+
+    def stream_copy_suffix(self, source_info):
+        # Extensão de saída para cópia direta do áudio, ou None quando é preciso recodificar
+        if not source_info or source_info.get('codec') not in STREAM_COPY_FORMATS:
+            return None
+        bitrate = source_info.get('bitrate')
+        if not bitrate or not STREAM_COPY_BITRATE_RANGE[0] <= bitrate <= STREAM_COPY_BITRATE_RANGE[1]:
+            return None
+        if source_info.get('sample_rate') not in STREAM_COPY_SAMPLE_RATES or (source_info.get('channels') or 0) not in (1, 2):
+            return None
+        return STREAM_COPY_FORMATS[source_info['codec']]
+
+    def detect_silences(self, audio_path, noise_db=SILENCE_NOISE_DB, min_duration=SILENCE_MIN_DURATION):
+        # Retorna a duração do arquivo e a lista de silêncios (início, fim) em segundos
+        command = [
+            "ffmpeg", "-hide_banner", "-nostats",
+            "-i", str(audio_path),
+            "-af", f"silencedetect=noise={noise_db}dB:duration={min_duration}",
+            "-f", "null", "-"
+        ]
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"silencedetect falhou para {audio_path}: {process.stderr.decode(errors='replace')[-500:]}")
+        stderr_text = process.stderr.decode(errors='replace')
+
+        duration_match = _DURATION_RE.search(stderr_text)
+        duration = self._to_seconds(*duration_match.group(1, 2, 3)) if duration_match else 0.0
+        starts = [max(0.0, float(value)) for value in _SILENCE_START_RE.findall(stderr_text)]
+        ends = [float(value) for value in _SILENCE_END_RE.findall(stderr_text)]
+        # Silêncio até o fim do arquivo não tem silence_end
+        ends += [duration] * (len(starts) - len(ends))
+        return duration, list(zip(starts, ends))
+
+    def plan_chunks(self, duration, silences, max_seconds):
+        # Divide [0, duration] em trechos de até max_seconds, cortando no meio do último
+        # silêncio da segunda metade de cada janela (corte seco quando não há silêncio)
+        chunks = []
+        start = 0.0
+        while duration - start > max_seconds:
+            limit = start + max_seconds
+            cuts = [(silence_start + silence_end) / 2 for silence_start, silence_end in silences
+                    if start + max_seconds / 2 < (silence_start + silence_end) / 2 <= limit]
+            cut = cuts[-1] if cuts else limit
+            chunks.append((start, cut))
+            start = cut
+        chunks.append((start, duration))
+        return chunks
+
+    def remove_silences(self, audio_path, output_path, min_silence, padding=VAD_PADDING):
+        # VAD por silencedetect: remove pausas maiores que min_silence (mantendo uma margem nas
+        # bordas) e gera um derivado de fala só com os trechos falados. O mapa de offsets
+        # [início na saída, início no original, duração] leva tempos da saída ao original.
+        # 'silences' (linha do tempo original) fica no resultado para o planejamento dos trechos.
+        duration, silences = self.detect_silences(audio_path, min_duration=min_silence)
+        keep = []
+        position = 0.0
+        for silence_start, silence_end in silences:
+            cut_start, cut_end = silence_start + padding, silence_end - padding
+            if cut_end - cut_start <= 0:
+                continue
+            if cut_start > position:
+                keep.append((position, cut_start))
+            position = max(position, cut_end)
+        if duration > position:
+            keep.append((position, duration))
+
+        offset_map = []
+        output_time = 0.0
+        for start, end in keep:
+            offset_map.append([output_time, start, end - start])
+            output_time += end - start
+        result = {'duration': duration, 'removed': max(0.0, duration - output_time), 'offset_map': offset_map,
+                  'silences': silences, 'output_path': None}
+        # Recodificar só compensa se o silêncio removido for uma parte relevante do áudio
+        if result['removed'] < max(min_silence, duration * VAD_MIN_REMOVED_SHARE) or not keep:
+            return result
+
+        # Expressão do aselect em arquivo: cursos longos geram centenas de trechos
+        output_path = Path(output_path)
+        filter_path = output_path.with_suffix(".filter")
+        expression = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in keep)
+        with open(filter_path, 'w', encoding='utf-8') as f:
+            f.write(f"aselect='{expression}',asetpts=N/SR/TB")
+        command = [
+            "ffmpeg", "-hide_banner",
+            "-i", str(audio_path),
+            "-filter_script:a", str(filter_path),
+            *self.speech_args(),
+            "-y", str(output_path)
+        ]
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+        filter_path.unlink()
+        if process.returncode != 0:
+            raise RuntimeError(f"Falha ao remover silêncios de {audio_path}: {process.stderr.decode(errors='replace')[-500:]}")
+        result['output_path'] = str(output_path)
+        return result
+
+    def map_time(self, offset_map, output_time, is_end=False):
+        # Converte um tempo do áudio sem silêncios para o tempo no áudio original
+        if not offset_map:
+            return output_time
+        starts = [entry[0] for entry in offset_map]
+        # Fim de segmento exatamente na emenda pertence ao trecho anterior
+        index = (bisect.bisect_left(starts, output_time) if is_end else bisect.bisect_right(starts, output_time)) - 1
+        output_start, original_start, length = offset_map[max(0, index)]
+        return original_start + min(max(0.0, output_time - output_start), length)
+
+    def remap_segments(self, segments, offset_map):
+        return [
+            dict(segment, start=self.map_time(offset_map, segment['start']), end=self.map_time(offset_map, segment['end'], is_end=True))
+            for segment in segments
+        ]
+
+    def extract_segment(self, audio_path, start, end, output_path):
+        # Cópia sem recodificar do trecho [start, end), com seek rápido antes do -i
+        command = [
+            "ffmpeg", "-hide_banner",
+            "-ss", f"{start:.3f}",
+            "-i", str(audio_path),
+            "-t", f"{end - start:.3f}",
+            "-vn", "-c", "copy",
+            "-y", str(output_path)
+        ]
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"Falha ao extrair trecho {start:.1f}-{end:.1f}s de {audio_path}: "
+                               f"{process.stderr.decode(errors='replace')[-500:]}")
+        return output_path
+
+    def _stream_info(self, match):
+        codec, sample_rate, layout, bitrate = match.groups()
+        layout = layout.strip()
+        channels = _CHANNEL_LAYOUTS.get(layout.split('(')[0])
+        if channels is None:
+            channel_count = re.match(r"(\d+) channels", layout)
+            channels = int(channel_count.group(1)) if channel_count else None
+        return {
+            'codec': codec,
+            'sample_rate': int(sample_rate),
+            'channels': channels,
+            'bitrate': int(bitrate) if bitrate else None,
+        }
+
+    def _to_seconds(self, hours, minutes, seconds):
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def build_unified_audio(self, output_path, title, episodes, audio_settings):
+        # Junta os frames MP3 dos episódios num único arquivo, com capítulos ID3 (CHAP/CTOC)
+        # calculados pelas amostras realmente copiadas. Quando o arquivo existente já contém
+        # os primeiros episódios, só os novos são anexados e a tag é reescrita no lugar.
+        # episodes: lista de dicts com 'id', 'title' e 'audio_path'. Retorna os capítulos.
+        output_path = Path(output_path)
+        target_format = (int(audio_settings['sample_rate']), int(audio_settings['channels']))
+        sidecar = self.load_chapters(output_path)
+
+        entries = []
+        for episode in episodes:
+            stat = os.stat(episode['audio_path'])
+            entries.append({'episode_id': episode['id'], 'title': episode['title'], 'path': str(episode['audio_path']),
+                            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+        existing = self._appendable_chapters(output_path, sidecar, entries, target_format)
+        if existing is not None and len(existing) == len(entries):
+            print(f"    ⏭️ Áudio unificado já contém os {len(entries)} episódio(s).")
+            return existing
+
+        work_dir = output_path.parent / ".normalized"
+        try:
+            start = len(existing) if existing is not None else 0
+            new_sources = self._prepare_sources(entries[start:], target_format, audio_settings, work_dir)
+            if new_sources is None:
+                return None
+
+            if existing is not None:
+                chapters = existing + self._make_chapters(new_sources, existing[-1]['end_samples'] if existing else 0, target_format[0])
+                tag = build_chapter_tag(title, chapters, total_size=sidecar['tag_size'])
+                if tag is not None:
+                    print(f"    ➕ Anexando {len(new_sources)} episódio(s) ao áudio unificado existente...")
+                    with open(output_path, 'r+b') as out:
+                        out.seek(0, os.SEEK_END)
+                        self._copy_frames(new_sources, out)
+                        # A tag só é atualizada depois do áudio anexado
+                        out.seek(0)
+                        out.write(tag)
+                    self._save_chapters(output_path, chapters, len(tag), target_format)
+                    return chapters
+                # Sem padding suficiente para os novos capítulos: reescrever o arquivo inteiro
+
+            previous_sources = self._prepare_sources(entries[:start], target_format, audio_settings, work_dir)
+            if previous_sources is None:
+                return None
+            sources = previous_sources + new_sources
+            chapters = self._make_chapters(sources, 0, target_format[0])
+            tag = build_chapter_tag(title, chapters)
+            temp_path = output_path.with_name(f"{output_path.name}.tmp")
+            with open(temp_path, 'wb') as out:
+                out.write(tag)
+                self._copy_frames(sources, out)
+            os.replace(temp_path, output_path)
+            self._save_chapters(output_path, chapters, len(tag), target_format)
+            return chapters
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def load_chapters(self, output_path):
+        try:
+            with open(self._chapters_path(output_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _chapters_path(self, output_path):
+        output_path = Path(output_path)
+        return output_path.with_name(f"{output_path.stem}.chapters.json")
+
+    def _save_chapters(self, output_path, chapters, tag_size, target_format):
+        sidecar = {
+            'file_size': os.path.getsize(output_path),
+            'tag_size': tag_size,
+            'sample_rate': target_format[0],
+            'channels': target_format[1],
+            'chapters': chapters,
+        }
+        chapters_path = self._chapters_path(output_path)
+        temp_path = chapters_path.with_name(f"{chapters_path.name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(sidecar, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, chapters_path)
+
+    def _appendable_chapters(self, output_path, sidecar, entries, target_format):
+        # Capítulos do arquivo atual que continuam válidos como prefixo da nova lista de episódios
+        if not sidecar or not output_path.exists() or os.path.getsize(output_path) != sidecar['file_size']:
+            return None
+        if (sidecar['sample_rate'], sidecar['channels']) != target_format:
+            return None
+        chapters = sidecar['chapters']
+        if len(chapters) > len(entries):
+            return None
+        for chapter, entry in zip(chapters, entries):
+            if any(chapter[key] != entry[key] for key in ('episode_id', 'path', 'size', 'mtime_ns')):
+                return None
+        # Títulos podem ter mudado: só a tag é afetada
+        return [dict(chapter, title=entry['title']) for chapter, entry in zip(chapters, entries)]
+
+    def _prepare_sources(self, entries, target_format, audio_settings, work_dir):
+        # MP3 no formato de destino é copiado frame a frame; o resto (ex.: .m4a extraído por
+        # cópia direta) é recodificado antes para um MP3 temporário
+        sources = []
+        for entry in entries:
+            scan = scan_mp3(entry['path'])
+            if not scan or (scan['sample_rate'], scan['channels']) != target_format:
+                work_dir.mkdir(parents=True, exist_ok=True)
+                normalized_path = work_dir / f"{entry['episode_id']}.mp3"
+                command = [
+                    "ffmpeg", "-i", entry['path'], "-vn",
+                    "-ar", audio_settings['sample_rate'],
+                    "-ac", audio_settings['channels'],
+                    "-b:a", audio_settings['bitrate'],
+                    "-y", str(normalized_path)
+                ]
+                process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+                scan = scan_mp3(normalized_path) if process.returncode == 0 else None
+                if not scan:
+                    print(f"    ❌ Não foi possível preparar {Path(entry['path']).name} para o áudio unificado: "
+                          f"{process.stderr.decode(errors='replace')[-500:]}")
+                    return None
+                scan['path'] = str(normalized_path)
+            else:
+                scan['path'] = entry['path']
+            sources.append((entry, scan))
+        return sources
+
+    def _copy_frames(self, sources, out):
+        for _, scan in sources:
+            with open(scan['path'], 'rb') as f:
+                for start, stop in scan['ranges']:
+                    f.seek(start)
+                    remaining = stop - start
+                    while remaining > 0:
+                        chunk = f.read(min(_COPY_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        remaining -= len(chunk)
+
+    def _make_chapters(self, sources, first_sample, sample_rate):
+        # Tempos em ms derivados da contagem exata de amostras, acumulada como inteiro
+        chapters = []
+        samples = first_sample
+        for entry, scan in sources:
+            chapters.append(dict(entry, element_id=f"ch{entry['episode_id']}",
+                                 start_samples=samples, end_samples=samples + scan['samples'],
+                                 start_ms=samples * 1000 // sample_rate,
+                                 end_ms=(samples + scan['samples']) * 1000 // sample_rate))
+            samples += scan['samples']
+        return chapters
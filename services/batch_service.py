@@ -0,0 +1,219 @@
+import io
+import json
+import time
+from pathlib import Path
+
+from services.ai_service import CONTINUATION_MARKERS, MAX_OUTPUT_TOKENS, MODELS
+from utils.file_utils import file_sha256
+from utils.rate_limiter import estimate_tokens
+from utils.text_utils import MarkerStripper
+
+BATCH_PROVIDERS = ('claude', 'chatgpt')
+DEFAULT_POLL_SECONDS = 60
+# Status finais de um lote, nos nomes da OpenAI (os da Anthropic são convertidos)
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+# Resumos em lote pelas APIs assíncronas (OpenAI Batch e Anthropic Message Batches): custam
+# metade do preço e não disputam o rate limit das chamadas interativas, mas podem levar
+# horas. Os IDs dos lotes ficam no banco, então o acompanhamento continua após reiniciar.
+class SummaryBatchService:
+    def __init__(self, db_service, ai_service):
+        self.db = db_service
+        self.ai_service = ai_service
+
+    def submit(self, jobs, prompt_name='resumo_detalhado'):
+        # jobs: lista de dicts com episode_id, transcription_path e summary_path.
+        # Retorna o número de resumos enviados (respostas já em cache são gravadas na hora).
+        provider = self.ai_service.get_default_ai()
+        if provider not in BATCH_PROVIDERS:
+            print(f"❌ Modo em lote disponível apenas para Claude e ChatGPT (IA padrão atual: {provider}).")
+            return 0
+        client = self.ai_service.get_client(provider)
+        if not client:
+            print(f"❌ {provider} API not configured or available.")
+            return 0
+
+        prompt_content = self.ai_service._load_prompt(prompt_name)
+        budget = self.ai_service.get_input_token_budget(provider, prompt_content)
+        already_batched = self.db.get_batched_episode_ids()
+        requests = []
+        items = []
+        for job in jobs:
+            if job['episode_id'] in already_batched:
+                print(f"  ⏭️ {Path(job['summary_path']).name} já está em um lote aguardando resultado.")
+                continue
+            with open(job['transcription_path'], 'r', encoding='utf-8') as f:
+                transcription = f.read()
+            cache_key = self.ai_service._summary_cache_key(provider, prompt_name, prompt_content, transcription)
+            cached_summary = self.ai_service.response_cache.get(cache_key)
+            if cached_summary is not None:
+                self._save_summary(job['episode_id'], job['summary_path'], cached_summary)
+                print(f"  💾 {Path(job['summary_path']).name} reaproveitado do cache de respostas.")
+                continue
+            if estimate_tokens(transcription) > budget:
+                # Transcrições maiores que o contexto precisam de map-reduce: ficam para o modo normal
+                print(f"  ⚠️ {Path(job['summary_path']).name}: transcrição maior que o contexto, use o modo normal.")
+                continue
+            custom_id = f"ep-{job['episode_id']}"
+            requests.append((custom_id, f"Transcrição:\n{transcription}"))
+            items.append((custom_id, job['episode_id'], str(job['summary_path']), json.dumps(cache_key)))
+
+        if not requests:
+            return 0
+        if provider == 'chatgpt':
+            batch_id = self._submit_openai(client, prompt_content, requests)
+        else:
+            batch_id = self._submit_anthropic(client, prompt_content, requests)
+        self.db.create_summary_batch(provider, batch_id, self.ai_service.get_model_name(provider), prompt_name, items)
+        print(f"  📦 Lote {batch_id} enviado para {provider} com {len(requests)} resumo(s).")
+        return len(requests)
+
+    # As instruções vão como prefixo fixo (system) em todos os pedidos, para o cache de prompt
+    def _submit_openai(self, client, prompt_content, requests):
+        lines = [
+            json.dumps({
+                'custom_id': custom_id,
+                'method': "POST",
+                'url': "/v1/chat/completions",
+                'body': {
+                    'model': MODELS['chatgpt'],
+                    'max_tokens': MAX_OUTPUT_TOKENS,
+                    'messages': [{'role': "system", 'content': prompt_content}, {'role': "user", 'content': prompt}],
+                },
+            }, ensure_ascii=False)
+            for custom_id, prompt in requests
+        ]
+        input_file = client.files.create(
+            file=("summaries.jsonl", io.BytesIO("\n".join(lines).encode('utf-8'))),
+            purpose="batch"
+        )
+        batch = client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return batch.id
+
+    def _submit_anthropic(self, client, prompt_content, requests):
+        batch = client.messages.batches.create(requests=[
+            {
+                'custom_id': custom_id,
+                'params': {
+                    'model': MODELS['claude'],
+                    'max_tokens': MAX_OUTPUT_TOKENS,
+                    'system': [{'type': "text", 'text': prompt_content, 'cache_control': {'type': "ephemeral"}}],
+                    'messages': [{'role': "user", 'content': prompt}],
+                },
+            }
+            for custom_id, prompt in requests
+        ])
+        return batch.id
+
+    def poll(self, wait=True, interval=None):
+        # Consulta os lotes abertos e grava os resultados dos que terminaram. Com wait=True,
+        # repete a cada interval segundos até não restar lote aberto.
+        if interval is None:
+            try:
+                interval = int(self.db.get_setting('batch_poll_seconds', DEFAULT_POLL_SECONDS))
+            except (TypeError, ValueError):
+                interval = DEFAULT_POLL_SECONDS
+        while True:
+            batches = self.db.get_open_summary_batches()
+            if not batches:
+                return True
+            for batch in batches:
+                self._check_batch(batch)
+            if not wait or not self.db.get_open_summary_batches():
+                return not self.db.get_open_summary_batches()
+            print(f"  ⏳ {len(self.db.get_open_summary_batches())} lote(s) em processamento; nova consulta em {interval}s (Ctrl+C para sair, o acompanhamento continua depois)...")
+            time.sleep(interval)
+
+    def _check_batch(self, batch):
+        client = self.ai_service.get_client(batch['provider'])
+        if not client:
+            print(f"  ❌ {batch['provider']} API not configured; lote {batch['batch_id']} não consultado.")
+            return
+        if batch['provider'] == 'chatgpt':
+            status, results = self._openai_results(client, batch['batch_id'])
+        else:
+            status, results = self._anthropic_results(client, batch['batch_id'])
+        if status not in FINAL_STATUSES:
+            self.db.update_summary_batch_status(batch['id'], status)
+            return
+
+        items = {item['custom_id']: item for item in self.db.get_summary_batch_items(batch['id'])}
+        saved = 0
+        for custom_id, text, input_tokens, output_tokens, error in results:
+            item = items.get(custom_id)
+            if not item or item['status'] != 'pending':
+                continue
+            if error or not text:
+                self.db.update_summary_batch_item(batch['id'], custom_id, 'failed')
+                print(f"    ❌ {Path(item['summary_path']).name}: {error or 'resposta vazia'}")
+                continue
+            markers = MarkerStripper(CONTINUATION_MARKERS)
+            summary_text = markers.feed(text) + markers.flush()
+            if "[CONTINUA]" in markers.found and "[FIM]" not in markers.found:
+                # Lotes não têm turnos de continuação: resposta cortada fica para o modo normal
+                self.db.update_summary_batch_item(batch['id'], custom_id, 'incomplete')
+                print(f"    ⚠️ {Path(item['summary_path']).name}: resposta incompleta, gere pelo modo normal.")
+                continue
+            self._save_summary(item['episode_id'], item['summary_path'], summary_text)
+            if item['cache_key']:
+                self.ai_service.response_cache.put(json.loads(item['cache_key']), summary_text, prompt_name=batch['prompt_name'],
+                                                   input_tokens=input_tokens, output_tokens=output_tokens)
+            self.db.update_summary_batch_item(batch['id'], custom_id, 'completed')
+            saved += 1
+
+        # Pedidos sem resultado (lote expirado ou cancelado no meio) voltam a ficar pendentes de envio
+        returned_ids = {result[0] for result in results}
+        for item in items.values():
+            if item['status'] == 'pending' and item['custom_id'] not in returned_ids:
+                self.db.update_summary_batch_item(batch['id'], item['custom_id'], 'failed')
+        self.db.update_summary_batch_status(batch['id'], status, completed=True)
+        print(f"  ✅ Lote {batch['batch_id']} ({batch['provider']}) {status}: {saved}/{batch['request_count']} resumo(s) gravados.")
+
+    def _openai_results(self, client, batch_id):
+        batch = client.batches.retrieve(batch_id)
+        if batch.status not in FINAL_STATUSES:
+            return batch.status, []
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get('response') or {}
+                body = response.get('body') or {}
+                if entry.get('error') or response.get('status_code') != 200:
+                    error = entry.get('error') or body.get('error') or f"HTTP {response.get('status_code')}"
+                    results.append((entry['custom_id'], None, None, None, str(error)))
+                    continue
+                usage = body.get('usage') or {}
+                text = body['choices'][0]['message']['content']
+                results.append((entry['custom_id'], text, usage.get('prompt_tokens'), usage.get('completion_tokens'), None))
+        return batch.status, results
+
+    def _anthropic_results(self, client, batch_id):
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != 'ended':
+            return batch.processing_status, []
+        results = []
+        for entry in client.messages.batches.results(batch_id):
+            if entry.result.type == 'succeeded':
+                message = entry.result.message
+                text = "".join(block.text for block in message.content if block.type == 'text')
+                results.append((entry.custom_id, text, message.usage.input_tokens, message.usage.output_tokens, None))
+            else:
+                error = getattr(entry.result, 'error', None) or entry.result.type
+                results.append((entry.custom_id, None, None, None, str(error)))
+        return 'completed', results
+
+    def _save_summary(self, episode_id, summary_path, summary_text):
+        summary_path = Path(summary_path)
+        summary_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(summary_text)
+        with self.db.transaction():
+            self.db.update_episode_summary(episode_id, summary_text)
+            self.db.mark_episode_stage(episode_id, 'summarized', str(summary_path), file_sha256(summary_path))
+
@@ -5,15 +5,36 @@ import json
 import logging
 import re
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from services.ai_service import AIService
+from services.audio_service import PROGRESS_ARGS, SPEECH_SETTINGS
+from services.batch_service import SummaryBatchService
 from services.drive_service import DriveService
 from services.xml_service import XMLService
 from services.github_service import GitHubService
+from utils.file_utils import file_sha256
+from utils.pipeline import PipelineStage, StagePipeline
 
 # logger = logging.getLogger(__name__)
 
+# Etapas de cada episódio, registradas em episode_stages à medida que terminam
+EPISODE_STAGES = ['converted', 'transcribed', 'summarized', 'uploaded']
+
+# Etapas do curso em ordem; courses.processing_stage guarda a última concluída
+COURSE_STEPS = ['not_started', 'episodes', 'unified_summary', 'unified_audio', 'timestamps',
+                'drive_upload', 'rss_feed', 'github', 'local_copy', 'completed']
+
+# Parâmetros do áudio de podcast (também fazem parte da chave do cache de artefatos)
+AUDIO_SETTINGS = {'sample_rate': "44100", 'channels': "2", 'bitrate': "128k", 'format': "mp3"}
+# Episódios convertidos são registrados no banco em blocos deste tamanho, uma transação por bloco
+EPISODE_REGISTER_BATCH = 25
+# No pipeline, checkpoints pendentes são gravados ao completar um bloco ou após este intervalo
+CHECKPOINT_FLUSH_SECONDS = 5
+
 class CourseService:
     def __init__(self, db_service):
         self.db = db_service
@@ -21,8 +42,14 @@ class CourseService:
         self.drive_service = DriveService(db_service) # Instanciar DriveService
         self.xml_service = XMLService(db_service) # Instanciar XMLService
         self.github_service = GitHubService(db_service) # Instanciar GitHubService
+        self.audio_service = self.ai_service.audio_service # Compartilhado com o AIService
+        self.artifact_cache = self.ai_service.artifact_cache # Cache compartilhado com o AIService
+        self.batch_service = SummaryBatchService(db_service, self.ai_service)
         self.supported_formats = ['.mp4', '.avi', '.mkv', '.mov', '.wmv']
         self.output_base_dir = Path("data/courses")
+        self._active_conversions = set() # Processos ffmpeg em execução (para cancelamento)
+        self._conversions_lock = threading.Lock()
+        self._cancel_conversions = threading.Event()
 
     def _select_course(self):
         print("📂 Selecione um curso:")
@@ -44,6 +71,28 @@ class CourseService:
             except ValueError:
                 print("Por favor, insira um número.")
 
+    def _select_courses(self):
+        print("📂 Selecione os cursos:")
+        courses = [d.name for d in self.output_base_dir.iterdir() if d.is_dir()]
+        if not courses:
+            print("Nenhum curso encontrado.")
+            return []
+
+        for i, course_name in enumerate(courses):
+            print(f"[{i + 1}] {course_name}")
+
+        while True:
+            choice = input("Escolha os cursos (ex: 1,3 ou 'todos'): ").strip().lower()
+            if choice == 'todos':
+                return courses
+            try:
+                indexes = [int(part) for part in choice.split(",") if part.strip()]
+                if indexes and all(1 <= index <= len(courses) for index in indexes):
+                    return [courses[index - 1] for index in dict.fromkeys(indexes)]
+                print("Escolha inválida.")
+            except ValueError:
+                print("Por favor, insira números separados por vírgula.")
+
     def process_complete_course(self, course_path, course_name):
         # logger.info(f"Iniciando processamento completo do curso: {course_name} em {course_path}")
         print(f"Iniciando processamento completo do curso: {course_name} em {course_path}")
@@ -54,7 +103,8 @@ class CourseService:
                 print(f"❌ Erro: Diretório do curso inválido ou sem vídeos: {course_path}")
                 return
 
-            course_files = self.scan_course_directory(course_path)
+            previous_manifest = self._load_manifest(course_name)
+            course_files = self.scan_course_directory(course_path, previous_manifest)
             if not course_files:
                 # logger.warning(f"Nenhum vídeo suportado encontrado no diretório: {course_path}")
                 print(f"⚠️ Aviso: Nenhum vídeo suportado encontrado no diretório: {course_path}")
@@ -63,9 +113,9 @@ class CourseService:
             # 2. Verificar se curso já foi processado
             existing_course = self.db.get_course(course_name)
             if existing_course:
-                # logger.info(f"Curso '{course_name}' já existe na database. Oferecendo opção de retomar.")
-                print(f"ℹ️ Curso '{course_name}' já existe. Deseja retomar o processamento?")
-                # TODO: Implementar lógica de retomada
+                # logger.info(f"Curso '{course_name}' já existe na database. Processando apenas as alterações.")
+                print(f"ℹ️ Curso '{course_name}' já existe. Processando apenas vídeos novos ou alterados...")
+                self._update_existing_course(existing_course, course_path, course_name, course_files, previous_manifest)
                 return
 
             # 3. Preparação: Criar entrada na database
@@ -79,159 +129,111 @@ class CourseService:
 
             # TODO: Configurar diretórios de trabalho, verificar espaço em disco, validar APIs
 
-            # 4. Conversão de Vídeo para Áudio
-            print("Iniciando conversão de vídeo para áudio...")
-            audio_output_dir = self.output_base_dir / course_name / "audios"
-            audio_output_dir.mkdir(parents=True, exist_ok=True)
-
-            for file_info in course_files:
-                video_path = Path(file_info['full_path'])
-                relative_audio_path = Path(file_info['relative_path']).with_suffix(".mp3")
-                audio_path = audio_output_dir / relative_audio_path
-                audio_path.parent.mkdir(parents=True, exist_ok=True)
-
-                print(f"  Convertendo {video_path.name} para {audio_path.name}...")
-                success, duration, file_size = self.convert_video_to_audio(str(video_path), str(audio_path))
-                if success:
-                    episode_id = self.db.create_episode(
-                        course_id=course_id,
-                        filename=audio_path.name,
-                        title=video_path.stem, # Título do episódio
-                        audio_path=str(audio_path),
-                        duration=duration,
-                        file_size=file_size,
-                        relative_path=str(file_info['relative_path'])
-                    )
-                    print(f"    ✅ Áudio convertido e episódio registrado: {audio_path.name} (Duração: {duration}s, Tamanho: {file_size} bytes)")
-                else:
-                    print(f"    ❌ Falha na conversão de {video_path.name}")
-            print("Conversão de vídeo para áudio concluída.")
-
-            # 5. Transcrição
-            print("Iniciando transcrição de áudio...")
-            transcription_output_dir = self.output_base_dir / course_name / "transcriptions"
-            transcription_output_dir.mkdir(parents=True, exist_ok=True)
-
-            episodes = self.db.get_episodes_by_course(course_id)
-            for episode in episodes:
-                audio_path = Path(episode['audio_path'])
-                transcription_path = transcription_output_dir / f"{audio_path.stem}.txt"
-                
-                print(f"  Transcrevendo {audio_path.name}...")
-                transcription_text = self.ai_service.transcribe_audio(str(audio_path))
-                
-                if transcription_text:
-                    with open(transcription_path, 'w', encoding='utf-8') as f:
-                        f.write(transcription_text)
-                    # TODO: Atualizar episódio na database com o caminho da transcrição
-                    print(f"    ✅ Áudio transcrito: {transcription_path.name}")
-                else:
-                    print(f"    ❌ Falha na transcrição de {audio_path.name}")
-            print("Transcrição de áudio concluída.")
-
-            # 6. Geração de Resumos via IA
-            print("Iniciando geração de resumos com IA...")
-            summary_output_dir = self.output_base_dir / course_name / "summaries"
-            summary_output_dir.mkdir(parents=True, exist_ok=True)
-
-            episodes = self.db.get_episodes_by_course(course_id) # Recarregar episódios para garantir transcrição
-            for episode in episodes:
-                transcription_path = transcription_output_dir / f"{Path(episode['audio_path']).stem}.txt"
-                if not transcription_path.exists():
-                    print(f"    ⚠️ Transcrição não encontrada para {episode['filename']}. Pulando resumo.")
-                    continue
-                
-                with open(transcription_path, 'r', encoding='utf-8') as f:
-                    transcription_text = f.read()
-
-                summary_path = summary_output_dir / f"{Path(episode['audio_path']).stem}.md"
-                
-                print(f"  Gerando resumo para {episode['filename']}...")
-                summary_text = self.ai_service.generate_summary(transcription_text, 'resumo_detalhado')
-                
-                if summary_text:
-                    with open(summary_path, 'w', encoding='utf-8') as f:
-                        f.write(summary_text)
-                    # TODO: Atualizar episódio na database com o caminho do resumo
-                    print(f"    ✅ Resumo gerado: {summary_path.name}")
-                else:
-                    print(f"    ❌ Falha na geração do resumo para {episode['filename']}")
-            print("Geração de resumos com IA concluída.")
-
-            # 7. Unificação de Conteúdo
-            print("Iniciando unificação de conteúdo...")
-            final_output_dir = self.output_base_dir / course_name / "final"
-            final_output_dir.mkdir(parents=True, exist_ok=True)
-
-            # Gerar Resumo.md unificado
-            unified_summary_path = final_output_dir / "Resumo.md"
-            self._generate_unified_summary(course_id, unified_summary_path)
-            
-            # Criar áudio unificado
-            unified_audio_path = final_output_dir / f"{course_name}.mp3"
-            self._create_unified_audio(course_id, unified_audio_path)
-
-            # Gerar timestamps.md
-            timestamps_path = final_output_dir / "timestamps.md"
-            self._generate_timestamps(course_id, timestamps_path)
+            # 4-6. Conversão, transcrição e resumo em pipeline: cada episódio avança
+            # de etapa assim que termina a anterior, sem esperar o restante do curso
+            print("Iniciando conversão, transcrição e geração de resumos em pipeline...")
+            if not self._process_course_episodes(course_id, course_name, course_files):
+                print(f"❌ Processamento do curso {course_name} interrompido pelo usuário.")
+                return
+            print("Conversão, transcrição e geração de resumos concluídas.")
+            self._save_manifest(course_id, course_name, course_path, course_files)
 
-            print("Unificação de conteúdo concluída.")
+            # 7-9. Unificação, distribuição e finalização
+            self._finalize_course(course_id, course_name, course_path)
 
-            # 8. Distribuição
-            print("Iniciando distribuição (Google Drive, RSS, GitHub)....")
-            
-            # Upload para Google Drive
-            print("  Fazendo upload para Google Drive...")
-            drive_files_to_upload = {
-                str(unified_audio_path): f"{course_name}.mp3",
-                str(unified_summary_path): "Resumo.md",
-                str(timestamps_path): "timestamps.md"
-            }
-            # TODO: Adicionar audios_individuais, transcricoes, resumos_individuais
-            self.drive_service.upload_course_files(course_name, drive_files_to_upload)
-            print("  Upload para Google Drive concluído.")
-
-            # Atualizar feed RSS
-            print("  Atualizando feed RSS...")
-            # Obter URL pública do áudio unificado (após upload para o Drive)
-            # TODO: Obter file_id e public_url do upload_course_files
-            unified_audio_file_id = "SEU_AUDIO_ID_AQUI" # Placeholder
-            unified_audio_public_url = self.drive_service.get_direct_download_url(unified_audio_file_id)
-            
-            course_data_for_rss = {
-                'title': course_name,
-                'description': "Resumo completo do curso.", # TODO: Usar resumo real
-                'audio_url': unified_audio_public_url,
-                'file_size': os.path.getsize(unified_audio_path),
-                'duration': self._get_audio_info(unified_audio_path)[0],
-                'pub_date': datetime.now().strftime('%a, %d %b %Y %H:%M:%S %z'),
-                'timestamps': [], # TODO: Obter timestamps reais
-                'links': []
-            }
-            self.xml_service.create_or_update_feed(course_data_for_rss)
-            print("  Feed RSS atualizado.")
+        except Exception as e:
+            # logger.exception(f"Erro inesperado durante o processamento do curso {course_name}")
+            print(f"❌ Erro inesperado durante o processamento do curso {course_name}: {e}")
 
-            # Atualizar repositório GitHub
-            print("  Atualizando repositório GitHub...")
-            self.github_service.update_course_feed(self.xml_service.feed_path)
-            print("  Repositório GitHub atualizado.")
+    def _finalize_course(self, course_id, course_name, course_path):
+        final_output_dir = self.output_base_dir / course_name / "final"
+        final_output_dir.mkdir(parents=True, exist_ok=True)
+        unified_summary_path = final_output_dir / "Resumo.md"
+        unified_audio_path = final_output_dir / f"{course_name}.mp3"
+        timestamps_path = final_output_dir / "timestamps.md"
 
-            # Copiar arquivos finais para o diretório original do curso
-            print("  Copiando arquivos finais para o diretório original do curso...")
-            shutil.copy2(unified_summary_path, Path(course_path) / "Resumo.md")
-            shutil.copy2(unified_audio_path, Path(course_path) / f"{course_name}.mp3")
-            shutil.copy2(timestamps_path, Path(course_path) / "timestamps.md")
-            print("  Arquivos finais copiados.")
+        # 7. Unificação de Conteúdo, 8. Distribuição
+        steps = [
+            ('unified_summary', lambda: self._generate_unified_summary(course_id, unified_summary_path)),
+            ('unified_audio', lambda: self._create_unified_audio(course_id, unified_audio_path)),
+            ('timestamps', lambda: self._generate_timestamps(course_id, timestamps_path)),
+            ('drive_upload', lambda: self._upload_final_files(course_id, course_name, unified_audio_path, unified_summary_path, timestamps_path)),
+            ('rss_feed', lambda: self._update_course_feed(course_name, unified_audio_path)),
+            ('github', lambda: self.github_service.update_course_feed(self.xml_service.feed_path)),
+            ('local_copy', lambda: self._copy_final_files(course_name, course_path, unified_audio_path, unified_summary_path, timestamps_path)),
+        ]
 
-            print("Distribuição concluída.")
+        # processing_stage guarda a última etapa concluída: uma nova execução retoma da seguinte
+        current_stage = self.db.get_processing_stage(course_id)
+        done_index = COURSE_STEPS.index(current_stage) if current_stage in COURSE_STEPS else 0
+        print("Iniciando unificação e distribuição...")
+        for step, func in steps:
+            if COURSE_STEPS.index(step) <= done_index:
+                print(f"  ⏭️ Etapa '{step}' já concluída, pulando.")
+                continue
 
-            # 9. Finalização
-            self.db.mark_course_completed(course_id)
-            print(f"✅ Processamento completo do curso {course_name} FINALIZADO.")
+            operation_id = self.db.log_operation(course_id, step, status='running')
+            try:
+                result = func()
+            except Exception as e:
+                self.db.update_operation_status(operation_id, 'failed', error_message=str(e))
+                raise
+            if result is False:
+                self.db.update_operation_status(operation_id, 'failed')
+                print(f"❌ Etapa '{step}' falhou. Execute o processamento novamente para retomar a partir dela.")
+                return False
+            self.db.update_operation_status(operation_id, 'completed')
+            self.db.set_processing_stage(course_id, step)
+        print("Unificação e distribuição concluídas.")
+
+        # 9. Finalização
+        self.db.set_processing_stage(course_id, 'completed')
+        self.db.mark_course_completed(course_id)
+        print(f"✅ Processamento completo do curso {course_name} FINALIZADO.")
+        return True
+
+    def _upload_final_files(self, course_id, course_name, unified_audio_path, unified_summary_path, timestamps_path):
+        print("  Fazendo upload para Google Drive...")
+        drive_files_to_upload = {
+            str(unified_audio_path): f"{course_name}.mp3",
+            str(unified_summary_path): "Resumo.md",
+            str(timestamps_path): "timestamps.md"
+        }
+        # TODO: Adicionar audios_individuais, transcricoes, resumos_individuais
+        self.drive_service.upload_course_files(course_name, drive_files_to_upload)
+        # O áudio unificado enviado contém todos os episódios atuais do curso
+        self.db.mark_episode_stages([
+            (episode['id'], 'uploaded', str(unified_audio_path), None) for episode in self.db.get_episodes_by_course(course_id)
+        ])
+        print("  Upload para Google Drive concluído.")
+
+    def _update_course_feed(self, course_name, unified_audio_path):
+        print("  Atualizando feed RSS...")
+        # Obter URL pública do áudio unificado (após upload para o Drive)
+        # TODO: Obter file_id e public_url do upload_course_files
+        unified_audio_file_id = "SEU_AUDIO_ID_AQUI" # Placeholder
+        unified_audio_public_url = self.drive_service.get_direct_download_url(unified_audio_file_id)
+        
+        course_data_for_rss = {
+            'title': course_name,
+            'description': "Resumo completo do curso.", # TODO: Usar resumo real
+            'audio_url': unified_audio_public_url,
+            'file_size': os.path.getsize(unified_audio_path),
+            'duration': self._get_course_duration(course_name),
+            'pub_date': datetime.now().strftime('%a, %d %b %Y %H:%M:%S %z'),
+            'timestamps': [], # TODO: Obter timestamps reais
+            'links': []
+        }
+        self.xml_service.create_or_update_feed(course_data_for_rss)
+        print("  Feed RSS atualizado.")
 
-        except Exception as e:
-            # logger.exception(f"Erro inesperado durante o processamento do curso {course_name}")
-            print(f"❌ Erro inesperado durante o processamento do curso {course_name}: {e}")
+    def _copy_final_files(self, course_name, course_path, unified_audio_path, unified_summary_path, timestamps_path):
+        # Copiar arquivos finais para o diretório original do curso
+        print("  Copiando arquivos finais para o diretório original do curso...")
+        shutil.copy2(unified_summary_path, Path(course_path) / "Resumo.md")
+        shutil.copy2(unified_audio_path, Path(course_path) / f"{course_name}.mp3")
+        shutil.copy2(timestamps_path, Path(course_path) / "timestamps.md")
+        print("  Arquivos finais copiados.")
 
     def _validate_course_directory(self, path):
         if not Path(path).is_dir():
@@ -243,18 +245,23 @@ class CourseService:
                     return True
         return False
 
-    def scan_course_directory(self, path):
+    def scan_course_directory(self, path, previous_manifest=None):
+        previous_files = (previous_manifest or {}).get('files', {})
         course_files = []
         for root, _, files in os.walk(path):
             for file in files:
                 if any(file.lower().endswith(ext) for ext in self.supported_formats):
                     full_path = Path(root) / file
                     relative_path = full_path.relative_to(path)
+                    stat = full_path.stat()
                     course_files.append({
                         "full_path": str(full_path),
                         "relative_path": str(relative_path),
                         "filename": file,
-                        "hierarchy_level": len(relative_path.parts) - 1 # 0 for root files, 1 for first level subfolders
+                        "hierarchy_level": len(relative_path.parts) - 1, # 0 for root files, 1 for first level subfolders
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        "content_hash": None
                     })
         
         # Ordenação hierárquica: pastas primeiro, depois arquivos, por nome
@@ -267,46 +274,610 @@ class CourseService:
             return (len(parts),) + tuple(p.lower() for p in parts)
 
         course_files.sort(key=sort_key)
+        for index, item in enumerate(course_files):
+            item["sort_order"] = index
+
+        # Hash de conteúdo do manifesto: reaproveita o anterior quando tamanho e mtime não mudaram
+        to_hash = []
+        for item in course_files:
+            previous = previous_files.get(item['relative_path'])
+            if previous and previous['size'] == item['size'] and previous['mtime'] == item['mtime']:
+                item['content_hash'] = previous['content_hash']
+            else:
+                to_hash.append(item)
+        if to_hash:
+            print(f"  Calculando hash de {len(to_hash)} vídeo(s)...")
+            with ThreadPoolExecutor(max_workers=self._get_conversion_workers()) as executor:
+                for item, content_hash in zip(to_hash, executor.map(lambda item: file_sha256(item['full_path']), to_hash)):
+                    item['content_hash'] = content_hash
         return course_files
 
-    def convert_video_to_audio(self, video_path, audio_path):
+    def _manifest_path(self, course_name):
+        return self.output_base_dir / course_name / "manifest.json"
+
+    def _load_manifest(self, course_name):
+        manifest_path = self._manifest_path(course_name)
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Manifesto inválido para '{course_name}', ignorando: {e}")
+            return None
+
+    def _save_manifest(self, course_id, course_name, course_path, course_files):
+        # Só entram no manifesto os vídeos que viraram episódio; falhas são refeitas na próxima execução
+        processed_paths = {episode['relative_path'] for episode in self.db.get_episodes_by_course(course_id)}
+        manifest = {
+            'source_path': str(course_path),
+            'updated_at': datetime.now().isoformat(),
+            'files': {
+                item['relative_path']: {
+                    'size': item['size'],
+                    'mtime': item['mtime'],
+                    'content_hash': item['content_hash']
+                }
+                for item in course_files if item['relative_path'] in processed_paths
+            }
+        }
+        manifest_path = self._manifest_path(course_name)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = manifest_path.with_suffix(".json.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, manifest_path)
+
+    def _diff_course_files(self, previous_manifest, course_files, episodes):
+        previous_files = (previous_manifest or {}).get('files', {})
+        episodes_by_path = {episode['relative_path']: episode for episode in episodes}
+        current_paths = {item['relative_path'] for item in course_files}
+
+        added, changed, unchanged = [], [], []
+        for item in course_files:
+            episode = episodes_by_path.get(item['relative_path'])
+            previous = previous_files.get(item['relative_path'])
+            if not episode:
+                added.append(item)
+            elif previous and previous['content_hash'] != item['content_hash']:
+                changed.append(item)
+            else:
+                # Sem manifesto anterior (cursos antigos), episódios existentes são mantidos
+                unchanged.append(item)
+        removed = [episode for path, episode in episodes_by_path.items() if path not in current_paths]
+        return added, changed, removed, unchanged
+
+    def _update_existing_course(self, course, course_path, course_name, course_files, previous_manifest):
+        course_id = course['id']
+        episodes = self.db.get_episodes_by_course(course_id)
+        episodes_by_path = {episode['relative_path']: episode for episode in episodes}
+        stages = self.db.get_episode_stages(course_id)
+        added, changed, removed, unchanged = self._diff_course_files(previous_manifest, course_files, episodes)
+        # Episódios interrompidos antes do resumo são retomados a partir do último checkpoint
+        incomplete = [item for item in unchanged
+                      if 'summarized' not in stages.get(episodes_by_path[item['relative_path']]['id'], {})]
+
+        print(f"  Novos: {len(added)} | Alterados: {len(changed)} | Removidos: {len(removed)} | Incompletos: {len(incomplete)} | Inalterados: {len(unchanged) - len(incomplete)}")
+        if not (added or changed or removed or incomplete) and course['processing_stage'] == 'completed':
+            print(f"✅ Curso '{course_name}' já está atualizado. Nada a processar.")
+            return
+
+        with self.db.transaction():
+            for episode in removed + [episodes_by_path[item['relative_path']] for item in changed]:
+                self._remove_episode(course_name, episode)
+        if removed:
+            self.db.set_processing_stage(course_id, 'episodes')
+
+        # A posição dos episódios existentes muda quando vídeos entram ou saem no meio do curso
+        self.db.update_episode_sort_orders([
+            (episodes_by_path[item['relative_path']]['id'], item['sort_order'])
+            for item in unchanged if episodes_by_path[item['relative_path']]['sort_order'] != item['sort_order']
+        ])
+
+        resumed = [self._resume_job(course_name, item, episodes_by_path[item['relative_path']], stages) for item in incomplete]
+        to_process = sorted(added + changed + resumed, key=lambda item: item['sort_order'])
+        if to_process:
+            print(f"Processando {len(to_process)} vídeo(s) novo(s), alterado(s) ou incompleto(s)...")
+            if not self._process_course_episodes(course_id, course_name, to_process):
+                print(f"❌ Processamento do curso {course_name} interrompido pelo usuário.")
+                return
+        self._save_manifest(course_id, course_name, course_path, course_files)
+
+        # Resumo.md, timestamps.md e o áudio unificado são regenerados com o conjunto atualizado,
+        # retomando da última etapa concluída quando nada mudou nos episódios
+        self._finalize_course(course_id, course_name, course_path)
+
+    def _resume_job(self, course_name, item, episode, stages):
+        checkpoints = dict(stages.get(episode['id'], {}))
+        # Cursos processados antes dos checkpoints: artefatos existentes no disco valem como etapa concluída
+        stem = Path(episode['audio_path']).stem if episode['audio_path'] else None
+        legacy_artifacts = {
+            'converted': episode['audio_path'],
+            'transcribed': str(self.output_base_dir / course_name / "transcriptions" / f"{stem}.txt") if stem else None,
+            'summarized': str(self.output_base_dir / course_name / "summaries" / f"{stem}.md") if stem else None,
+        }
+        for stage, artifact_path in legacy_artifacts.items():
+            if stage not in checkpoints and artifact_path and os.path.exists(artifact_path):
+                checkpoints[stage] = {'artifact_path': artifact_path, 'checksum': None}
+        return dict(item, episode_id=episode['id'], duration=episode['duration'], checkpoints=checkpoints)
+
+    def _remove_episode(self, course_name, episode):
+        course_dir = self.output_base_dir / course_name
+        stem = Path(episode['audio_path']).stem if episode['audio_path'] else Path(episode['filename']).stem
+        artifacts = [
+            Path(episode['audio_path']) if episode['audio_path'] else None,
+            self._speech_path(episode['audio_path']) if episode['audio_path'] else None,
+            course_dir / "transcriptions" / f"{stem}.txt",
+            course_dir / "transcriptions" / f"{stem}.segments.json",
+            course_dir / "summaries" / f"{stem}.md",
+        ]
+        for artifact in artifacts:
+            if artifact and artifact.exists():
+                artifact.unlink()
+        self.db.delete_episode(episode['id'])
+        print(f"  🗑️ Episódio removido: {episode['relative_path'] or episode['filename']}")
+
+    def _get_conversion_workers(self):
+        default_workers = os.cpu_count() or 1
+        try:
+            workers = int(self.db.get_setting('conversion_workers', default_workers))
+        except (TypeError, ValueError):
+            workers = default_workers
+        return max(1, workers)
+
+    def _convert_course_files(self, course_id, course_name, course_files):
+        audio_output_dir = self.output_base_dir / course_name / "audios"
+        audio_output_dir.mkdir(parents=True, exist_ok=True)
+
+        # Vídeos com checkpoint 'converted' válido (execução anterior interrompida) não são refeitos
+        episodes_by_path = {episode['relative_path']: episode for episode in self.db.get_episodes_by_course(course_id)}
+        stages = self.db.get_episode_stages(course_id)
+        pending = []
+        for file_info in course_files:
+            episode = episodes_by_path.get(str(file_info['relative_path']))
+            if episode:
+                file_info = self._resume_job(course_name, file_info, episode, stages)
+                if self._valid_checkpoint(file_info, 'converted'):
+                    continue
+            pending.append(file_info)
+        if len(pending) < len(course_files):
+            print(f"  ⏭️ {len(course_files) - len(pending)} vídeo(s) já convertidos em execução anterior.")
+        if not pending:
+            return True
+        course_files = pending
+
+        workers = min(self._get_conversion_workers(), len(course_files))
+        total = len(course_files)
+        course_files = self._probe_sources(course_files)
+        print(f"  Convertendo {total} vídeo(s) com {workers} worker(s) em paralelo (Ctrl+C para cancelar)...")
+
+        self._cancel_conversions.clear()
+        completed = 0
+        failed = 0
+        sequential_time = 0.0
+        start_time = time.monotonic()
+        converted = [] # (file_info, argumentos de create_episodes, checksum do áudio)
+
+        def register_converted():
+            # Episódios novos e checkpoints 'converted' do bloco numa única transação
+            if not converted:
+                return
+            with self.db.transaction():
+                new_entries = [entry for entry in converted if not entry[0].get('episode_id')]
+                episode_ids = self.db.create_episodes(course_id, [episode for _, episode, _ in new_entries])
+                for (file_info, _, _), episode_id in zip(new_entries, episode_ids):
+                    file_info['episode_id'] = episode_id
+                self.db.mark_episode_stages([
+                    (file_info['episode_id'], 'converted', episode['audio_path'], checksum)
+                    for file_info, episode, checksum in converted
+                ])
+            converted.clear()
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {
+            executor.submit(self._convert_file_job, file_info, audio_output_dir): file_info
+            for file_info in course_files
+        }
+        handled = set()
+        interrupted = False
+        try:
+            for future in as_completed(futures):
+                handled.add(future)
+                file_info = futures[future]
+                video_path = Path(file_info['full_path'])
+                success, audio_path, media_info, elapsed = future.result()
+                sequential_time += elapsed
+                completed += 1
+                if success:
+                    converted.append((file_info, self._converted_episode(file_info, audio_path, media_info), file_sha256(audio_path)))
+                    if len(converted) >= EPISODE_REGISTER_BATCH:
+                        register_converted()
+                    mode_label = "cópia direta" if media_info['conversion_mode'] == 'copy' else "recodificado"
+                    print(f"    [{completed}/{total}] ✅ {audio_path.name} (Duração: {media_info['duration']:.1f}s, Tamanho: {media_info['file_size']} bytes, {mode_label}, {elapsed:.1f}s)")
+                else:
+                    failed += 1
+                    print(f"    [{completed}/{total}] ❌ Falha na conversão de {video_path.name}")
+        except KeyboardInterrupt:
+            print("\n⚠️ Cancelando conversões em andamento...")
+            self.cancel_conversions()
+            interrupted = True
+        finally:
+            # Qualquer que seja a saída do laço, as conversões já concluídas ficam registradas
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, file_info in futures.items():
+                # Conversões que terminaram depois que o laço foi interrompido
+                if future in handled or future.cancelled() or future.exception() is not None:
+                    continue
+                success, audio_path, media_info, _ = future.result()
+                if success:
+                    converted.append((file_info, self._converted_episode(file_info, audio_path, media_info), file_sha256(audio_path)))
+            register_converted()
+        if interrupted:
+            print(f"⚠️ Conversão cancelada: {completed - failed}/{total} vídeo(s) convertidos.")
+            return False
+
+        wall_time = time.monotonic() - start_time
+        speedup = sequential_time / wall_time if wall_time > 0 else 1.0
+        print(f"  ⏱️ Tempo total: {wall_time:.1f}s (sequencial estimado: {sequential_time:.1f}s, speedup: {speedup:.1f}x com {workers} worker(s))")
+        self.artifact_cache.report()
+        if failed:
+            print(f"  ⚠️ {failed} vídeo(s) falharam na conversão.")
+        return failed == 0
+
+    def _converted_episode(self, file_info, audio_path, media_info):
+        # Argumentos de create_episodes para um vídeo convertido
+        return {
+            'filename': audio_path.name,
+            'title': Path(file_info['full_path']).stem, # Título do episódio
+            'audio_path': str(audio_path),
+            'duration': media_info['duration'],
+            'file_size': media_info['file_size'],
+            'relative_path': str(file_info['relative_path']),
+            'sort_order': file_info['sort_order'],
+            'bitrate': media_info['bitrate'],
+            'codec': media_info['codec'],
+            'channels': media_info['channels'],
+            'conversion_mode': media_info['conversion_mode'],
+        }
+
+    def _process_course_episodes(self, course_id, course_name, course_files):
+        course_dir = self.output_base_dir / course_name
+        audio_output_dir = course_dir / "audios"
+        transcription_output_dir = course_dir / "transcriptions"
+        summary_output_dir = course_dir / "summaries"
+        for directory in (audio_output_dir, transcription_output_dir, summary_output_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        conversion_workers = min(self._get_conversion_workers(), len(course_files))
+        stages = [
+            PipelineStage('convert', lambda job: self._pipeline_convert(job, audio_output_dir), workers=conversion_workers,
+                          cancel=self.cancel_conversions),
+            PipelineStage('transcribe', lambda job: self._pipeline_transcribe(job, transcription_output_dir),
+                          workers=self.ai_service.get_concurrency_limit('whisper')),
+            PipelineStage('summarize', lambda job: self._pipeline_summarize(job, summary_output_dir, course_id),
+                          workers=self.ai_service.get_concurrency_limit(self.ai_service.get_default_ai())),
+        ]
+        stage_labels = {'convert': "Conversão", 'transcribe': "Transcrição", 'summarize': "Resumo"}
+        pipeline = StagePipeline(stages, queue_size=max(4, conversion_workers))
+
+        total = len(course_files)
+        completed = {stage.name: 0 for stage in stages}
+        failed = {stage.name: 0 for stage in stages}
+
+        work_done = [0]
+        # Checkpoints e falhas acumulados na thread principal e gravados em bloco, numa transação
+        pending_checkpoints = []
+        failed_operations = []
+        last_flush = [time.monotonic()]
+
+        def flush_records():
+            if pending_checkpoints or failed_operations:
+                with self.db.transaction():
+                    self._record_pipeline_checkpoints(course_id, pending_checkpoints)
+                    self.db.log_operations(failed_operations)
+                pending_checkpoints.clear()
+                failed_operations.clear()
+            last_flush[0] = time.monotonic()
+
+        def on_event(event):
+            job = event.item
+            video_name = Path(job['full_path']).name
+            label = stage_labels[event.stage]
+            if not event.ok:
+                failed[event.stage] += 1
+                reason = f": {event.error}" if event.error else ""
+                print(f"    ❌ [{label}] Falha em {video_name}{reason}")
+                failed_operations.append((course_id, event.stage, video_name, str(event.error) if event.error else None, 'failed'))
+                return
+
+            completed[event.stage] += 1
+            pending_checkpoints.append((event.stage, job))
+            if len(pending_checkpoints) >= EPISODE_REGISTER_BATCH or time.monotonic() - last_flush[0] >= CHECKPOINT_FLUSH_SECONDS:
+                flush_records()
+
+            if event.stage in job['resumed']:
+                print(f"    ⏭️ [{label} {completed[event.stage]}/{total}] {video_name} (retomado do checkpoint)")
+            else:
+                work_done[0] += 1
+                print(f"    ✅ [{label} {completed[event.stage]}/{total}] {video_name} ({event.elapsed:.1f}s)")
+
+        jobs = []
+        for file_info in self._probe_sources(course_files):
+            job = dict(file_info)
+            job['resumed'] = set()
+            jobs.append(job)
+        print(f"  Processando {total} episódio(s): {conversion_workers} conversão(ões) simultânea(s) (Ctrl+C para cancelar)...")
+        self._cancel_conversions.clear()
+        self.ai_service.reset_vad_stats()
+        self.ai_service.reset_prompt_cache_stats()
+        operation_id = self.db.log_operation(course_id, 'episodes', details=f"{total} episódio(s)", status='running')
+        try:
+            wall_time = pipeline.run(jobs, on_event)
+        except KeyboardInterrupt:
+            # run() já cancelou o pipeline (e os ffmpeg em andamento) e esperou as threads
+            print("\n⚠️ Processamento cancelado.")
+            self.db.update_operation_status(operation_id, 'cancelled')
+            return False
+        finally:
+            # Etapas já concluídas ficam registradas mesmo se o pipeline falhar
+            flush_records()
+
+        stage_time = sum(stage.busy_time for stage in stages)
+        print(f"  ⏱️ Pipeline concluído em {wall_time:.1f}s (tempo somado das etapas: {stage_time:.1f}s)")
+        self.artifact_cache.report()
+        self.ai_service.response_cache.report()
+        self.ai_service.report_prompt_cache()
+        self.ai_service.report_providers()
+        self.ai_service.report_clients()
+        self.ai_service.report_vad_savings()
+        for stage in stages:
+            if failed[stage.name]:
+                print(f"  ⚠️ {stage_labels[stage.name]}: {failed[stage.name]} episódio(s) com falha.")
+
+        failures = sum(failed.values())
+        self.db.update_operation_status(operation_id, 'completed' if not failures else 'failed',
+                                        details=f"{completed['summarize']}/{total} episódio(s) concluídos")
+        self._update_course_progress(course_id)
+        if work_done[0]:
+            # Episódios mudaram: unificação e distribuição precisam ser refeitas
+            self.db.set_processing_stage(course_id, 'episodes')
+        return True
+
+    def _update_course_progress(self, course_id):
+        episodes = self.db.get_episodes_by_course(course_id)
+        stages = self.db.get_episode_stages(course_id)
+        summarized = sum(1 for episode in episodes if 'summarized' in stages.get(episode['id'], {}))
+        self.db.update_course_progress(course_id, len(episodes), summarized)
+
+    def _valid_checkpoint(self, job, stage):
+        checkpoint = job.get('checkpoints', {}).get(stage)
+        if not checkpoint or not checkpoint['artifact_path'] or not os.path.exists(checkpoint['artifact_path']):
+            return None
+        if checkpoint['checksum'] and file_sha256(checkpoint['artifact_path']) != checkpoint['checksum']:
+            return None
+        return checkpoint
+
+    def _pipeline_convert(self, job, audio_output_dir):
+        checkpoint = self._valid_checkpoint(job, 'converted')
+        if checkpoint:
+            job['resumed'].add('convert')
+            job.update(audio_path=checkpoint['artifact_path'], audio_checksum=file_sha256(checkpoint['artifact_path']))
+            return job
+
+        success, audio_path, media_info, _ = self._convert_file_job(job, audio_output_dir)
+        if not success:
+            return None
+        job.update(audio_path=str(audio_path), media_info=media_info, audio_checksum=file_sha256(audio_path))
+        return job
+
+    def _pipeline_transcribe(self, job, transcription_output_dir):
+        audio_path = Path(job['audio_path'])
+        transcription_path = transcription_output_dir / f"{audio_path.stem}.txt"
+        checkpoint = self._valid_checkpoint(job, 'transcribed')
+        if checkpoint:
+            job['resumed'].add('transcribe')
+            with open(checkpoint['artifact_path'], 'r', encoding='utf-8') as f:
+                transcription_text = f.read()
+        else:
+            # Duração medida na conversão ou gravada no episódio (quando a conversão foi retomada)
+            duration = job.get('media_info', {}).get('duration') or job.get('duration')
+            result = self.ai_service.transcribe_audio(str(self._transcription_source(audio_path)), with_segments=True,
+                                                      duration=duration)
+            if not result:
+                return None
+            transcription_text, segments = result
+            if not transcription_text:
+                return None
+            with open(transcription_path, 'w', encoding='utf-8') as f:
+                f.write(transcription_text)
+            self._save_segments(transcription_path, segments)
+            self._discard_speech_derivative(audio_path)
+        job.update(transcription_path=str(transcription_path), transcription_text=transcription_text,
+                   transcription_checksum=file_sha256(transcription_path))
+        return job
+
+    def _pipeline_summarize(self, job, summary_output_dir, course_id):
+        summary_path = summary_output_dir / f"{Path(job['audio_path']).stem}.md"
+        checkpoint = self._valid_checkpoint(job, 'summarized')
+        if checkpoint:
+            job['resumed'].add('summarize')
+            with open(checkpoint['artifact_path'], 'r', encoding='utf-8') as f:
+                summary_text = f.read()
+        else:
+            summary_text = self.ai_service.generate_summary(job['transcription_text'], 'resumo_detalhado', output_path=summary_path,
+                                                           course_id=course_id)
+            if not summary_text:
+                return None
+        job.update(summary_path=str(summary_path), summary_text=summary_text, summary_checksum=file_sha256(summary_path))
+        return job
+
+    def _record_pipeline_checkpoints(self, course_id, records):
+        # records: lista de (etapa, job) na ordem em que terminaram. Episódios novos são
+        # registrados primeiro, em lote, para que as etapas seguintes já tenham episode_id.
+        new_jobs = [job for stage, job in records if stage == 'convert' and not job.get('episode_id')]
+        episode_ids = self.db.create_episodes(course_id, [
+            self._converted_episode(job, Path(job['audio_path']), job['media_info']) for job in new_jobs
+        ])
+        for job, episode_id in zip(new_jobs, episode_ids):
+            job['episode_id'] = episode_id
+
+        checkpoints = []
+        texts = []
+        for stage, job in records:
+            if stage == 'convert':
+                checkpoints.append((job['episode_id'], 'converted', job['audio_path'], job['audio_checksum']))
+            elif stage == 'transcribe':
+                checkpoints.append((job['episode_id'], 'transcribed', job['transcription_path'], job['transcription_checksum']))
+                texts.append((job['episode_id'], job['transcription_text'], None))
+            elif stage == 'summarize':
+                checkpoints.append((job['episode_id'], 'summarized', job['summary_path'], job['summary_checksum']))
+                texts.append((job['episode_id'], None, job['summary_text']))
+        self.db.mark_episode_stages(checkpoints)
+        self.db.update_episode_texts(texts)
+        for stage, job in records:
+            if stage == 'summarize':
+                job.pop('transcription_text', None) # Liberar memória do texto já resumido
+                job.pop('summary_text', None)
+
+    def _probe_sources(self, course_files):
+        # Lê codec e bitrate das origens em lote, antes da conversão, para decidir pela cópia direta
+        if self.db.get_setting('audio_stream_copy', 'true') != 'true':
+            return course_files
+        pending = [file_info for file_info in course_files if 'converted' not in file_info.get('checkpoints', {})]
+        if not pending:
+            return course_files
+        source_info = self.audio_service.probe_media([file_info['full_path'] for file_info in pending])
+        return [
+            dict(file_info, source_info=source_info.get(str(file_info['full_path'])))
+            if 'converted' not in file_info.get('checkpoints', {}) else file_info
+            for file_info in course_files
+        ]
+
+    def _convert_file_job(self, file_info, audio_output_dir):
+        video_path = Path(file_info['full_path'])
+        copy_suffix = self.audio_service.stream_copy_suffix(file_info.get('source_info'))
+        audio_path = audio_output_dir / Path(file_info['relative_path']).with_suffix(copy_suffix or ".mp3")
+        audio_path.parent.mkdir(parents=True, exist_ok=True)
+
+        start_time = time.monotonic()
+        mode = 'copy' if copy_suffix else 'transcode'
+        success, media_info = self.convert_video_to_audio(str(video_path), str(audio_path), mode)
+        return success, audio_path, media_info, time.monotonic() - start_time
+
+    def cancel_conversions(self):
+        self._cancel_conversions.set()
+        with self._conversions_lock:
+            processes = list(self._active_conversions)
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def convert_video_to_audio(self, video_path, audio_path, mode='transcode'):
+        if mode == 'copy':
+            # Áudio da origem já compatível: extrair sem recodificar (limitado pelo disco, não pela CPU)
+            audio_args = ["-map", "0:a:0", "-c:a", "copy"]
+            cache_params = {'mode': 'copy'}
+        else:
+            audio_args = [
+                "-ar", AUDIO_SETTINGS['sample_rate'], # Audio sample rate
+                "-ac", AUDIO_SETTINGS['channels'], # Stereo
+                "-b:a", AUDIO_SETTINGS['bitrate'], # Audio bitrate
+            ]
+            cache_params = AUDIO_SETTINGS
+        speech_path = self._speech_path(audio_path)
         command = [
             "ffmpeg",
             "-i", video_path,
             "-vn", # No video
-            "-ar", "44100", # Audio sample rate
-            "-ac", "2", # Stereo
-            "-b:a", "128k", # Audio bitrate
-            audio_path
+            *audio_args,
+            "-y", # Sobrescrever saída parcial de execuções anteriores
+            *PROGRESS_ARGS, # Duração e formato saem da própria conversão, sem ffprobe depois
+            audio_path,
+            # Segunda saída na mesma execução: derivado de fala para a transcrição
+            *self.audio_service.speech_args(), str(speech_path)
         ]
+        if self._cancel_conversions.is_set():
+            return False, None
+
+        suffix = Path(audio_path).suffix
+        cache_key = self.artifact_cache.make_file_key('audio', video_path, **cache_params)
+        speech_key = self.artifact_cache.make_file_key('speech', video_path, **SPEECH_SETTINGS)
+        if self.artifact_cache.get_file(cache_key, audio_path, suffix):
+            media_info = self.artifact_cache.get_metadata(cache_key)
+            if not media_info:
+                # Artefato anterior aos metadados: ler o cabeçalho uma vez e guardar junto
+                media_info = self.audio_service.probe_media([audio_path]).get(str(audio_path), {'duration': 0.0, 'bitrate': None, 'codec': None, 'channels': None})
+                media_info.pop('file_size', None)
+                self.artifact_cache.put_metadata(cache_key, media_info)
+            if not self.artifact_cache.get_file(speech_key, speech_path, ".ogg"):
+                # Áudio em cache sem o derivado de fala: gerar a partir do áudio, menor que o vídeo
+                command = ["ffmpeg", "-i", audio_path, *self.audio_service.speech_args(), "-y", str(speech_path)]
+                if not self._run_conversion(command, audio_path, [speech_path])[0]:
+                    return False, None
+                self.artifact_cache.put_file(speech_key, speech_path, ".ogg")
+            return True, dict(media_info, file_size=os.path.getsize(audio_path), conversion_mode=mode)
+
+        ok, progress, stderr = self._run_conversion(command, video_path, [audio_path, speech_path])
+        if not ok:
+            return False, None
+
+        media_info = self.audio_service.parse_media_info(stderr.decode(errors='replace'), progress.decode(errors='replace'))
+        self.artifact_cache.put_file(cache_key, audio_path, suffix)
+        self.artifact_cache.put_metadata(cache_key, media_info)
+        self.artifact_cache.put_file(speech_key, speech_path, ".ogg")
+        return True, dict(media_info, file_size=os.path.getsize(audio_path), conversion_mode=mode)
+
+    def _run_conversion(self, command, source_path, output_paths):
+        # O destino pode ser um hard link para um artefato do cache: remover antes de
+        # o ffmpeg sobrescrever, para não corromper o conteúdo armazenado
+        for output_path in output_paths:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self._conversions_lock:
+            self._active_conversions.add(process)
         try:
-            subprocess.run(command, check=True, capture_output=True)
-            duration, file_size = self._get_audio_info(audio_path)
-            return True, duration, file_size
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao converter {video_path}: {e.stderr.decode()}")
-            return False, 0, 0
-
-    def _get_audio_info(self, audio_path):
-        try:
-            # Obter duração
-            cmd_duration = [
-                "ffprobe",
-                "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                audio_path
-            ]
-            duration_str = subprocess.check_output(cmd_duration, stderr=subprocess.STDOUT).decode().strip()
-            duration = int(float(duration_str)) if duration_str else 0
-
-            # Obter tamanho do arquivo
-            file_size = os.path.getsize(audio_path)
-            
-            return duration, file_size
-        except Exception as e:
-            print(f"Erro ao obter informações do áudio {audio_path}: {e}")
-            return 0, 0
+            progress, stderr = process.communicate()
+        finally:
+            with self._conversions_lock:
+                self._active_conversions.discard(process)
+
+        if self._cancel_conversions.is_set():
+            # Conversão interrompida: remover arquivos incompletos
+            for output_path in output_paths:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            return False, progress, stderr
+        if process.returncode != 0:
+            print(f"Erro ao converter {source_path}: {stderr.decode(errors='replace')}")
+            return False, progress, stderr
+        return True, progress, stderr
+
+    def _speech_path(self, audio_path):
+        # Derivado de fala fica ao lado do áudio do episódio: aula.mp3 -> aula.speech.ogg
+        return Path(audio_path).with_suffix(".speech.ogg")
+
+    def _transcription_source(self, audio_path):
+        # Whisper recebe o derivado de fala quando existe (5-8x menos bytes que o MP3 de podcast)
+        speech_path = self._speech_path(audio_path)
+        return speech_path if speech_path.exists() else Path(audio_path)
+
+    def _discard_speech_derivative(self, audio_path):
+        # Sem manter arquivos individuais, o derivado de fala só vive até a transcrição
+        if self.db.get_setting('keep_individual_files', 'true') == 'false':
+            speech_path = self._speech_path(audio_path)
+            if speech_path.exists():
+                speech_path.unlink()
+
+    def _get_course_duration(self, course_name):
+        # Duração do áudio unificado: fim do último capítulo ou, sem ele, soma das durações dos episódios
+        sidecar = self.audio_service.load_chapters(self.output_base_dir / course_name / "final" / f"{course_name}.mp3")
+        if sidecar and sidecar['chapters']:
+            return int(round(sidecar['chapters'][-1]['end_ms'] / 1000))
+        course = self.db.get_course(course_name)
+        if not course:
+            return 0
+        return int(round(sum(episode['duration'] or 0 for episode in self.db.get_episodes_by_course(course['id']))))
 
     def _generate_unified_summary(self, course_id, output_path):
         print(f"  Gerando resumo unificado em {output_path}...")
@@ -348,35 +919,20 @@ class CourseService:
             print(f"❌ Curso com ID {course_id} não encontrado.")
             return False
 
-        episodes = self.db.get_episodes_by_course(course_id)
-        audio_files = [episode['audio_path'] for episode in episodes if episode['audio_path']]
+        episodes = [episode for episode in self.db.get_episodes_by_course(course_id) if episode['audio_path']]
 
-        if not audio_files:
+        if not episodes:
             print("    ⚠️ Nenhum arquivo de áudio encontrado para unificação.")
             return False
 
-        # Criar um arquivo de lista para ffmpeg
-        list_file_path = output_path.parent / "audio_list.txt"
-        with open(list_file_path, 'w', encoding='utf-8') as f:
-            for audio_file in audio_files:
-                f.write(f"file '{audio_file}'\n")
-
-        command = [
-            "ffmpeg",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(list_file_path),
-            "-c", "copy",
-            str(output_path)
-        ]
-        try:
-            subprocess.run(command, check=True, capture_output=True)
-            print(f"  ✅ Áudio unificado criado: {output_path.name}")
-            os.remove(list_file_path) # Limpar arquivo de lista
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"    ❌ Erro ao unificar áudios: {e.stderr.decode()}")
+        # Frames MP3 copiados num único arquivo com capítulos ID3; episódios novos são
+        # anexados ao áudio existente quando os anteriores não mudaram
+        chapters = self.audio_service.build_unified_audio(output_path, course['name'], episodes, AUDIO_SETTINGS)
+        if chapters is None:
+            print("    ❌ Erro ao unificar áudios.")
             return False
+        print(f"  ✅ Áudio unificado criado: {output_path.name} ({len(chapters)} capítulo(s))")
+        return True
 
     def _generate_timestamps(self, course_id, output_path):
         print(f"  Gerando timestamps em {output_path}...")
@@ -386,9 +942,12 @@ class CourseService:
             return
 
         episodes = self.db.get_episodes_by_course(course_id)
+        # Offsets reais dos capítulos do áudio unificado; sem ele, soma das durações dos episódios
+        sidecar = self.audio_service.load_chapters(output_path.parent / f"{course['name']}.mp3")
+        chapter_starts = {chapter['episode_id']: chapter['start_ms'] / 1000 for chapter in sidecar['chapters']} if sidecar else {}
         
         timestamps_content = []
-        cumulative_duration = 0
+        cumulative_duration = 0.0
         current_path_parts = []
 
         for episode in episodes:
@@ -401,16 +960,18 @@ class CourseService:
                     timestamps_content.append(f"# {part}\n") # H1 para pastas
                     current_path_parts = relative_parts[:i+1]
             
-            # Formatar timestamp
-            hours = cumulative_duration // 3600
-            minutes = (cumulative_duration % 3600) // 60
-            seconds = cumulative_duration % 60
+            # Formatar timestamp (a soma é feita em float; arredonda só na exibição)
+            cumulative_duration = chapter_starts.get(episode['id'], cumulative_duration)
+            total_seconds = int(round(cumulative_duration))
+            hours = total_seconds // 3600
+            minutes = (total_seconds % 3600) // 60
+            seconds = total_seconds % 60
             timestamp_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
             timestamps_content.append(f"## {episode['title']}\n") # H2 para arquivos
             timestamps_content.append(f"{timestamp_str} {episode['title']}\n")
             
-            cumulative_duration += episode['duration']
+            cumulative_duration += episode['duration'] or 0
 
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write("".join(timestamps_content))
@@ -443,30 +1004,7 @@ class CourseService:
             course_id = course_id['id']
             print(f"ℹ️ Curso '{course_name}' já existe na database (ID: {course_id}). Adicionando áudios.")
 
-        audio_output_dir = self.output_base_dir / course_name / "audios"
-        audio_output_dir.mkdir(parents=True, exist_ok=True)
-
-        for file_info in course_files:
-            video_path = Path(file_info['full_path'])
-            relative_audio_path = Path(file_info['relative_path']).with_suffix(".mp3")
-            audio_path = audio_output_dir / relative_audio_path
-            audio_path.parent.mkdir(parents=True, exist_ok=True)
-
-            print(f"  Convertendo {video_path.name} para {audio_path.name}...")
-            success, duration, file_size = self._convert_video_to_audio(str(video_path), str(audio_path))
-            if success:
-                self.db.create_episode(
-                    course_id=course_id,
-                    filename=audio_path.name,
-                    title=video_path.stem,
-                    audio_path=str(audio_path),
-                    duration=duration,
-                    file_size=file_size
-                )
-                print(f"    ✅ Áudio convertido e episódio registrado: {audio_path.name}")
-            else:
-                print(f"    ❌ Falha na conversão de {video_path.name}")
-        
+        self._convert_course_files(course_id, course_name, course_files)
         print("Conversão de vídeo para áudio concluída.")
 
     def transcribe_audio_files(self):
@@ -492,26 +1030,87 @@ class CourseService:
         transcription_output_dir = self.output_base_dir / course_name / "transcriptions"
         transcription_output_dir.mkdir(parents=True, exist_ok=True)
 
+        pending = []
         for episode in episodes:
             audio_path = Path(episode['audio_path'])
-            transcription_path = transcription_output_dir / f"{audio_path.stem}.txt"
-
-            if transcription_path.exists():
+            if (transcription_output_dir / f"{audio_path.stem}.txt").exists():
                 print(f"  ⏭️ Transcrição já existe para {audio_path.name}, pulando.")
                 continue
+            pending.append(episode)
 
-            print(f"  Transcrevendo {audio_path.name}...")
-            transcription_text = self.ai_service.transcribe_audio(str(audio_path))
-            
-            if transcription_text:
-                with open(transcription_path, 'w', encoding='utf-8') as f:
-                    f.write(transcription_text)
-                # TODO: Atualizar episódio na database com o caminho da transcrição
-                print(f"    ✅ Áudio transcrito: {transcription_path.name}")
-            else:
-                print(f"    ❌ Falha na transcrição de {audio_path.name}")
+        if pending:
+            self._transcribe_episodes(pending, transcription_output_dir)
         print("Transcrição de áudio concluída.")
 
+    def _transcribe_episodes(self, episodes, transcription_output_dir):
+        workers = self.ai_service.get_concurrency_limit('whisper')
+        total = len(episodes)
+        print(f"  Transcrevendo {total} áudio(s) com até {workers} requisição(ões) simultânea(s)...")
+
+        completed = 0
+        failed = 0
+        audio_seconds = 0
+        start_time = time.monotonic()
+        self.ai_service.reset_vad_stats()
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {
+            executor.submit(self._transcribe_episode, episode, transcription_output_dir): episode
+            for episode in episodes
+        }
+        try:
+            # Resultados são gravados e registrados na ordem em que terminam, não na ordem de entrada
+            for future in as_completed(futures):
+                episode = futures[future]
+                completed += 1
+                transcription_text = future.result()
+                if transcription_text:
+                    transcription_path = transcription_output_dir / f"{Path(episode['audio_path']).stem}.txt"
+                    with self.db.transaction():
+                        self.db.update_episode_transcription(episode['id'], transcription_text)
+                        self.db.mark_episode_stage(episode['id'], 'transcribed', str(transcription_path), file_sha256(transcription_path))
+                    audio_seconds += episode['duration'] or 0
+                    print(f"    [{completed}/{total}] ✅ Áudio transcrito: {Path(episode['audio_path']).stem}.txt")
+                else:
+                    failed += 1
+                    print(f"    [{completed}/{total}] ❌ Falha na transcrição de {Path(episode['audio_path']).name}")
+        except KeyboardInterrupt:
+            print("\n⚠️ Cancelando transcrições pendentes...")
+            executor.shutdown(wait=True, cancel_futures=True)
+            return False
+        executor.shutdown(wait=True)
+
+        wall_minutes = (time.monotonic() - start_time) / 60
+        audio_minutes = audio_seconds / 60
+        throughput = audio_minutes / wall_minutes if wall_minutes > 0 else 0
+        print(f"  ⏱️ {audio_minutes:.1f} min de áudio transcritos em {wall_minutes:.1f} min ({throughput:.1f} min de áudio/min)")
+        self.artifact_cache.report()
+        self.ai_service.report_vad_savings()
+        self.ai_service.report_clients()
+        if failed:
+            print(f"  ⚠️ {failed} áudio(s) falharam na transcrição.")
+        return failed == 0
+
+    def _transcribe_episode(self, episode, transcription_output_dir):
+        audio_path = Path(episode['audio_path'])
+        result = self.ai_service.transcribe_audio(str(self._transcription_source(audio_path)), with_segments=True,
+                                                  duration=episode['duration'])
+        if not result or not result[0]:
+            return None
+        transcription_text, segments = result
+        transcription_path = transcription_output_dir / f"{audio_path.stem}.txt"
+        with open(transcription_path, 'w', encoding='utf-8') as f:
+            f.write(transcription_text)
+        self._save_segments(transcription_path, segments)
+        self._discard_speech_derivative(audio_path)
+        return transcription_text
+
+    def _save_segments(self, transcription_path, segments):
+        # Segmentos com tempos (em segundos) relativos ao áudio do episódio
+        if segments:
+            with open(Path(transcription_path).with_suffix(".segments.json"), 'w', encoding='utf-8') as f:
+                json.dump(segments, f, ensure_ascii=False)
+
     def generate_ai_course_summaries(self):
         print("🤖 Geração de Resumos com IA")
         print("=" * 50)
@@ -536,6 +1135,7 @@ class CourseService:
         summary_output_dir.mkdir(parents=True, exist_ok=True)
         transcription_output_dir = self.output_base_dir / course_name / "transcriptions"
 
+        pending = []
         for episode in episodes:
             audio_path = Path(episode['audio_path'])
             transcription_path = transcription_output_dir / f"{audio_path.stem}.txt"
@@ -548,22 +1148,110 @@ class CourseService:
             if not transcription_path.exists():
                 print(f"    ⚠️ Transcrição não encontrada para {episode['filename']}. Pulando resumo.")
                 continue
-            
-            with open(transcription_path, 'r', encoding='utf-8') as f:
-                transcription_text = f.read()
+            pending.append(episode)
 
-            print(f"  Gerando resumo para {episode['filename']}...")
-            summary_text = self.ai_service.generate_summary(transcription_text, 'resumo_detalhado')
-            
-            if summary_text:
-                with open(summary_path, 'w', encoding='utf-8') as f:
-                    f.write(summary_text)
-                # TODO: Atualizar episódio na database com o caminho do resumo
-                print(f"    ✅ Resumo gerado: {summary_path.name}")
-            else:
-                print(f"    ❌ Falha na geração do resumo para {episode['filename']}")
+        if pending:
+            self._summarize_episodes(pending, transcription_output_dir, summary_output_dir)
         print("Geração de resumos com IA concluída.")
 
+    def generate_batch_summaries(self):
+        print("📦 Resumos em Lote (API assíncrona)")
+        print("=" * 50)
+
+        # Lotes enviados antes (mesmo em execuções anteriores) são consultados primeiro
+        if self.db.get_open_summary_batches():
+            print("  Consultando lotes em andamento...")
+            self.batch_service.poll(wait=False)
+
+        course_names = self._select_courses()
+        jobs = []
+        for course_name in course_names:
+            course = self.db.get_course(course_name)
+            if not course:
+                print(f"❌ Curso '{course_name}' não encontrado.")
+                continue
+            summary_output_dir = self.output_base_dir / course_name / "summaries"
+            transcription_output_dir = self.output_base_dir / course_name / "transcriptions"
+            for episode in self.db.get_episodes_by_course(course['id']):
+                stem = Path(episode['audio_path']).stem
+                summary_path = summary_output_dir / f"{stem}.md"
+                transcription_path = transcription_output_dir / f"{stem}.txt"
+                if summary_path.exists() or not transcription_path.exists():
+                    continue
+                jobs.append({'episode_id': episode['id'], 'transcription_path': transcription_path, 'summary_path': summary_path})
+
+        if jobs:
+            self.batch_service.submit(jobs)
+        elif course_names:
+            print("  Nenhum resumo pendente nos cursos selecionados.")
+
+        if self.db.get_open_summary_batches():
+            wait = input("Aguardar a conclusão dos lotes agora? (s/n): ").strip().lower()
+            if wait == 's':
+                try:
+                    self.batch_service.poll(wait=True)
+                except KeyboardInterrupt:
+                    print("\n⏸️ Acompanhamento interrompido; os lotes continuam no provedor e serão consultados na próxima vez.")
+            else:
+                print("  Os resultados serão buscados na próxima vez que esta opção for aberta.")
+        self.ai_service.response_cache.report()
+        print("Resumos em lote concluídos.")
+
+    def _summarize_episodes(self, episodes, transcription_output_dir, summary_output_dir):
+        provider = self.ai_service.get_default_ai()
+        limits = self.ai_service.get_rate_limits(provider)
+        workers = limits['max_concurrent']
+        total = len(episodes)
+        print(f"  Gerando {total} resumo(s) com {provider}: até {workers} simultâneo(s), {limits['rpm'] or '∞'} RPM, {limits['tpm'] or '∞'} TPM...")
+
+        completed = 0
+        failed = 0
+        start_time = time.monotonic()
+
+        self.ai_service.reset_prompt_cache_stats()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {
+            executor.submit(self._summarize_episode, episode, transcription_output_dir, summary_output_dir): episode
+            for episode in episodes
+        }
+        try:
+            for future in as_completed(futures):
+                episode = futures[future]
+                completed += 1
+                summary_text = future.result()
+                if summary_text:
+                    summary_path = summary_output_dir / f"{Path(episode['audio_path']).stem}.md"
+                    with self.db.transaction():
+                        self.db.update_episode_summary(episode['id'], summary_text)
+                        self.db.mark_episode_stage(episode['id'], 'summarized', str(summary_path), file_sha256(summary_path))
+                    print(f"    [{completed}/{total}] ✅ Resumo gerado: {Path(episode['audio_path']).stem}.md")
+                else:
+                    failed += 1
+                    print(f"    [{completed}/{total}] ❌ Falha na geração do resumo para {episode['filename']}")
+        except KeyboardInterrupt:
+            print("\n⚠️ Cancelando resumos pendentes...")
+            executor.shutdown(wait=True, cancel_futures=True)
+            return False
+        executor.shutdown(wait=True)
+
+        print(f"  ⏱️ {completed - failed} resumo(s) gerados em {time.monotonic() - start_time:.1f}s")
+        self.artifact_cache.report()
+        self.ai_service.response_cache.report()
+        self.ai_service.report_prompt_cache()
+        self.ai_service.report_providers()
+        self.ai_service.report_clients()
+        if failed:
+            print(f"  ⚠️ {failed} resumo(s) falharam.")
+        return failed == 0
+
+    def _summarize_episode(self, episode, transcription_output_dir, summary_output_dir):
+        stem = Path(episode['audio_path']).stem
+        with open(transcription_output_dir / f"{stem}.txt", 'r', encoding='utf-8') as f:
+            transcription_text = f.read()
+
+        return self.ai_service.generate_summary(transcription_text, 'resumo_detalhado',
+                                                output_path=summary_output_dir / f"{stem}.md", course_id=episode['course_id'])
+
     def create_unified_audio(self):
         print("🎵 Criação de Áudio Unificado")
         print("=" * 50)
@@ -582,10 +1270,7 @@ class CourseService:
         final_output_dir.mkdir(parents=True, exist_ok=True)
         unified_audio_path = final_output_dir / f"{course_name}.mp3"
 
-        if unified_audio_path.exists():
-            print(f"  ⏭️ Áudio unificado já existe para {course_name}, pulando.")
-            return
-
+        # Um áudio unificado existente é reaproveitado: só episódios novos são anexados
         self._create_unified_audio(course_id, unified_audio_path)
         print("Criação de áudio unificado concluída.")
 
@@ -713,14 +1398,12 @@ class CourseService:
         drive_file_id = "PLACEHOLDER_DRIVE_FILE_ID"
         public_url = self.drive_service.get_direct_download_url(drive_file_id)
 
-        duration, file_size = self._get_audio_info(str(unified_audio_path))
-
         course_data_for_rss = {
             'title': course_name,
             'description': f"Resumo do curso {course_name}", # Placeholder
             'audio_url': public_url,
-            'file_size': file_size,
-            'duration': duration,
+            'file_size': os.path.getsize(unified_audio_path),
+            'duration': self._get_course_duration(course_name),
             'pub_date': datetime.now().strftime('%a, %d %b %Y %H:%M:%S %z'),
             'timestamps': [], # Placeholder
             'links': [] # Placeholder
@@ -753,12 +1436,62 @@ class CourseService:
         print(f"Total de episódios: {course['total_episodes']}")
         print(f"Episódios concluídos: {course['completed_episodes']}")
 
+        stages = self.db.get_episode_stages(course['id'])
+        print("\n--- Checkpoints por Etapa ---")
+        for stage in EPISODE_STAGES:
+            count = sum(1 for episode_stages in stages.values() if stage in episode_stages)
+            print(f"{stage}: {count}/{course['total_episodes']}")
+
         operations = self.db.get_operations_log(course['id'])
         if operations:
             print("\n--- Log de Operações ---")
             for op in operations:
                 print(f"[{op['completed_at']}] {op['operation_type']}: {op['status']}")
 
+    def search_course_content(self):
+        print("🔎 Busca em Transcrições e Resumos")
+        print("=" * 50)
+        indexed = self._index_episode_texts()
+        if indexed:
+            print(f"  📥 {indexed} episódio(s) com texto só em arquivo foram adicionados ao índice de busca.")
+
+        while True:
+            text = input("\nTermos da busca (Enter para voltar): ").strip()
+            if not text:
+                return
+            start_time = time.monotonic()
+            hits = self.db.search_episodes(text)
+            elapsed_ms = (time.monotonic() - start_time) * 1000
+            if not hits:
+                print(f"  Nenhum resultado para '{text}' ({elapsed_ms:.1f} ms).")
+                continue
+            for index, hit in enumerate(hits, 1):
+                print(f"  {index}. [{hit['course_name']}] {hit['title'] or hit['filename']}")
+                if hit['relative_path']:
+                    print(f"     {hit['relative_path']}")
+                print(f"     {' '.join(hit['snippet'].split())}")
+            print(f"  {len(hits)} resultado(s) em {elapsed_ms:.1f} ms")
+
+    def _index_episode_texts(self):
+        # Transcrições e resumos gerados antes do índice de busca existem só como arquivo: são
+        # lidos uma vez para o banco (os novos já entram no índice quando cada etapa termina)
+        texts = []
+        for episode in self.db.get_episodes_without_text():
+            stem = Path(episode['audio_path']).stem
+            course_dir = self.output_base_dir / episode['course_name']
+            transcription = summary = None
+            transcription_path = course_dir / "transcriptions" / f"{stem}.txt"
+            summary_path = course_dir / "summaries" / f"{stem}.md"
+            if episode['missing_transcription'] and transcription_path.exists():
+                transcription = transcription_path.read_text(encoding='utf-8')
+            if episode['missing_summary'] and summary_path.exists():
+                summary = summary_path.read_text(encoding='utf-8')
+            if transcription is not None or summary is not None:
+                texts.append((episode['id'], transcription, summary))
+        if texts:
+            self.db.update_episode_texts(texts)
+        return len(texts)
+
     def forget_course(self):
         print("🗑️ Esquecer Curso")
         print("=" * 50)
@@ -1,135 +1,388 @@
 import sqlite3
 import os
 import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
 
 # Configuração de logging para o DatabaseService
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 # logger = logging.getLogger(__name__)
 
+# Tempo (segundos) que uma conexão espera por um lock de outra thread/processo antes de falhar
+BUSY_TIMEOUT = 30
+# Intervalo mínimo (segundos) entre consultas ao contador de versão das configurações; nesse
+# meio tempo get_setting é só uma leitura de dicionário
+SETTINGS_REFRESH_SECONDS = 1.0
+
+
+# Migrações do schema, em ordem: (versão, descrição, comandos). Cada comando é um SQL ou
+# uma coluna (tabela, coluna, definição) adicionada com ALTER TABLE. As migrações antigas
+# usam IF NOT EXISTS e toleram colunas já existentes, porque bancos anteriores ao controle
+# de versão já têm parte do schema; novas migrações só precisam ir ao final da lista.
+MIGRATIONS = [
+    (1, "tabelas iniciais", [
+        """
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            source_path TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processing_stage TEXT DEFAULT 'not_started',
+            total_episodes INTEGER DEFAULT 0,
+            completed_episodes INTEGER DEFAULT 0,
+            drive_folder_id TEXT,
+            rss_generated BOOLEAN DEFAULT FALSE
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS episodes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER,
+            filename TEXT NOT NULL,
+            title TEXT,
+            audio_path TEXT,
+            transcription TEXT,
+            summary TEXT,
+            duration REAL,
+            file_size INTEGER,
+            drive_file_id TEXT,
+            processed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            relative_path TEXT,
+            FOREIGN KEY (course_id) REFERENCES courses (id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS operations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER,
+            operation_type TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            details TEXT,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses (id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS prompt_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER,
+            prompt_name TEXT NOT NULL,
+            prompt_content TEXT,
+            ai_service TEXT,
+            response_content TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses (id)
+        );
+        """,
+        ("episodes", "relative_path", "TEXT"),
+    ]),
+    (2, "checkpoints e ordem dos episódios", [
+        """
+        CREATE TABLE IF NOT EXISTS episode_stages (
+            episode_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            artifact_path TEXT,
+            checksum TEXT,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (episode_id, stage),
+            FOREIGN KEY (episode_id) REFERENCES episodes (id)
+        );
+        """,
+        ("episodes", "sort_order", "INTEGER DEFAULT 0"),
+    ]),
+    (3, "metadados de áudio dos episódios", [
+        ("episodes", "bitrate", "INTEGER"),
+        ("episodes", "codec", "TEXT"),
+        ("episodes", "channels", "INTEGER"),
+        ("episodes", "conversion_mode", "TEXT"),
+    ]),
+    (4, "cache de respostas de IA", [
+        """
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            model TEXT,
+            prompt_name TEXT,
+            prompt_hash TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            params TEXT,
+            response TEXT NOT NULL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            latency REAL,
+            size INTEGER,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    ]),
+    (5, "resumos em lote", [
+        """
+        CREATE TABLE IF NOT EXISTS summary_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            provider TEXT NOT NULL,
+            batch_id TEXT NOT NULL UNIQUE,
+            model TEXT,
+            prompt_name TEXT,
+            status TEXT DEFAULT 'submitted',
+            request_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS summary_batch_items (
+            batch_row_id INTEGER NOT NULL,
+            custom_id TEXT NOT NULL,
+            episode_id INTEGER NOT NULL,
+            summary_path TEXT NOT NULL,
+            cache_key TEXT,
+            status TEXT DEFAULT 'pending',
+            PRIMARY KEY (batch_row_id, custom_id),
+            FOREIGN KEY (batch_row_id) REFERENCES summary_batches (id),
+            FOREIGN KEY (episode_id) REFERENCES episodes (id)
+        );
+        """,
+    ]),
+    (6, "índices das consultas frequentes", [
+        # Episódios do curso já na ordem do scan, sem ordenação temporária
+        "CREATE INDEX IF NOT EXISTS idx_episodes_course_order ON episodes (course_id, sort_order, id)",
+        # Episódio pelo caminho relativo dentro do curso (a chave dos itens do manifesto)
+        "CREATE INDEX IF NOT EXISTS idx_episodes_course_path ON episodes (course_id, relative_path)",
+        "CREATE INDEX IF NOT EXISTS idx_operations_course_created ON operations (course_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_prompt_usage_course ON prompt_usage (course_id)",
+        "CREATE INDEX IF NOT EXISTS idx_summary_batch_items_episode ON summary_batch_items (episode_id)",
+    ]),
+    (7, "busca textual em transcrições e resumos", [
+        # Índice FTS5 sobre as colunas de episodes (sem duplicar o texto), mantido por triggers a
+        # cada transcrição ou resumo gravado. remove_diacritics: "aula" também encontra "aulá".
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS episode_search USING fts5(
+            title, transcription, summary,
+            content='episodes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS episodes_search_insert AFTER INSERT ON episodes BEGIN
+            INSERT INTO episode_search (rowid, title, transcription, summary) VALUES (new.id, new.title, new.transcription, new.summary);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS episodes_search_delete AFTER DELETE ON episodes BEGIN
+            INSERT INTO episode_search (episode_search, rowid, title, transcription, summary)
+            VALUES ('delete', old.id, old.title, old.transcription, old.summary);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS episodes_search_update AFTER UPDATE OF title, transcription, summary ON episodes BEGIN
+            INSERT INTO episode_search (episode_search, rowid, title, transcription, summary)
+            VALUES ('delete', old.id, old.title, old.transcription, old.summary);
+            INSERT INTO episode_search (rowid, title, transcription, summary) VALUES (new.id, new.title, new.transcription, new.summary);
+        END;
+        """,
+        "INSERT INTO episode_search (episode_search) VALUES ('rebuild')",
+    ]),
+    (8, "versão das configurações", [
+        # Contador incrementado a cada escrita em settings (por qualquer processo): o cache de
+        # configurações em memória só é recarregado quando ele muda
+        "CREATE TABLE IF NOT EXISTS settings_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)",
+        "CREATE TRIGGER IF NOT EXISTS settings_version_insert AFTER INSERT ON settings BEGIN UPDATE settings_version SET version = version + 1; END",
+        "CREATE TRIGGER IF NOT EXISTS settings_version_update AFTER UPDATE ON settings BEGIN UPDATE settings_version SET version = version + 1; END",
+        "CREATE TRIGGER IF NOT EXISTS settings_version_delete AFTER DELETE ON settings BEGIN UPDATE settings_version SET version = version + 1; END",
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+class _Connection(sqlite3.Connection):
+    # Subclasse só para aceitar weakref: a conexão de leitura de uma thread encerrada é
+    # coletada (e fechada) junto com o threading.local, sem ficar presa na lista de leitores
+    pass
+
+
+# Acesso concorrente: o banco roda em modo WAL, então leituras não bloqueiam a escrita nem
+# umas às outras. Cada thread lê pela sua própria conexão; todas as escritas passam por uma
+# única conexão de escrita, serializada por self._lock (sem disputa de lock no SQLite entre
+# threads do processo; outros processos esperam até BUSY_TIMEOUT).
 class DatabaseService:
     def __init__(self, db_path="data/neurodeamon.db"):
         self.db_path = db_path
-        self.conn = None
+        self.conn = None # Conexão de escrita
+        self._lock = threading.RLock() # Serializa as escritas (e transações) na conexão de escrita
+        self._local = threading.local()
+        self._readers = weakref.WeakSet()
+        self._readers_lock = threading.Lock()
+        self._transaction_depth = 0 # Só alterado por quem segura self._lock
+        self._transaction_owner = None
+        self._settings = None # Cópia em memória da tabela settings (trocada inteira, nunca alterada no lugar)
+        self._settings_version = None
+        self._settings_checked = 0.0
+        self._settings_lock = threading.Lock()
         self.connect()
         self.create_tables()
 
     def connect(self):
         try:
-            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row # Permite acessar colunas por nome
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.conn = self._open_connection()
+            self.conn.execute("PRAGMA journal_mode=WAL")
             # logger.info(f"Conectado ao banco de dados: {self.db_path}")
         except sqlite3.Error as e:
             # logger.error(f"Erro ao conectar ao banco de dados: {e}")
             raise
 
+    def _open_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False, factory=_Connection)
+        conn.row_factory = sqlite3.Row # Permite acessar colunas por nome
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT * 1000}")
+        conn.execute("PRAGMA synchronous = NORMAL") # Seguro em WAL e sem fsync a cada commit
+        return conn
+
+    def _reader(self):
+        # Conexão de leitura da thread atual, criada no primeiro uso
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.add(conn)
+        return conn
+
+    def close_readers(self):
+        # Fecha as conexões de leitura (reabertas sob demanda); trocar o journal_mode exige que
+        # a conexão de escrita seja a única aberta
+        with self._readers_lock:
+            for conn in list(self._readers):
+                conn.close()
+            self._readers = weakref.WeakSet()
+        self._local = threading.local()
+
     def close(self):
+        self.close_readers()
         if self.conn:
             self.conn.close()
             # logger.info("Conexão com o banco de dados fechada.")
 
+    def _is_read(self, query):
+        return query.lstrip()[:6].upper() in ("SELECT", "PRAGMA")
+
+    def _in_transaction(self):
+        return self._transaction_owner == threading.get_ident()
+
+    @contextmanager
+    def transaction(self):
+        # Unidade de trabalho: as escritas do bloco são confirmadas num único commit (ou
+        # desfeitas juntas em caso de erro). Blocos aninhados participam da transação externa.
+        with self._lock:
+            if self._transaction_depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._transaction_owner = threading.get_ident()
+            self._transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._transaction_owner = None
+                    self.conn.rollback()
+                    self._settings = None # Pode conter configurações gravadas na transação desfeita
+                raise
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._transaction_owner = None
+                self.conn.commit()
+
+    def _execute_many(self, query, rows):
+        with self.transaction():
+            self.conn.executemany(query, rows)
+
     def _execute_query(self, query, params=(), fetchone=False, fetchall=False, commit=False):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query, params)
-            if commit:
-                self.conn.commit()
-            if fetchone:
-                return cursor.fetchone()
-            if fetchall:
-                return cursor.fetchall()
-            return cursor.lastrowid
+            # Dentro de uma transação, a thread dona lê pela conexão de escrita para ver as próprias escritas
+            if not commit and self._is_read(query) and not self._in_transaction():
+                # Cursor fechado logo após a leitura para não prender o snapshot do WAL
+                cursor = self._reader().execute(query, params)
+                try:
+                    if fetchone:
+                        return cursor.fetchone()
+                    if fetchall:
+                        return cursor.fetchall()
+                    return cursor.lastrowid
+                finally:
+                    cursor.close()
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute(query, params)
+                if commit and not self._in_transaction():
+                    self.conn.commit()
+                if fetchone:
+                    return cursor.fetchone()
+                if fetchall:
+                    return cursor.fetchall()
+                return cursor.lastrowid
         except sqlite3.Error as e:
             # logger.error(f"Erro ao executar query: {query} com params {params} - {e}")
             raise
 
     def create_tables(self):
-        # logger.info("Verificando e criando tabelas do banco de dados...")
-        queries = [
-            """
-            CREATE TABLE IF NOT EXISTS courses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                source_path TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                processing_stage TEXT DEFAULT 'not_started',
-                total_episodes INTEGER DEFAULT 0,
-                completed_episodes INTEGER DEFAULT 0,
-                drive_folder_id TEXT,
-                rss_generated BOOLEAN DEFAULT FALSE
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS episodes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                course_id INTEGER,
-                filename TEXT NOT NULL,
-                title TEXT,
-                audio_path TEXT,
-                transcription TEXT,
-                summary TEXT,
-                duration INTEGER,
-                file_size INTEGER,
-                drive_file_id TEXT,
-                processed BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                relative_path TEXT,
-                FOREIGN KEY (course_id) REFERENCES courses (id)
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS operations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                course_id INTEGER,
-                operation_type TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                details TEXT,
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                FOREIGN KEY (course_id) REFERENCES courses (id)
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS prompt_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                course_id INTEGER,
-                prompt_name TEXT NOT NULL,
-                prompt_content TEXT,
-                ai_service TEXT,
-                response_content TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (course_id) REFERENCES courses (id)
-            );
-            """
-        ]
-        for query in queries:
-            self._execute_query(query, commit=True)
+        # Aplica as migrações pendentes. Com o schema em dia, a inicialização faz só uma leitura.
+        if self.get_schema_version() >= SCHEMA_VERSION:
+            return
+        # logger.info("Atualizando o schema do banco de dados...")
+        for version, description, commands in MIGRATIONS:
+            with self.transaction():
+                # Relido dentro da transação: outro processo pode ter migrado nesse meio tempo
+                self._execute_query(
+                    "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+                    commit=True
+                )
+                if version <= self.get_schema_version():
+                    continue
+                for command in commands:
+                    if isinstance(command, tuple):
+                        self._add_column_if_missing(*command)
+                    else:
+                        self._execute_query(command, commit=True)
+                self._execute_query("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description), commit=True)
+                # logger.info(f"Migração {version} aplicada: {description}")
+
+    def get_schema_version(self):
+        try:
+            row = self._execute_query("SELECT MAX(version) AS version FROM schema_version", fetchone=True)
+        except sqlite3.OperationalError:
+            return 0 # Banco novo ou anterior ao controle de versão
+        return row['version'] or 0
 
-        # Add relative_path column if it doesn't exist
+    def _add_column_if_missing(self, table, column, definition):
         try:
-            self._execute_query("ALTER TABLE episodes ADD COLUMN relative_path TEXT;", commit=True)
-            # logger.info("Coluna 'relative_path' adicionada à tabela 'episodes'.")
+            self._execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition};", commit=True)
+            # logger.info(f"Coluna '{column}' adicionada à tabela '{table}'.")
         except sqlite3.OperationalError as e:
             if "duplicate column name" in str(e).lower():
-                # logger.info("Coluna 'relative_path' já existe na tabela 'episodes'.")
+                # logger.info(f"Coluna '{column}' já existe na tabela '{table}'.")
                 pass # Column already exists, no action needed
             else:
-                # logger.error(f"Erro ao adicionar coluna 'relative_path': {e}")
+                # logger.error(f"Erro ao adicionar coluna '{column}': {e}")
                 raise # Re-raise other operational errors
 
-        # logger.info("Tabelas verificadas/criadas com sucesso.")
-
     def create_course(self, name, source_path):
         # logger.info(f"Criando novo curso: {name}")
         query = "INSERT INTO courses (name, source_path) VALUES (?, ?)"
@@ -159,14 +412,79 @@ class DatabaseService:
         query = "UPDATE courses SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
         self._execute_query(query, (status, course_id), commit=True)
 
-    def create_episode(self, course_id, filename, title, audio_path=None, duration=0, file_size=0, relative_path=None):
+    def create_episode(self, course_id, filename, title, audio_path=None, duration=0, file_size=0, relative_path=None, sort_order=0,
+                       bitrate=None, codec=None, channels=None, conversion_mode=None):
         # logger.info(f"Criando episódio '{filename}' para o curso {course_id}")
-        query = "INSERT INTO episodes (course_id, filename, title, audio_path, duration, file_size, relative_path) VALUES (?, ?, ?, ?, ?, ?, ?)"
-        return self._execute_query(query, (course_id, filename, title, audio_path, duration, file_size, relative_path), commit=True)
+        query = "INSERT INTO episodes (course_id, filename, title, audio_path, duration, file_size, relative_path, sort_order, bitrate, codec, channels, conversion_mode) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        return self._execute_query(query, (course_id, filename, title, audio_path, duration, file_size, relative_path, sort_order,
+                                           bitrate, codec, channels, conversion_mode), commit=True)
+
+    def create_episodes(self, course_id, episodes):
+        # Registra vários episódios numa única transação; episodes é uma lista de dicts com os
+        # argumentos de create_episode. Retorna os ids na mesma ordem.
+        if not episodes:
+            return []
+        query = "INSERT INTO episodes (course_id, filename, title, audio_path, duration, file_size, relative_path, sort_order, bitrate, codec, channels, conversion_mode) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        rows = [
+            (course_id, episode['filename'], episode['title'], episode.get('audio_path'), episode.get('duration', 0),
+             episode.get('file_size', 0), episode.get('relative_path'), episode.get('sort_order', 0), episode.get('bitrate'),
+             episode.get('codec'), episode.get('channels'), episode.get('conversion_mode'))
+            for episode in episodes
+        ]
+        with self.transaction():
+            self.conn.executemany(query, rows)
+            # Com AUTOINCREMENT e o escritor exclusivo, os ids de um mesmo lote são consecutivos
+            last_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def update_episode_transcription(self, episode_id, transcription):
+        # logger.info(f"Atualizando transcrição do episódio {episode_id}")
+        query = "UPDATE episodes SET transcription = ? WHERE id = ?"
+        self._execute_query(query, (transcription, episode_id), commit=True)
+
+    def update_episode_summary(self, episode_id, summary):
+        # logger.info(f"Atualizando resumo do episódio {episode_id}")
+        query = "UPDATE episodes SET summary = ? WHERE id = ?"
+        self._execute_query(query, (summary, episode_id), commit=True)
+
+    def update_episode_sort_orders(self, sort_orders):
+        # sort_orders: lista de (episode_id, sort_order)
+        query = "UPDATE episodes SET sort_order = ? WHERE id = ?"
+        self._execute_many(query, [(sort_order, episode_id) for episode_id, sort_order in sort_orders])
+
+    def delete_episode(self, episode_id):
+        # logger.info(f"Removendo episódio {episode_id}")
+        with self.transaction():
+            self._execute_query("DELETE FROM episode_stages WHERE episode_id = ?", (episode_id,), commit=True)
+            self._execute_query("DELETE FROM episodes WHERE id = ?", (episode_id,), commit=True)
+
+    def mark_episode_stage(self, episode_id, stage, artifact_path=None, checksum=None):
+        # logger.info(f"Checkpoint do episódio {episode_id}: {stage}")
+        query = "INSERT OR REPLACE INTO episode_stages (episode_id, stage, artifact_path, checksum, completed_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)"
+        self._execute_query(query, (episode_id, stage, artifact_path, checksum), commit=True)
+
+    def mark_episode_stages(self, checkpoints):
+        # checkpoints: lista de (episode_id, stage, artifact_path, checksum)
+        query = "INSERT OR REPLACE INTO episode_stages (episode_id, stage, artifact_path, checksum, completed_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)"
+        self._execute_many(query, checkpoints)
+
+    def get_episode_stages(self, course_id):
+        # logger.info(f"Buscando checkpoints dos episódios do curso {course_id}")
+        query = """
+            SELECT s.* FROM episode_stages s
+            JOIN episodes e ON e.id = s.episode_id
+            WHERE e.course_id = ?
+        """
+        stages = {}
+        for row in self._execute_query(query, (course_id,), fetchall=True):
+            stages.setdefault(row['episode_id'], {})[row['stage']] = row
+        return stages
 
     def get_episodes_by_course(self, course_id):
         # logger.info(f"Buscando episódios para o curso {course_id}")
-        query = "SELECT * FROM episodes WHERE course_id = ? ORDER BY created_at ASC"
+        # sort_order preserva a ordem hierárquica do scan mesmo quando os episódios
+        # são registrados fora de ordem (conversões paralelas)
+        query = "SELECT * FROM episodes WHERE course_id = ? ORDER BY sort_order ASC, id ASC"
         return self._execute_query(query, (course_id,), fetchall=True)
 
     def log_operation(self, course_id, operation_type, details=None, error_message=None, status='pending'):
@@ -174,6 +492,11 @@ class DatabaseService:
         query = "INSERT INTO operations (course_id, operation_type, details, error_message, status) VALUES (?, ?, ?, ?, ?)"
         return self._execute_query(query, (course_id, operation_type, details, error_message, status), commit=True)
 
+    def log_operations(self, operations):
+        # operations: lista de (course_id, operation_type, details, error_message, status)
+        query = "INSERT INTO operations (course_id, operation_type, details, error_message, status) VALUES (?, ?, ?, ?, ?)"
+        self._execute_many(query, operations)
+
     def get_operations_log(self, course_id):
         # logger.info(f"Buscando logs de operações para o curso {course_id}")
         query = "SELECT * FROM operations WHERE course_id = ? ORDER BY created_at DESC"
@@ -182,13 +505,42 @@ class DatabaseService:
     def save_setting(self, key, value):
         # logger.info(f"Salvando configuração: {key} = {value}")
         query = "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)"
-        self._execute_query(query, (key, value), commit=True)
+        with self.transaction():
+            self._execute_query(query, (key, value), commit=True)
+            version = self._execute_query("SELECT version FROM settings_version", fetchone=True)['version']
+        # Write-through: o cache recebe o valor sem recarregar a tabela. Se o contador pulou mais
+        # de um, outro processo (ou thread) também gravou e o cache é recarregado na próxima leitura.
+        with self._settings_lock:
+            if self._settings is None:
+                return
+            if version == self._settings_version + 1:
+                settings = dict(self._settings)
+                settings[key] = value
+                self._settings = settings
+                self._settings_version = version
+            else:
+                self._settings = None
 
     def get_setting(self, key, default=None):
         # logger.info(f"Buscando configuração: {key}")
-        query = "SELECT value FROM settings WHERE key = ?"
-        result = self._execute_query(query, (key,), fetchone=True)
-        return result['value'] if result else default
+        settings = self._cached_settings()
+        return settings[key] if key in settings else default
+
+    def _cached_settings(self):
+        # Configurações em memória; o contador de versão no banco é conferido no máximo a cada
+        # SETTINGS_REFRESH_SECONDS para enxergar gravações de outros processos
+        settings = self._settings
+        if settings is not None and time.monotonic() - self._settings_checked < SETTINGS_REFRESH_SECONDS:
+            return settings
+        with self._settings_lock:
+            version = self._execute_query("SELECT version FROM settings_version", fetchone=True)['version']
+            if self._settings is None or version != self._settings_version:
+                # Versão lida antes das linhas: uma gravação no meio só causa uma recarga a mais
+                rows = self._execute_query("SELECT key, value FROM settings", fetchall=True)
+                self._settings = {row['key']: row['value'] for row in rows}
+                self._settings_version = version
+            self._settings_checked = time.monotonic()
+            return self._settings
 
     def course_exists(self, name):
         # logger.info(f"Verificando se o curso '{name}' existe.")
@@ -196,6 +548,11 @@ class DatabaseService:
         result = self._execute_query(query, (name,), fetchone=True)
         return result is not None
 
+    def update_course_progress(self, course_id, total_episodes, completed_episodes):
+        # logger.info(f"Atualizando progresso do curso {course_id}: {completed_episodes}/{total_episodes}")
+        query = "UPDATE courses SET total_episodes = ?, completed_episodes = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+        self._execute_query(query, (total_episodes, completed_episodes, course_id), commit=True)
+
     def mark_course_completed(self, course_id):
         # logger.info(f"Marcando curso {course_id} como concluído.")
         query = "UPDATE courses SET status = 'completed', updated_at = CURRENT_TIMESTAMP WHERE id = ?"
@@ -219,20 +576,150 @@ class DatabaseService:
 
     def clear_all_tables(self):
         # logger.warning("Limpando todas as tabelas do banco de dados.")
-        tables = ['prompt_usage', 'operations', 'episodes', 'courses', 'settings']
-        for table in tables:
-            self._execute_query(f"DELETE FROM {table}", commit=True)
+        tables = ['prompt_usage', 'llm_response_cache', 'summary_batch_items', 'summary_batches', 'operations', 'episode_stages',
+                  'episodes', 'courses', 'settings']
+        with self.transaction():
+            for table in tables:
+                self._execute_query(f"DELETE FROM {table}", commit=True)
+        self._settings = None
         # logger.info("Todas as tabelas foram limpas.")
 
     def forget_course(self, course_id):
         # logger.info(f"Removendo curso {course_id} e seus dados associados.")
-        self._execute_query("DELETE FROM prompt_usage WHERE course_id = ?", (course_id,), commit=True)
-        self._execute_query("DELETE FROM operations WHERE course_id = ?", (course_id,), commit=True)
-        self._execute_query("DELETE FROM episodes WHERE course_id = ?", (course_id,), commit=True)
-        self._execute_query("DELETE FROM courses WHERE id = ?", (course_id,), commit=True)
+        with self.transaction():
+            self._execute_query("DELETE FROM prompt_usage WHERE course_id = ?", (course_id,), commit=True)
+            self._execute_query("DELETE FROM operations WHERE course_id = ?", (course_id,), commit=True)
+            self._execute_query("DELETE FROM episode_stages WHERE episode_id IN (SELECT id FROM episodes WHERE course_id = ?)", (course_id,), commit=True)
+            self._execute_query("DELETE FROM summary_batch_items WHERE episode_id IN (SELECT id FROM episodes WHERE course_id = ?)", (course_id,), commit=True)
+            self._execute_query("DELETE FROM episodes WHERE course_id = ?", (course_id,), commit=True)
+            self._execute_query("DELETE FROM courses WHERE id = ?", (course_id,), commit=True)
         # logger.info(f"Curso {course_id} removido do banco de dados.")
 
     def log_prompt_usage(self, course_id, prompt_name, prompt_content, ai_service, response_content):
         # logger.info(f"Registrando uso de prompt para o curso {course_id}: {prompt_name}")
         query = "INSERT INTO prompt_usage (course_id, prompt_name, prompt_content, ai_service, response_content) VALUES (?, ?, ?, ?, ?)"
         self._execute_query(query, (course_id, prompt_name, prompt_content, ai_service, response_content), commit=True)
+
+    def get_episodes_without_text(self):
+        # Episódios com transcrição ou resumo só em arquivo (processados antes do índice de busca)
+        query = """
+            SELECT e.id, e.audio_path, c.name AS course_name,
+                   e.transcription IS NULL AS missing_transcription, e.summary IS NULL AS missing_summary
+            FROM episodes e
+            JOIN courses c ON c.id = e.course_id
+            WHERE e.audio_path IS NOT NULL AND (e.transcription IS NULL OR e.summary IS NULL)
+        """
+        return self._execute_query(query, fetchall=True)
+
+    def update_episode_texts(self, texts):
+        # texts: lista de (episode_id, transcription, summary); None mantém o valor atual
+        query = "UPDATE episodes SET transcription = COALESCE(?, transcription), summary = COALESCE(?, summary) WHERE id = ?"
+        self._execute_many(query, [(transcription, summary, episode_id) for episode_id, transcription, summary in texts])
+
+    def search_episodes(self, text, limit=20):
+        # Busca em títulos, transcrições e resumos de todos os cursos, do mais relevante (bm25)
+        # para o menos; o título pesa mais que o resumo, que pesa mais que a transcrição.
+        # Cada palavra vira um termo entre aspas, para que a entrada do usuário não seja lida
+        # como sintaxe do FTS5 (AND, OR, NEAR, *, -).
+        terms = " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+        if not terms:
+            return []
+        query = """
+            SELECT e.id AS episode_id, e.title, e.filename, e.relative_path, c.name AS course_name,
+                   snippet(episode_search, -1, '[', ']', '…', 16) AS snippet
+            FROM episode_search
+            JOIN episodes e ON e.id = episode_search.rowid
+            JOIN courses c ON c.id = e.course_id
+            WHERE episode_search MATCH ?
+            ORDER BY bm25(episode_search, 5.0, 1.0, 2.0)
+            LIMIT ?
+        """
+        return self._execute_query(query, (terms, limit), fetchall=True)
+
+    def get_llm_response(self, cache_key):
+        query = "SELECT * FROM llm_response_cache WHERE cache_key = ?"
+        row = self._execute_query(query, (cache_key,), fetchone=True)
+        if row:
+            self._execute_query("UPDATE llm_response_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?",
+                                (cache_key,), commit=True)
+        return row
+
+    def save_llm_response(self, cache_key, provider, model, prompt_name, prompt_hash, input_hash, params, response,
+                          input_tokens=None, output_tokens=None, latency=None):
+        query = """
+            INSERT OR REPLACE INTO llm_response_cache
+                (cache_key, provider, model, prompt_name, prompt_hash, input_hash, params, response,
+                 input_tokens, output_tokens, latency, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        self._execute_query(query, (cache_key, provider, model, prompt_name, prompt_hash, input_hash, params, response,
+                                    input_tokens, output_tokens, latency, len(response.encode('utf-8'))), commit=True)
+
+    def evict_llm_responses(self, max_age_days=0, max_size_bytes=0):
+        # TTL pela data de criação; tamanho total por LRU (último uso)
+        if max_age_days:
+            self._execute_query("DELETE FROM llm_response_cache WHERE created_at < datetime('now', ?)",
+                                (f"-{int(max_age_days)} days",), commit=True)
+        if max_size_bytes:
+            query = """
+                DELETE FROM llm_response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM (
+                        SELECT cache_key, SUM(size) OVER (ORDER BY last_used_at DESC, created_at DESC) AS running_size
+                        FROM llm_response_cache
+                    ) WHERE running_size > ?
+                )
+            """
+            self._execute_query(query, (max_size_bytes,), commit=True)
+
+    def get_llm_cache_stats(self):
+        query = """
+            SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS size, COALESCE(SUM(hits), 0) AS hits,
+                   COALESCE(SUM(hits * (COALESCE(input_tokens, 0) + COALESCE(output_tokens, 0))), 0) AS tokens_saved,
+                   COALESCE(SUM(hits * COALESCE(latency, 0)), 0) AS seconds_saved
+            FROM llm_response_cache
+        """
+        return self._execute_query(query, fetchone=True)
+
+    def clear_llm_cache(self):
+        self._execute_query("DELETE FROM llm_response_cache", commit=True)
+
+    def create_summary_batch(self, provider, batch_id, model, prompt_name, items):
+        # items: lista de (custom_id, episode_id, summary_path, cache_key)
+        with self.transaction():
+            batch_row_id = self._execute_query(
+                "INSERT INTO summary_batches (provider, batch_id, model, prompt_name, request_count) VALUES (?, ?, ?, ?, ?)",
+                (provider, batch_id, model, prompt_name, len(items)), commit=True
+            )
+            self._execute_many(
+                "INSERT INTO summary_batch_items (batch_row_id, custom_id, episode_id, summary_path, cache_key) VALUES (?, ?, ?, ?, ?)",
+                [(batch_row_id, custom_id, episode_id, summary_path, cache_key) for custom_id, episode_id, summary_path, cache_key in items]
+            )
+        return batch_row_id
+
+    def get_open_summary_batches(self):
+        query = "SELECT * FROM summary_batches WHERE status NOT IN ('completed', 'failed', 'expired', 'cancelled') ORDER BY id"
+        return self._execute_query(query, fetchall=True)
+
+    def update_summary_batch_status(self, batch_row_id, status, completed=False):
+        if completed:
+            query = "UPDATE summary_batches SET status = ?, completed_at = CURRENT_TIMESTAMP WHERE id = ?"
+        else:
+            query = "UPDATE summary_batches SET status = ? WHERE id = ?"
+        self._execute_query(query, (status, batch_row_id), commit=True)
+
+    def get_summary_batch_items(self, batch_row_id):
+        query = "SELECT * FROM summary_batch_items WHERE batch_row_id = ? ORDER BY custom_id"
+        return self._execute_query(query, (batch_row_id,), fetchall=True)
+
+    def update_summary_batch_item(self, batch_row_id, custom_id, status):
+        query = "UPDATE summary_batch_items SET status = ? WHERE batch_row_id = ? AND custom_id = ?"
+        self._execute_query(query, (status, batch_row_id, custom_id), commit=True)
+
+    def get_batched_episode_ids(self):
+        # Episódios com resumo aguardando num lote ainda aberto (não devem ser reenviados)
+        query = """
+            SELECT i.episode_id FROM summary_batch_items i
+            JOIN summary_batches b ON b.id = i.batch_row_id
+            WHERE i.status = 'pending' AND b.status NOT IN ('completed', 'failed', 'expired', 'cancelled')
+        """
+        return {row['episode_id'] for row in self._execute_query(query, fetchall=True)}
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+
+from utils.file_utils import text_sha256
+
+DEFAULT_TTL_DAYS = 90
+DEFAULT_MAX_SIZE_MB = 200
+
+
+# Cache persistente de respostas dos provedores de IA, na tabela llm_response_cache.
+# A chave combina provedor, modelo, hash do prompt, hash da entrada e parâmetros da
+# requisição: reprocessar com o mesmo prompt não gera nova chamada paga. Cada entrada
+# guarda tokens e latência da chamada original, para o relatório de economia.
+class ResponseCache:
+    def __init__(self, db_service):
+        self.db = db_service
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'tokens_saved': 0, 'seconds_saved': 0.0}
+
+    def make_key(self, provider, model, prompt_content, input_text, **params):
+        parts = {
+            'provider': provider,
+            'model': model,
+            'prompt_hash': text_sha256(prompt_content),
+            'input_hash': text_sha256(input_text),
+            'params': params,
+        }
+        payload = json.dumps(parts, sort_keys=True)
+        parts['key'] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return parts
+
+    def is_bypassed(self):
+        return self.db.get_setting('llm_cache_bypass', 'false') == 'true'
+
+    def get(self, key):
+        row = self.db.get_llm_response(key['key'])
+        with self._lock:
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.stats['tokens_saved'] += (row['input_tokens'] or 0) + (row['output_tokens'] or 0)
+            self.stats['seconds_saved'] += row['latency'] or 0
+        return row['response']
+
+    def put(self, key, response, prompt_name=None, input_tokens=None, output_tokens=None, latency=None):
+        self.db.save_llm_response(
+            key['key'], key['provider'], key['model'], prompt_name, key['prompt_hash'], key['input_hash'],
+            json.dumps(key['params'], sort_keys=True), response,
+            input_tokens=input_tokens, output_tokens=output_tokens, latency=latency
+        )
+        self.evict()
+
+    def evict(self):
+        try:
+            ttl_days = int(self.db.get_setting('llm_cache_ttl_days', DEFAULT_TTL_DAYS))
+            max_size_mb = int(self.db.get_setting('llm_cache_max_mb', DEFAULT_MAX_SIZE_MB))
+        except (TypeError, ValueError):
+            ttl_days, max_size_mb = DEFAULT_TTL_DAYS, DEFAULT_MAX_SIZE_MB
+        self.db.evict_llm_responses(max_age_days=ttl_days, max_size_bytes=max_size_mb * 1024 * 1024)
+
+    def clear(self):
+        self.db.clear_llm_cache()
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats['hits'] + stats['misses']
+        if not total:
+            return
+        print(f"  💾 Cache de respostas de IA: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+              f"~{stats['tokens_saved']} tokens e {stats['seconds_saved']:.1f}s de chamadas evitados")
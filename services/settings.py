@@ -3,6 +3,10 @@ import json
 import shutil
 from pathlib import Path
 
+from services.artifact_cache import DEFAULT_MAX_SIZE_MB
+from services.response_cache import DEFAULT_TTL_DAYS, DEFAULT_MAX_SIZE_MB as DEFAULT_LLM_CACHE_MB
+from services.ai_service import DEFAULT_CHUNK_MINUTES, DEFAULT_VAD_MIN_SILENCE
+
 class SettingsService:
     def __init__(self, db_service, ai_service):
         self.db = db_service
@@ -19,11 +23,19 @@ class SettingsService:
         if openai_key:
             api_keys['openai_api_key'] = openai_key
 
+        openai_base_url = input(f"URL Base OpenAI (opcional, atual: {api_keys.get('openai_base_url', '') or 'padrão'}): ").strip()
+        if openai_base_url:
+            api_keys['openai_base_url'] = openai_base_url
+
         print("\n--- Anthropic (Claude) ---")
         anthropic_key = input(f"Chave Anthropic (atual: {api_keys.get('anthropic_api_key', '')}): ").strip()
         if anthropic_key:
             api_keys['anthropic_api_key'] = anthropic_key
 
+        anthropic_base_url = input(f"URL Base Anthropic (opcional, atual: {api_keys.get('anthropic_base_url', '') or 'padrão'}): ").strip()
+        if anthropic_base_url:
+            api_keys['anthropic_base_url'] = anthropic_base_url
+
         print("\n--- Google (Gemini) ---")
         google_ai_key = input(f"Chave Google AI (atual: {api_keys.get('google_ai_key', '')}): ").strip()
         if google_ai_key:
@@ -37,6 +49,33 @@ class SettingsService:
         self.ai_service.save_api_keys(api_keys)
         print("✅ Chaves de API salvas.")
 
+    def api_limits(self):
+        print("🚦 Limites de Requisições por Provedor")
+        print("=" * 50)
+
+        providers = [
+            ('whisper', "Whisper (transcrição)"),
+            ('claude', "Claude"),
+            ('chatgpt', "ChatGPT"),
+            ('gemini', "Gemini"),
+            ('ollama', "Ollama"),
+        ]
+        for provider, label in providers:
+            limits = self.ai_service.get_rate_limits(provider)
+            print(f"\n--- {label} ---")
+            self._ask_limit(f'max_concurrent_{provider}', "Requisições simultâneas", limits['max_concurrent'], minimum=1)
+            self._ask_limit(f'rpm_{provider}', "Requisições por minuto (0 = sem limite)", limits['rpm'])
+            if provider != 'whisper':
+                self._ask_limit(f'tpm_{provider}', "Tokens por minuto (0 = sem limite)", limits['tpm'])
+
+    def _ask_limit(self, setting_key, label, current_value, minimum=0):
+        new_value = input(f"{label} (atual: {current_value}): ").strip()
+        if new_value.isdigit() and int(new_value) >= minimum:
+            self.db.save_setting(setting_key, new_value)
+            print(f"✅ {label} atualizado para: {new_value}")
+        elif new_value:
+            print(f"❌ Opção inválida. Use um número inteiro maior ou igual a {minimum}.")
+
     def voice_settings(self):
         print("🎙️ Configurações de Voz")
         print("=" * 50)
@@ -82,6 +121,8 @@ class SettingsService:
         print("[1] Limpar arquivos temporários")
         print("[2] Limpar cache de cursos")
         print("[3] Limpar logs")
+        print("[4] Limpar cache de artefatos (áudios e transcrições)")
+        print("[5] Limpar cache de respostas de IA (resumos)")
         
         choice = input("Escolha uma opção: ").strip()
         
@@ -96,6 +137,12 @@ class SettingsService:
         elif choice == '3':
             self._clear_directory('data/logs')
             print("✅ Logs limpos.")
+        elif choice == '4':
+            self.ai_service.artifact_cache.clear()
+            print("✅ Cache de artefatos limpo.")
+        elif choice == '5':
+            self.ai_service.response_cache.clear()
+            print("✅ Cache de respostas de IA limpo.")
         else:
             print("Opção inválida.")
 
@@ -117,11 +164,31 @@ class SettingsService:
         print(f"IA padrão atual: {current_default_ai}")
         new_default_ai = input("Nova IA padrão (claude, chatgpt, gemini, ollama): ").strip().lower()
         if new_default_ai in ['claude', 'chatgpt', 'gemini', 'ollama']:
-            self.db.save_setting('default_ai', new_default_ai)
+            self.ai_service.set_default_ai(new_default_ai)
             print(f"✅ IA padrão atualizada para: {new_default_ai}")
         elif new_default_ai:
             print("❌ Opção de IA inválida.")
 
+        # Failover: se a IA padrão falhar ou atingir o rate limit, tentar as outras configuradas
+        failover = self.db.get_setting('ai_failover', 'true')
+        print(f"Failover automático entre IAs: {failover}")
+        new_failover = input("Usar outras IAs quando a padrão falhar? (true/false): ").strip().lower()
+        if new_failover in ['true', 'false']:
+            self.db.save_setting('ai_failover', new_failover)
+            print(f"✅ Failover atualizado para: {new_failover}")
+        elif new_failover:
+            print("❌ Opção inválida. Use 'true' ou 'false'.")
+
+        # Hedge: requisição duplicada na próxima IA quando a primeira passa do p95 de latência
+        hedging = self.db.get_setting('ai_hedging', 'false')
+        print(f"Requisições duplicadas para respostas lentas: {hedging}")
+        new_hedging = input("Duplicar em outra IA quando a resposta demorar? (true/false, pode dobrar o custo): ").strip().lower()
+        if new_hedging in ['true', 'false']:
+            self.db.save_setting('ai_hedging', new_hedging)
+            print(f"✅ Requisições duplicadas atualizadas para: {new_hedging}")
+        elif new_hedging:
+            print("❌ Opção inválida. Use 'true' ou 'false'.")
+
         # Exemplo 2: Manter arquivos individuais após unificação
         keep_files = self.db.get_setting('keep_individual_files', 'true')
         print(f"Manter arquivos individuais após unificação: {keep_files}")
@@ -130,4 +197,89 @@ class SettingsService:
             self.db.save_setting('keep_individual_files', new_keep_files)
             print(f"✅ Preferência de manter arquivos atualizada para: {new_keep_files}")
         elif new_keep_files:
+            print("❌ Opção inválida. Use 'true' ou 'false'.")
+
+        # Número de conversões ffmpeg simultâneas
+        default_workers = os.cpu_count() or 1
+        current_workers = self.db.get_setting('conversion_workers', str(default_workers))
+        print(f"Conversões simultâneas (ffmpeg): {current_workers}")
+        new_workers = input(f"Número de conversões simultâneas (padrão: {default_workers} núcleos): ").strip()
+        if new_workers.isdigit() and int(new_workers) > 0:
+            self.db.save_setting('conversion_workers', new_workers)
+            print(f"✅ Conversões simultâneas atualizadas para: {new_workers}")
+        elif new_workers:
+            print("❌ Opção inválida. Use um número inteiro maior que zero.")
+
+        # Cópia direta do áudio quando a origem já é AAC/MP3 compatível com podcast
+        stream_copy = self.db.get_setting('audio_stream_copy', 'true')
+        print(f"Extrair áudio compatível sem recodificar: {stream_copy}")
+        new_stream_copy = input("Usar cópia direta quando possível? (true/false): ").strip().lower()
+        if new_stream_copy in ['true', 'false']:
+            self.db.save_setting('audio_stream_copy', new_stream_copy)
+            print(f"✅ Cópia direta de áudio atualizada para: {new_stream_copy}")
+        elif new_stream_copy:
+            print("❌ Opção inválida. Use 'true' ou 'false'.")
+
+        # Duração máxima dos trechos de transcrição (aulas longas são divididas em silêncios)
+        current_chunk = self.db.get_setting('transcription_chunk_minutes', str(DEFAULT_CHUNK_MINUTES))
+        print(f"Duração máxima dos trechos de transcrição: {current_chunk} min")
+        new_chunk = input("Nova duração em minutos (deixe em branco para manter): ").strip()
+        if new_chunk.isdigit() and int(new_chunk) > 0:
+            self.db.save_setting('transcription_chunk_minutes', new_chunk)
+            print(f"✅ Duração dos trechos atualizada para: {new_chunk} min")
+        elif new_chunk:
+            print("❌ Opção inválida. Use um número inteiro maior que zero.")
+
+        # VAD: pausas mais longas que o limite são removidas antes da transcrição
+        current_vad = self.db.get_setting('vad_min_silence_seconds', str(DEFAULT_VAD_MIN_SILENCE))
+        print(f"Remover silêncios mais longos que: {current_vad}s (0 = desativado, padrão)")
+        new_vad = input("Novo limite em segundos (deixe em branco para manter): ").strip()
+        try:
+            if new_vad and float(new_vad) >= 0:
+                self.db.save_setting('vad_min_silence_seconds', new_vad)
+                print(f"✅ Limite de silêncio atualizado para: {new_vad}s")
+            elif new_vad:
+                print("❌ Opção inválida. Use um número maior ou igual a zero.")
+        except ValueError:
+            print("❌ Opção inválida. Use um número maior ou igual a zero.")
+
+        # Tamanho máximo do cache de artefatos (evicção LRU)
+        current_cache_size = self.db.get_setting('artifact_cache_max_mb', str(DEFAULT_MAX_SIZE_MB))
+        print(f"Tamanho máximo do cache de artefatos: {current_cache_size} MB")
+        new_cache_size = input("Novo tamanho máximo em MB (deixe em branco para manter): ").strip()
+        if new_cache_size.isdigit():
+            self.db.save_setting('artifact_cache_max_mb', new_cache_size)
+            self.ai_service.artifact_cache.evict()
+            print(f"✅ Tamanho máximo do cache atualizado para: {new_cache_size} MB")
+        elif new_cache_size:
+            print("❌ Opção inválida. Use um número inteiro.")
+
+        # Cache de respostas de IA: validade, tamanho e opção de ignorar (forçar nova chamada)
+        current_ttl = self.db.get_setting('llm_cache_ttl_days', str(DEFAULT_TTL_DAYS))
+        print(f"Validade do cache de respostas de IA: {current_ttl} dia(s) (0 = sem expiração)")
+        new_ttl = input("Nova validade em dias (deixe em branco para manter): ").strip()
+        if new_ttl.isdigit():
+            self.db.save_setting('llm_cache_ttl_days', new_ttl)
+            self.ai_service.response_cache.evict()
+            print(f"✅ Validade do cache atualizada para: {new_ttl} dia(s)")
+        elif new_ttl:
+            print("❌ Opção inválida. Use um número inteiro.")
+
+        current_llm_size = self.db.get_setting('llm_cache_max_mb', str(DEFAULT_LLM_CACHE_MB))
+        print(f"Tamanho máximo do cache de respostas de IA: {current_llm_size} MB (0 = sem limite)")
+        new_llm_size = input("Novo tamanho máximo em MB (deixe em branco para manter): ").strip()
+        if new_llm_size.isdigit():
+            self.db.save_setting('llm_cache_max_mb', new_llm_size)
+            self.ai_service.response_cache.evict()
+            print(f"✅ Tamanho máximo do cache de respostas atualizado para: {new_llm_size} MB")
+        elif new_llm_size:
+            print("❌ Opção inválida. Use um número inteiro.")
+
+        bypass = self.db.get_setting('llm_cache_bypass', 'false')
+        print(f"Ignorar cache de respostas de IA: {bypass}")
+        new_bypass = input("Ignorar cache e sempre chamar a IA? (true/false): ").strip().lower()
+        if new_bypass in ['true', 'false']:
+            self.db.save_setting('llm_cache_bypass', new_bypass)
+            print(f"✅ Ignorar cache de respostas atualizado para: {new_bypass}")
+        elif new_bypass:
             print("❌ Opção inválida. Use 'true' ou 'false'.")
\ No newline at end of file
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local que emula a OpenAI Batch API e a Anthropic Message Batches API, para exercitar
+# o modo de resumos em lote sem chaves nem custo. Aponte openai_base_url para
+# http://127.0.0.1:<porta>/v1 e anthropic_base_url para http://127.0.0.1:<porta>.
+# Uso: python -m utils.batch_standin --port 8089 (servidor) ou --selftest (envio + consulta)
+#
+# Respostas por posição no lote: a 2ª falha, a 3ª vem cortada com [CONTINUA] e as demais terminam
+# com [FIM]. Com outcome 'expired' ou 'cancelled', só a 1ª recebe resultado.
+OUTCOMES = ('completed', 'expired', 'cancelled')
+POLLS_UNTIL_DONE = 2
+
+
+def _answer(prompt, index):
+    if index == 2:
+        return f"Resumo cortado {index} [CONTINUA]"
+    return f"Resumo {index}: {prompt[-30:]} [FIM]"
+
+
+class _StandinHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, content_type="application/json", status=200):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _poll(self, batch_id):
+        with self.server.lock:
+            self.server.polls[batch_id] = self.server.polls.get(batch_id, 0) + 1
+            return self.server.polls[batch_id] >= POLLS_UNTIL_DONE
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/v1/files":
+            match = re.search(rb'filename="[^"]*"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', data, re.S)
+            if not match:
+                return self._send({'error': {'message': "arquivo ausente"}}, status=400)
+            with self.server.lock:
+                file_id = f"file-{len(self.server.files) + 1}"
+                self.server.files[file_id] = match.group(1).decode('utf-8')
+            return self._send({'id': file_id, 'object': "file", 'bytes': len(match.group(1)), 'created_at': 0,
+                               'filename': "summaries.jsonl", 'purpose': "batch", 'status': "processed"})
+        if self.path == "/v1/batches":
+            request = json.loads(data)
+            with self.server.lock:
+                batch_id = f"batch_{len(self.server.openai_batches) + 1}"
+                self.server.openai_batches[batch_id] = request
+            return self._send(self._openai_batch(batch_id, "validating"))
+        if self.path == "/v1/messages/batches":
+            request = json.loads(data)
+            with self.server.lock:
+                batch_id = f"msgbatch_{len(self.server.anthropic_batches) + 1}"
+                self.server.anthropic_batches[batch_id] = request
+            return self._send(self._anthropic_batch(batch_id, "in_progress"))
+        self.send_error(404)
+
+    def do_GET(self):
+        match = re.match(r"^/v1/batches/([^/]+)$", self.path)
+        if match:
+            return self._send(self._openai_status(match.group(1)))
+        match = re.match(r"^/v1/files/([^/]+)/content$", self.path)
+        if match:
+            return self._send(self.server.files[match.group(1)].encode('utf-8'), "application/jsonl")
+        match = re.match(r"^/v1/messages/batches/([^/]+)/results$", self.path)
+        if match:
+            return self._send(self._anthropic_results(match.group(1)), "application/binary")
+        match = re.match(r"^/v1/messages/batches/([^/]+)$", self.path)
+        if match:
+            status = "ended" if self._poll(match.group(1)) else "in_progress"
+            return self._send(self._anthropic_batch(match.group(1), status))
+        self.send_error(404)
+
+    def _openai_batch(self, batch_id, status, output_file_id=None):
+        return {'id': batch_id, 'object': "batch", 'endpoint': "/v1/chat/completions",
+                'input_file_id': self.server.openai_batches[batch_id]['input_file_id'], 'completion_window': "24h",
+                'status': status, 'created_at': 0, 'output_file_id': output_file_id, 'error_file_id': None}
+
+    def _openai_status(self, batch_id):
+        if not self._poll(batch_id):
+            return self._openai_batch(batch_id, "in_progress")
+        outcome = self.server.outcome
+        lines = self.server.files[self.server.openai_batches[batch_id]['input_file_id']].splitlines()
+        output = []
+        for index, line in enumerate(lines):
+            request = json.loads(line)
+            if outcome != 'completed' and index > 0:
+                break
+            if index == 1:
+                response = {'status_code': 500, 'body': {'error': {'message': "erro simulado"}}}
+            else:
+                prompt = request['body']['messages'][-1]['content']
+                response = {'status_code': 200, 'body': {
+                    'choices': [{'message': {'role': "assistant", 'content': _answer(prompt, index)}}],
+                    'usage': {'prompt_tokens': 100, 'completion_tokens': 10},
+                }}
+            output.append({'custom_id': request['custom_id'], 'response': response, 'error': None})
+        output_file_id = f"file-out-{batch_id}"
+        with self.server.lock:
+            self.server.files[output_file_id] = "\n".join(json.dumps(entry) for entry in output)
+        return self._openai_batch(batch_id, outcome, output_file_id)
+
+    def _anthropic_batch(self, batch_id, status):
+        results_url = f"http://127.0.0.1:{self.server.server_port}/v1/messages/batches/{batch_id}/results" if status == "ended" else None
+        return {'id': batch_id, 'type': "message_batch", 'processing_status': status,
+                'created_at': "2026-01-01T00:00:00Z", 'expires_at': "2026-01-02T00:00:00Z", 'ended_at': None,
+                'cancel_initiated_at': None, 'archived_at': None, 'results_url': results_url,
+                'request_counts': {'processing': 0, 'succeeded': 0, 'errored': 0, 'canceled': 0, 'expired': 0}}
+
+    def _anthropic_results(self, batch_id):
+        outcome = self.server.outcome
+        results = []
+        for index, request in enumerate(self.server.anthropic_batches[batch_id]['requests']):
+            if outcome != 'completed' and index > 0:
+                # Pedidos não processados: 'expired'/'canceled' no lugar do resultado
+                results.append({'custom_id': request['custom_id'], 'result': {'type': "expired" if outcome == 'expired' else "canceled"}})
+            elif index == 1:
+                results.append({'custom_id': request['custom_id'], 'result': {
+                    'type': "errored", 'error': {'type': "error", 'error': {'type': "api_error", 'message': "erro simulado"}}}})
+            else:
+                prompt = request['params']['messages'][-1]['content']
+                results.append({'custom_id': request['custom_id'], 'result': {'type': "succeeded", 'message': {
+                    'id': f"msg_{index}", 'type': "message", 'role': "assistant", 'model': request['params']['model'],
+                    'content': [{'type': "text", 'text': _answer(prompt, index)}], 'stop_reason': "end_turn",
+                    'stop_sequence': None, 'usage': {'input_tokens': 50, 'output_tokens': 5},
+                }}})
+        return "\n".join(json.dumps(result) for result in results).encode('utf-8')
+
+
+def start_standin(port=0, outcome='completed'):
+    # Sobe o servidor numa thread em segundo plano; server.shutdown() encerra
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StandinHandler)
+    server.outcome = outcome
+    server.lock = threading.Lock()
+    server.files = {}
+    server.openai_batches = {}
+    server.anthropic_batches = {}
+    server.polls = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_selftest(episodes=4):
+    # Envia e consulta um lote por provedor e resultado simulado, com banco e pastas temporários,
+    # e confere o status gravado de cada pedido. Retorna True se tudo bateu com o esperado.
+    from services.ai_service import AIService
+    from services.batch_service import SummaryBatchService
+    from services.database import DatabaseService
+
+    expected = {
+        'completed': ['completed', 'failed', 'incomplete', 'completed'],
+        'expired': ['completed', 'failed', 'failed', 'failed'],
+        'cancelled': ['completed', 'failed', 'failed', 'failed'],
+    }
+    original_dir = os.getcwd()
+    success = True
+    for outcome in OUTCOMES:
+        server = start_standin(outcome=outcome)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        try:
+            for provider in ('chatgpt', 'claude'):
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    # AIService lê prompts e chaves relativos à pasta atual
+                    os.chdir(temp_dir)
+                    os.makedirs("prompts/course_processor")
+                    with open("prompts/course_processor/resumo_detalhado.md", 'w', encoding='utf-8') as f:
+                        f.write("Resuma a aula.")
+                    db = DatabaseService(os.path.join(temp_dir, "standin.db"))
+                    ai_service = AIService(db)
+                    ai_service.api_keys = {'openai_api_key': "standin", 'anthropic_api_key': "standin",
+                                           'openai_base_url': f"{base_url}/v1", 'anthropic_base_url': base_url}
+                    ai_service.set_default_ai(provider)
+                    course_id = db.create_course("standin", temp_dir)
+                    jobs = []
+                    for index in range(episodes):
+                        episode_id = db.create_episode(course_id, f"aula{index}.mp3", f"Aula {index}", audio_path=f"aula{index}.mp3")
+                        transcription_path = os.path.join(temp_dir, f"aula{index}.txt")
+                        with open(transcription_path, 'w', encoding='utf-8') as f:
+                            f.write(f"Transcrição da aula {index}. " * 20)
+                        jobs.append({'episode_id': episode_id, 'transcription_path': transcription_path,
+                                     'summary_path': os.path.join(temp_dir, "summaries", f"aula{index}.md")})
+
+                    submitted = SummaryBatchService(db, ai_service).submit(jobs)
+                    # Nova instância, como após reiniciar: o lote é encontrado pelo ID gravado no banco
+                    restarted = AIService(db)
+                    restarted.api_keys = ai_service.api_keys
+                    finished = SummaryBatchService(db, restarted).poll(wait=True, interval=0)
+                    batch = db._execute_query("SELECT id FROM summary_batches", fetchone=True)
+                    statuses = [item['status'] for item in db.get_summary_batch_items(batch['id'])] if batch else []
+                    written = sorted(os.listdir(os.path.join(temp_dir, "summaries"))) if os.path.isdir(os.path.join(temp_dir, "summaries")) else []
+                    expected_written = [f"aula{index}.md" for index, status in enumerate(expected[outcome]) if status == 'completed']
+                    ok = submitted == episodes and finished and statuses == expected[outcome] and written == expected_written
+                    success = success and ok
+                    print(f"{'✅' if ok else '❌'} {provider} / {outcome}: {statuses} (resumos gravados: {len(written)})")
+                    db.close()
+                    os.chdir(original_dir)
+        finally:
+            os.chdir(original_dir)
+            server.shutdown()
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulador local das APIs de lote da OpenAI e da Anthropic")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--outcome", default='completed', choices=OUTCOMES, help="Status final simulado dos lotes")
+    parser.add_argument("--selftest", action="store_true", help="Envia e consulta lotes dos dois provedores contra o emulador")
+    args = parser.parse_args()
+
+    if args.selftest:
+        raise SystemExit(0 if run_selftest() else 1)
+
+    server = start_standin(args.port, args.outcome)
+    print(f"🧪 Emulador de lotes em http://127.0.0.1:{server.server_port} (Ctrl+C para sair)")
+    print(f"   openai_base_url:    http://127.0.0.1:{server.server_port}/v1")
+    print(f"   anthropic_base_url: http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from services.database import DatabaseService
+
+
+# Teste de carga do DatabaseService: N threads gravam e leem o estado de episódios ao mesmo
+# tempo, como os workers do pipeline. Uso: python -m utils.db_benchmark --threads 16
+def run_benchmark(threads=8, operations=200, db_path=None, journal_mode="wal"):
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+    db = DatabaseService(db_path)
+    if journal_mode != "wal":
+        # Para comparar com o journal de rollback usado antes do WAL; a leitura da versão do
+        # schema na inicialização já abriu uma conexão de leitura, que impediria a troca
+        db.close_readers()
+        db.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+
+    course_id = db.create_course(f"benchmark-{time.time_ns()}", "/tmp")
+    episode_ids = [db.create_episode(course_id, f"aula{index}.mp4", f"Aula {index}") for index in range(threads)]
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker(episode_id):
+        local_latencies = []
+        start_barrier.wait()
+        for operation in range(operations):
+            start_time = time.perf_counter()
+            try:
+                db.mark_episode_stage(episode_id, 'transcribed', f"/tmp/{episode_id}-{operation}.txt", str(operation))
+                db.update_episode_transcription(episode_id, f"transcrição {operation}")
+                db.get_episode_stages(course_id)
+                db.get_setting('default_ai', 'claude')
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            local_latencies.append(time.perf_counter() - start_time)
+        with lock:
+            latencies.extend(local_latencies)
+
+    workers = [threading.Thread(target=worker, args=(episode_id,)) for episode_id in episode_ids]
+    start_time = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall_time = time.perf_counter() - start_time
+
+    db.close()
+    if temp_dir:
+        temp_dir.cleanup()
+
+    latencies.sort()
+    total = threads * operations
+    return {
+        'threads': threads,
+        'operations': total,
+        'seconds': wall_time,
+        'ops_per_second': total / wall_time if wall_time > 0 else 0,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000 if latencies else 0,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+    }
+
+
+# Registro de um curso grande: um commit por episódio (create_episode) contra uma única
+# transação com executemany (create_episodes). Uso: python -m utils.db_benchmark --inserts 500
+def run_insert_benchmark(episodes=500, db_path=None):
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+    db = DatabaseService(db_path)
+    rows = [{'filename': f"aula{index}.mp3", 'title': f"Aula {index}", 'sort_order': index} for index in range(episodes)]
+
+    course_id = db.create_course(f"benchmark-single-{time.time_ns()}", "/tmp")
+    start_time = time.perf_counter()
+    for row in rows:
+        db.create_episode(course_id, **row)
+    single_time = time.perf_counter() - start_time
+
+    course_id = db.create_course(f"benchmark-batch-{time.time_ns()}", "/tmp")
+    start_time = time.perf_counter()
+    db.create_episodes(course_id, rows)
+    batch_time = time.perf_counter() - start_time
+
+    db.close()
+    if temp_dir:
+        temp_dir.cleanup()
+    return {
+        'episodes': episodes,
+        'single_seconds': single_time,
+        'batch_seconds': batch_time,
+        'single_per_second': episodes / single_time if single_time > 0 else 0,
+        'batch_per_second': episodes / batch_time if batch_time > 0 else 0,
+    }
+
+
+# Métodos do DatabaseService com as consultas frequentes. O SQL conferido é capturado da própria
+# chamada ao método (sem executar), para o benchmark não divergir do código.
+HOT_METHODS = {
+    'get_episodes_by_course': lambda db: db.get_episodes_by_course(1),
+    'get_episode_stages': lambda db: db.get_episode_stages(1),
+    'get_operations_log': lambda db: db.get_operations_log(1),
+    'delete_episode': lambda db: db.delete_episode(1),
+    'forget_course': lambda db: db.forget_course(1),
+}
+
+
+def _capture_queries(db, call):
+    queries = []
+
+    def capture(query, params=(), fetchone=False, fetchall=False, commit=False):
+        queries.append((" ".join(query.split()), params))
+        return [] if fetchall else None
+
+    db._execute_query = capture
+    try:
+        call(db)
+    finally:
+        del db._execute_query
+    return queries
+
+
+# Banco sintético com muitos episódios: confere que as consultas frequentes usam índice (sem
+# SCAN na tabela toda) e mede a inicialização com o schema já em dia.
+# Uso: python -m utils.db_benchmark --plans 100000
+def run_query_plans(episodes=100000, db_path=None, episodes_per_course=100):
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+    db = DatabaseService(db_path)
+    courses = max(1, episodes // episodes_per_course)
+    with db.transaction():
+        for course in range(courses):
+            course_id = db.create_course(f"curso-{course}-{time.time_ns()}", "/tmp")
+            db.create_episodes(course_id, [
+                {'filename': f"aula{index}.mp3", 'title': f"Aula {index}", 'relative_path': f"m{index // 10}/aula{index}.mp4", 'sort_order': index}
+                for index in range(episodes_per_course)
+            ])
+            db.log_operations([(course_id, 'episodes', None, None, 'completed')] * 5)
+    db.close()
+
+    start_time = time.perf_counter()
+    db = DatabaseService(db_path)
+    startup_time = time.perf_counter() - start_time
+
+    plans = {}
+    for name, call in HOT_METHODS.items():
+        plans[name] = []
+        for query, params in _capture_queries(db, call):
+            rows = db.conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            details = [row['detail'] for row in rows]
+            start_time = time.perf_counter()
+            if query.upper().startswith("SELECT"):
+                db.conn.execute(query, params).fetchall()
+            query_time = time.perf_counter() - start_time
+            # "SCAN tabela" sem índice percorre a tabela inteira
+            full_scan = any(detail.startswith("SCAN") and "INDEX" not in detail for detail in details)
+            plans[name].append({'query': query, 'plan': details, 'full_scan': full_scan, 'ms': query_time * 1000})
+
+    db.close()
+    if temp_dir:
+        temp_dir.cleanup()
+    return {'episodes': courses * episodes_per_course, 'startup_ms': startup_time * 1000, 'plans': plans}
+
+
+# Busca textual num acervo sintético: cada episódio com ~1 hora de fala (words palavras na
+# transcrição). Uso: python -m utils.db_benchmark --search 2000
+def run_search_benchmark(episodes=2000, words=8000, db_path=None, queries=("aula 1999", "revisão", "palavra123 palavra456")):
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+    db = DatabaseService(db_path)
+    vocabulary = [f"palavra{index}" for index in range(5000)] + ["revisão", "exercício", "conceito"]
+    randomizer = random.Random(42)
+
+    start_time = time.perf_counter()
+    course_id = db.create_course(f"benchmark-search-{time.time_ns()}", "/tmp")
+    with db.transaction():
+        episode_ids = db.create_episodes(course_id, [
+            {'filename': f"aula{index}.mp3", 'title': f"Aula {index}", 'audio_path': f"/tmp/aula{index}.mp3", 'sort_order': index}
+            for index in range(episodes)
+        ])
+        for episode_id in episode_ids:
+            transcription = " ".join(randomizer.choices(vocabulary, k=words))
+            db.update_episode_transcription(episode_id, transcription)
+            db.update_episode_summary(episode_id, transcription[:2000])
+    index_time = time.perf_counter() - start_time
+
+    timings = {}
+    for text in queries:
+        start_time = time.perf_counter()
+        hits = db.search_episodes(text)
+        timings[text] = ((time.perf_counter() - start_time) * 1000, len(hits))
+
+    db.close()
+    if temp_dir:
+        temp_dir.cleanup()
+    return {'episodes': episodes, 'words': episodes * words, 'index_seconds': index_time, 'queries': timings}
+
+
+# Custo de get_setting nos caminhos quentes (IA padrão por aula, modelo por turno de
+# continuação). Uso: python -m utils.db_benchmark --settings 100000
+def run_settings_benchmark(calls=100000, db_path=None):
+    temp_dir = None
+    if db_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "benchmark.db")
+    db = DatabaseService(db_path)
+    db.save_setting('default_ai', 'claude')
+
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        db.get_setting('default_ai', 'claude')
+    cached_time = time.perf_counter() - start_time
+
+    # A mesma consulta que get_setting fazia antes do cache, a cada chamada
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        db._execute_query("SELECT value FROM settings WHERE key = ?", ('default_ai',), fetchone=True)
+    query_time = time.perf_counter() - start_time
+
+    db.close()
+    if temp_dir:
+        temp_dir.cleanup()
+    return {'calls': calls, 'cached_us': cached_time / calls * 1e6, 'query_us': query_time / calls * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga concorrente do banco de dados")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=200, help="Operações por thread (2 escritas + 2 leituras cada)")
+    parser.add_argument("--db", default=None, help="Arquivo do banco (padrão: temporário)")
+    parser.add_argument("--journal", default="wal", choices=["wal", "delete"])
+    parser.add_argument("--inserts", type=int, default=0, help="Compara N inserções avulsas com uma inserção em lote")
+    parser.add_argument("--plans", type=int, default=0, help="Confere os planos das consultas num banco sintético com N episódios")
+    parser.add_argument("--search", type=int, default=0, help="Mede a busca textual num acervo sintético com N episódios de ~1 hora")
+    parser.add_argument("--settings", type=int, default=0, help="Mede N leituras de configuração com e sem o cache")
+    args = parser.parse_args()
+
+    if args.settings:
+        result = run_settings_benchmark(args.settings, args.db)
+        print(f"⚙️ {result['calls']} leitura(s) de configuração:")
+        print(f"   Consulta ao SQLite: {result['query_us']:.2f} µs por chamada")
+        print(f"   Cache em memória:   {result['cached_us']:.2f} µs por chamada")
+        return
+
+    if args.search:
+        result = run_search_benchmark(args.search, db_path=args.db)
+        print(f"🔎 {result['episodes']} episódio(s), {result['words']} palavra(s) indexadas em {result['index_seconds']:.1f}s")
+        for text, (elapsed_ms, hits) in result['queries'].items():
+            print(f"   '{text}': {hits} resultado(s) em {elapsed_ms:.1f} ms")
+        return
+
+    if args.plans:
+        result = run_query_plans(args.plans, args.db)
+        print(f"🗄️ Banco sintético com {result['episodes']} episódio(s); inicialização com schema em dia: {result['startup_ms']:.1f} ms")
+        for name, statements in result['plans'].items():
+            print(f"   {name}:")
+            for plan in statements:
+                status = "❌ SCAN completo" if plan['full_scan'] else "✅"
+                print(f"   {status} {plan['query'][:90]} ({plan['ms']:.2f} ms)")
+                for detail in plan['plan']:
+                    print(f"      {detail}")
+        return
+
+    if args.inserts:
+        result = run_insert_benchmark(args.inserts, args.db)
+        print(f"🗄️ {result['episodes']} episódio(s) registrados:")
+        print(f"   Um commit por episódio: {result['single_seconds']:.3f}s ({result['single_per_second']:.0f} inserções/s)")
+        print(f"   Transação única:        {result['batch_seconds']:.3f}s ({result['batch_per_second']:.0f} inserções/s)")
+        return
+
+    result = run_benchmark(args.threads, args.operations, args.db, args.journal)
+    print(f"🗄️ {result['threads']} thread(s), {result['operations']} operação(ões) em {result['seconds']:.2f}s "
+          f"({result['ops_per_second']:.0f} ops/s)")
+    print(f"   Latência por operação: p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms")
+    if result['errors']:
+        print(f"   ❌ {result['errors']} erro(s), ex.: {result['first_error']}")
+    else:
+        print("   ✅ Nenhum erro de lock")
+
+
+if __name__ == "__main__":
+    main()
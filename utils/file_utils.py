@@ -0,0 +1,33 @@
+import hashlib
+import os
+import threading
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Cache em memória de hashes já calculados, invalidado por tamanho e mtime
+_hash_cache = {}
+_hash_cache_lock = threading.Lock()
+
+
+def file_sha256(path):
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    cache_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _hash_cache_lock:
+        cached = _hash_cache.get(cache_key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    file_hash = digest.hexdigest()
+
+    with _hash_cache_lock:
+        _hash_cache[cache_key] = file_hash
+    return file_hash
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
@@ -40,6 +40,8 @@ class MenuRenderer:
             {"id": "11", "name": "Course Status Check", "category": "Course Management", "emoji": "📋"},
             {"id": "12", "name": "Forget Course", "category": "Course Management", "emoji": "🗑️"},
             {"id": "13", "name": "Clear All Data", "category": "Course Management", "emoji": "🗑️"},
+            {"id": "14", "name": "Batch AI Summaries", "category": "Individual Operations", "emoji": "📦"},
+            {"id": "15", "name": "Search Transcripts & Summaries", "category": "Course Management", "emoji": "🔎"},
             {"id": "0", "name": "Back to Main Menu", "category": "", "emoji": "⬅️"},
         ]
 
@@ -50,6 +52,7 @@ class MenuRenderer:
             {"id": "4", "name": "GitHub Repository", "category": "General Settings", "emoji": "🗂️"},
             {"id": "5", "name": "Cleanup Tools", "category": "General Settings", "emoji": "🧹"},
             {"id": "6", "name": "Processing Preferences", "category": "Course Processor", "emoji": "🎯"},
+            {"id": "7", "name": "API Rate Limits", "category": "Course Processor", "emoji": "🚦"},
             {"id": "0", "name": "Back to Main Menu", "category": "", "emoji": "⬅️"},
         ]
 
@@ -0,0 +1,171 @@
+import mmap
+import struct
+
+# Tabelas do cabeçalho de frame MPEG Layer III
+_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320], # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160], # MPEG-2 e 2.5
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+# Offset da tag Xing/Info (frame de metadados do encoder) a partir do início do frame
+_XING_OFFSETS = {(1, 2): 36, (1, 1): 21, (2, 2): 21, (2, 1): 13}
+
+# Byte offset "não informado" nos frames CHAP: players usam os tempos
+_NO_OFFSET = 0xFFFFFFFF
+# Limite de entradas de um frame CTOC (contador de 8 bits)
+_CTOC_MAX_ENTRIES = 255
+
+
+def parse_frame_header(header):
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    version = 1 if version_bits == 3 else 2
+    bitrate = _BITRATES[version][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    samples = 1152 if version == 1 else 576
+    return {
+        'version': version,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': 1 if (header[3] >> 6) == 3 else 2,
+        'samples': samples,
+        'length': samples // 8 * bitrate * 1000 // sample_rate + padding,
+    }
+
+
+def id3v2_size(data):
+    # Tamanho total da tag ID3v2 no início do arquivo (0 quando não há tag)
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def scan_mp3(path):
+    # Percorre os cabeçalhos dos frames de áudio sem decodificar. Retorna os trechos de
+    # bytes com frames válidos (sem tags e sem o frame Xing/Info) e o total de amostras,
+    # ou None quando o arquivo não é um MP3 com formato uniforme.
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Arquivo vazio
+            return None
+        try:
+            return _scan_frames(data)
+        finally:
+            data.close()
+
+
+def _scan_frames(data):
+    position = id3v2_size(data)
+    end = len(data)
+    ranges = []
+    run_start = None
+    samples = 0
+    audio_format = None
+    first_frame = True
+
+    while position + 4 <= end:
+        frame = parse_frame_header(data[position:position + 4])
+        if not frame or position + frame['length'] > end:
+            # Lixo entre frames ou frame truncado: fecha o trecho atual e procura o próximo sync
+            if run_start is not None:
+                ranges.append((run_start, position))
+                run_start = None
+            position += 1
+            continue
+
+        frame_format = (frame['version'], frame['sample_rate'], frame['channels'])
+        if audio_format is None:
+            audio_format = frame_format
+        elif frame_format != audio_format:
+            return None
+
+        if first_frame:
+            first_frame = False
+            xing_offset = _XING_OFFSETS[(frame['version'], frame['channels'])]
+            if data[position + xing_offset:position + xing_offset + 4] in (b"Xing", b"Info") or \
+                    data[position + 36:position + 40] == b"VBRI":
+                position += frame['length']
+                continue
+
+        if run_start is None:
+            run_start = position
+        samples += frame['samples']
+        position += frame['length']
+
+    if run_start is not None:
+        ranges.append((run_start, position))
+    if not ranges:
+        return None
+    return {
+        'sample_rate': audio_format[1],
+        'channels': audio_format[2],
+        'samples': samples,
+        'ranges': ranges,
+        'size': sum(stop - start for start, stop in ranges),
+    }
+
+
+def _text_frame(frame_id, text):
+    # Frame de texto ID3v2.3 em UTF-16 com BOM (acentos nos títulos)
+    return _frame(frame_id, b"\x01" + text.encode('utf-16') + b"\x00\x00")
+
+
+def _frame(frame_id, payload):
+    return frame_id.encode('ascii') + struct.pack(">I", len(payload)) + b"\x00\x00" + payload
+
+
+def _ctoc_frame(element_id, children, top_level, title=None):
+    flags = 0x03 if top_level else 0x01 # Bit 1: nível superior, bit 0: filhos ordenados
+    payload = element_id.encode('ascii') + b"\x00" + bytes([flags, len(children)])
+    payload += b"".join(child.encode('ascii') + b"\x00" for child in children)
+    if title:
+        payload += _text_frame("TIT2", title)
+    return _frame("CTOC", payload)
+
+
+def build_chapter_tag(title, chapters, total_size=None):
+    # Tag ID3v2.3 com o título, um CHAP por capítulo e o índice CTOC. Com total_size, a tag
+    # é completada com padding até esse tamanho (None se não couber); sem ele, reserva
+    # espaço livre para que capítulos anexados depois não exijam reescrever o áudio.
+    frames = [_text_frame("TIT2", title)]
+    for chapter in chapters:
+        payload = chapter['element_id'].encode('ascii') + b"\x00"
+        payload += struct.pack(">IIII", chapter['start_ms'], chapter['end_ms'], _NO_OFFSET, _NO_OFFSET)
+        payload += _text_frame("TIT2", chapter['title'])
+        frames.append(_frame("CHAP", payload))
+
+    element_ids = [chapter['element_id'] for chapter in chapters]
+    if len(element_ids) <= _CTOC_MAX_ENTRIES:
+        frames.append(_ctoc_frame("toc", element_ids, top_level=True, title=title))
+    else:
+        # Mais capítulos que o limite do CTOC: índice em dois níveis
+        groups = [element_ids[i:i + _CTOC_MAX_ENTRIES] for i in range(0, len(element_ids), _CTOC_MAX_ENTRIES)]
+        group_ids = [f"toc{index}" for index in range(len(groups))]
+        frames.append(_ctoc_frame("toc", group_ids, top_level=True, title=title))
+        for group_id, group in zip(group_ids, groups):
+            frames.append(_ctoc_frame(group_id, group, top_level=False))
+
+    body = b"".join(frames)
+    if total_size is None:
+        total_size = 10 + len(body) + max(64 * 1024, len(body))
+    padding = total_size - 10 - len(body)
+    if padding < 0:
+        return None
+
+    size = total_size - 10
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + body + b"\x00" * padding
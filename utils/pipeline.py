@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+
+# Marcador de fim de fluxo entre as etapas
+_END = object()
+
+
+class PipelineStage:
+    def __init__(self, name, func, workers=1, cancel=None):
+        self.name = name
+        self.func = func # Recebe o item e retorna o item para a próxima etapa (ou None em caso de falha)
+        self.workers = max(1, int(workers))
+        self.cancel = cancel # Opcional: interrompe o trabalho em andamento da etapa quando o pipeline é cancelado
+        self.busy_time = 0.0 # Tempo somado de processamento dos workers da etapa
+
+
+class PipelineEvent:
+    def __init__(self, stage, item, ok, result=None, error=None, elapsed=0.0):
+        self.stage = stage
+        self.item = item
+        self.ok = ok
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+
+# Executa itens por uma sequência de etapas ligadas por filas limitadas. Cada item
+# avança para a próxima etapa assim que termina a anterior, então etapas diferentes
+# trabalham em itens diferentes ao mesmo tempo. Os eventos de conclusão são
+# entregues ao callback na thread que chamou run().
+class StagePipeline:
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._remaining_workers = [stage.workers for stage in stages]
+
+    def cancel(self):
+        if self.cancelled.is_set():
+            return
+        self.cancelled.set()
+        for stage in self.stages:
+            if stage.cancel:
+                stage.cancel()
+
+    def run(self, items, on_event=None):
+        threads = [threading.Thread(target=self._feed, args=(list(items),), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(index,), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        start_time = time.monotonic()
+        finished = False
+        try:
+            while not finished:
+                try:
+                    event = self.events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if event is _END:
+                    finished = True
+                elif on_event:
+                    on_event(event)
+        finally:
+            # Saída antecipada (Ctrl+C ou erro no callback): as threads são avisadas, drenam as
+            # filas descartando os itens até o fim do fluxo e terminam antes de run() retornar
+            if not finished:
+                self.cancel()
+            for thread in threads:
+                thread.join()
+        return time.monotonic() - start_time
+
+    def _feed(self, items):
+        for item in items:
+            if self.cancelled.is_set():
+                break
+            self.queues[0].put(item)
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(_END)
+
+    def _work(self, index):
+        stage = self.stages[index]
+        input_queue = self.queues[index]
+        is_last = index == len(self.stages) - 1
+
+        while True:
+            item = input_queue.get()
+            if item is _END:
+                break
+            if self.cancelled.is_set():
+                continue # Descarta o item, mas continua drenando a fila até o fim do fluxo
+
+            start_time = time.monotonic()
+            try:
+                result = stage.func(item)
+                error = None
+            except Exception as e:
+                result = None
+                error = str(e)
+            elapsed = time.monotonic() - start_time
+            with self._lock:
+                stage.busy_time += elapsed
+
+            ok = bool(result) and not self.cancelled.is_set()
+            # O evento é publicado antes de o item seguir adiante, garantindo que os
+            # eventos de um mesmo item cheguem ao callback na ordem das etapas
+            self.events.put(PipelineEvent(stage.name, item, ok, result, error, elapsed))
+            if ok and not is_last:
+                self.queues[index + 1].put(result)
+
+        with self._lock:
+            self._remaining_workers[index] -= 1
+            last_worker = self._remaining_workers[index] == 0
+        if last_worker:
+            if is_last:
+                self.events.put(_END)
+            else:
+                for _ in range(self.stages[index + 1].workers):
+                    self.queues[index + 1].put(_END)
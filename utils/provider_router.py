@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Janela móvel de chamadas por provedor e mínimo de amostras para usar os percentis
+HEALTH_WINDOW = 50
+MIN_SAMPLES = 5
+# Provedor com taxa de erro acima disso na janela deixa de ser a primeira opção
+UNHEALTHY_ERROR_RATE = 0.5
+
+
+class ProviderHealth:
+    # Latências (só das chamadas bem-sucedidas) e resultados das últimas chamadas de um provedor
+    def __init__(self, window=HEALTH_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.outcomes.append(not error)
+            if not error:
+                self.latencies.append(latency)
+
+    def percentile(self, fraction):
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def error_rate(self):
+        with self._lock:
+            outcomes = list(self.outcomes)
+        if len(outcomes) < MIN_SAMPLES:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+
+class ProviderRouter:
+    # Escolhe a ordem dos provedores, faz failover em erros e, opcionalmente, dispara uma
+    # requisição duplicada (hedge) no próximo provedor quando a primeira passa do p95.
+    def __init__(self):
+        self.health = {}
+        self.stats = {'failovers': 0, 'hedges': 0, 'hedges_won': 0}
+        self._lock = threading.Lock()
+
+    def get_health(self, provider):
+        with self._lock:
+            return self.health.setdefault(provider, ProviderHealth())
+
+    def order(self, preferred, candidates):
+        # O provedor preferido vai primeiro enquanto estiver saudável; os demais por taxa de erro e p50
+        def score(provider):
+            health = self.get_health(provider)
+            p50 = health.percentile(0.5)
+            return (health.error_rate(), p50 if p50 is not None else float('inf'))
+
+        ordered = sorted((provider for provider in candidates if provider != preferred), key=score)
+        if preferred in candidates:
+            if self.get_health(preferred).error_rate() > UNHEALTHY_ERROR_RATE:
+                ordered.append(preferred)
+            else:
+                ordered.insert(0, preferred)
+        return ordered
+
+    def call(self, providers, func, hedge=False, on_failover=None):
+        # func(provider, is_last) executa a requisição; erros (ou resposta vazia) passam
+        # para o próximo provedor. Retorna (provedor, resultado) ou relança o último erro.
+        pending = list(providers)
+        last_error = None
+        while pending:
+            provider = pending.pop(0)
+            try:
+                if hedge and pending:
+                    return self._hedged_call(provider, pending, func)
+                return provider, self._timed(provider, func, not pending)
+            except Exception as e:
+                last_error = e
+                if pending:
+                    with self._lock:
+                        self.stats['failovers'] += 1
+                    if on_failover:
+                        on_failover(provider, pending[0], e)
+        raise last_error or RuntimeError("Nenhum provedor de IA disponível.")
+
+    def _timed(self, provider, func, is_last):
+        start_time = time.monotonic()
+        try:
+            result = func(provider, is_last)
+            if not result:
+                raise ValueError(f"Resposta vazia de {provider}")
+        except Exception:
+            self.get_health(provider).record(time.monotonic() - start_time, error=True)
+            raise
+        self.get_health(provider).record(time.monotonic() - start_time)
+        return result
+
+    def _hedged_call(self, provider, pending, func):
+        # A requisição perdedora não é cancelada (os SDKs não permitem): termina em segundo
+        # plano e só alimenta as estatísticas de latência
+        threshold = self.get_health(provider).percentile(0.95)
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = executor.submit(self._timed, provider, func, False)
+            if threshold is None:
+                return provider, primary.result()
+            done, _ = wait([primary], timeout=threshold)
+            if done:
+                return provider, primary.result()
+
+            backup_provider = pending[0]
+            with self._lock:
+                self.stats['hedges'] += 1
+            backup = executor.submit(self._timed, backup_provider, func, False)
+            futures = {primary: provider, backup: backup_provider}
+            while futures:
+                done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in done:
+                    winner = futures.pop(future)
+                    if future.exception() is None:
+                        if future is backup:
+                            pending.pop(0)
+                            with self._lock:
+                                self.stats['hedges_won'] += 1
+                        return winner, future.result()
+            # As duas falharam: o failover segue depois do provedor do hedge
+            pending.pop(0)
+            raise primary.exception()
+        finally:
+            executor.shutdown(wait=False)
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+            providers = list(self.health.items())
+        lines = []
+        for provider, health in providers:
+            if not health.outcomes:
+                continue
+            p50 = health.percentile(0.5)
+            p95 = health.percentile(0.95)
+            latency = f"p50 {p50:.1f}s, p95 {p95:.1f}s" if p50 is not None else "poucas amostras"
+            lines.append(f"    {provider}: {len(health.outcomes)} chamada(s), {latency}, {health.error_rate() * 100:.0f}% de erros")
+        if not lines:
+            return
+        print("  🧭 Provedores de IA:")
+        for line in lines:
+            print(line)
+        if stats['failovers'] or stats['hedges']:
+            print(f"    Failovers: {stats['failovers']}, requisições duplicadas (hedge): {stats['hedges']} ({stats['hedges_won']} vencedora(s))")
@@ -0,0 +1,218 @@
+import random
+import re
+import threading
+import time
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self._semaphore = threading.BoundedSemaphore(self.limit)
+
+    def acquire(self):
+        self._semaphore.acquire()
+
+    def release(self):
+        self._semaphore.release()
+
+    def request(self, tokens=0):
+        return self
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class TokenBucket:
+    # Balde de tokens reabastecido continuamente a cada minuto; capacidade 0 = ilimitado
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute or 0)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, amount):
+        # Corrige o saldo após a resposta (positivo consome, negativo devolve)
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - amount)
+
+    def limit_to(self, remaining):
+        # Sincroniza com o saldo informado pelo provedor quando ele é menor que o local
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.available = min(self.available, float(remaining))
+
+    def drain(self):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.available = min(self.available, 0.0)
+
+
+class ProviderRateLimiter:
+    # Combina limite de requisições simultâneas com orçamentos por minuto de
+    # requisições (RPM) e tokens (TPM) de um provedor
+    def __init__(self, max_concurrent, requests_per_minute=0, tokens_per_minute=0):
+        self.config = (max(1, int(max_concurrent)), int(requests_per_minute or 0), int(tokens_per_minute or 0))
+        self.concurrency = ConcurrencyLimiter(max_concurrent)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return self.concurrency.limit
+
+    def acquire(self, tokens=0):
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(min(wait, 1.0))
+        self.requests.acquire(1)
+        if tokens:
+            self.tokens.acquire(tokens)
+        self.concurrency.acquire()
+
+    def release(self):
+        self.concurrency.release()
+
+    def request(self, tokens=0):
+        return _LimiterSlot(self, tokens)
+
+    def record_usage(self, actual_tokens, estimated_tokens):
+        if actual_tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+        remaining_requests = _header_number(headers, 'x-ratelimit-remaining-requests', 'anthropic-ratelimit-requests-remaining')
+        remaining_tokens = _header_number(headers, 'x-ratelimit-remaining-tokens', 'anthropic-ratelimit-tokens-remaining')
+        if remaining_requests is not None:
+            self.requests.limit_to(remaining_requests)
+        if remaining_tokens is not None:
+            self.tokens.limit_to(remaining_tokens)
+
+    def penalize(self, delay):
+        # Rate limit recebido: pausa todas as chamadas do provedor, não só a que falhou
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.requests.drain()
+        self.tokens.drain()
+
+
+class _LimiterSlot:
+    def __init__(self, limiter, tokens):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def __enter__(self):
+        self.limiter.acquire(self.tokens)
+        return self.limiter
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter.release()
+        return False
+
+
+def _header_number(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def estimate_tokens(text):
+    # Aproximação de ~4 caracteres por token, suficiente para o orçamento de TPM
+    return max(1, len(text) // 4)
+
+
+# "429" como código HTTP numa mensagem de erro: "HTTP 429", "status 429", "429 Too Many Requests"
+RATE_LIMIT_STATUS = re.compile(r'(?:http|status|code|error)\W{0,3}429\b|\b429\W{0,3}(?:too many|resource exhausted)')
+
+
+def is_rate_limit_error(error):
+    # Status HTTP e tipo do erro decidem; a mensagem só é consultada para erros sem status
+    # (e aí "429" precisa aparecer como código HTTP, não como um número qualquer do texto)
+    status_code = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if type(error).__name__ in ('RateLimitError', 'ResourceExhausted', 'TooManyRequests'):
+        return True
+    if status_code is not None:
+        return status_code == 429
+    message = str(error).lower()
+    return 'rate limit' in message or 'too many requests' in message or bool(RATE_LIMIT_STATUS.search(message))
+
+
+def get_retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_backoff(func, limiter=None, tokens=0, max_retries=5, base_delay=2.0, max_delay=60.0, on_retry=None):
+    # Repete a chamada com backoff exponencial (com jitter) apenas em erros de rate limit.
+    # O slot do limiter é liberado durante a espera para não bloquear outras chamadas.
+    attempt = 0
+    while True:
+        try:
+            if limiter:
+                with limiter.request(tokens):
+                    return func()
+            return func()
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            if attempt >= max_retries:
+                # Sem nova tentativa aqui (ex.: failover para outro provedor), mas o provedor
+                # limitado continua desacelerado para as demais chamadas
+                if isinstance(limiter, ProviderRateLimiter):
+                    limiter.penalize(get_retry_after(e) or base_delay)
+                raise
+            delay = get_retry_after(e) or min(max_delay, base_delay * (2 ** attempt))
+            delay *= random.uniform(1.0, 1.25)
+            if isinstance(limiter, ProviderRateLimiter):
+                limiter.penalize(delay)
+            if on_retry:
+                on_retry(e, attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,75 @@
+from utils.rate_limiter import estimate_tokens
+
+# Separadores preferidos para cortar um trecho, do mais forte ao mais fraco
+_BREAKS = ["\n\n", "\n", ". ", "? ", "! ", " "]
+
+
+def split_by_tokens(text, max_tokens, overlap_tokens=0):
+    # Divide o texto em trechos de até max_tokens (estimativa de ~4 caracteres por token),
+    # cortando em parágrafo/frase quando possível. Cada trecho repete o final do anterior
+    # (overlap_tokens) para não perder contexto na emenda.
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    max_chars = max(1, max_tokens * 4)
+    overlap_chars = min(overlap_tokens * 4, max_chars // 4)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + max_chars)
+        if end < len(text):
+            end = _find_break(text, start + max_chars // 2, end)
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = _find_next_break(text, end - overlap_chars, end) if overlap_chars else end
+    return [chunk for chunk in chunks if chunk]
+
+
+def _find_break(text, lower, upper):
+    # Último separador dentro de [lower, upper); sem nenhum, corta em upper
+    for separator in _BREAKS:
+        position = text.rfind(separator, lower, upper)
+        if position != -1:
+            return position + len(separator)
+    return upper
+
+
+def _find_next_break(text, lower, upper):
+    # Primeiro separador a partir de lower, para o trecho seguinte começar numa frase inteira
+    for separator in _BREAKS:
+        position = text.find(separator, lower, upper)
+        if position != -1:
+            return position + len(separator)
+    return lower
+
+
+class MarkerStripper:
+    # Remove marcadores (ex.: [FIM]) de um texto recebido em pedaços, mesmo quando um
+    # marcador chega dividido entre dois pedaços: o final que pode ser início de marcador
+    # fica retido até o próximo pedaço. Os marcadores encontrados ficam em found.
+    def __init__(self, markers):
+        self.markers = markers
+        self.found = set()
+        self._pending = ""
+
+    def feed(self, text):
+        self._pending += text
+        for marker in self.markers:
+            if marker in self._pending:
+                self.found.add(marker)
+                self._pending = self._pending.replace(marker, "")
+        keep = 0
+        for marker in self.markers:
+            for size in range(len(marker) - 1, keep, -1):
+                if self._pending.endswith(marker[:size]):
+                    keep = size
+                    break
+        ready = self._pending[:len(self._pending) - keep]
+        self._pending = self._pending[len(ready):]
+        return ready
+
+    def flush(self):
+        remaining = self._pending
+        self._pending = ""
+        return remaining